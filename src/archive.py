@@ -0,0 +1,83 @@
+import argparse
+from datetime import datetime, timedelta
+import streamlit as st
+import cache
+from db import on_commit, submit_write
+from statements import define, execute, fetchall, Array
+
+# Archivo de items cerrados: los 'Comprado' / 'Rechazado' con más de N días pasan de
+# shopping_list_items a shopping_list_history, para que las consultas del día a día
+# (solicitudes, aprobación, compras) trabajen solo con los items vivos.
+# El historial y las estadísticas leen la vista shopping_list_all (ambas tablas).
+#   python src/archive.py [--days 90]
+
+ARCHIVE_AFTER_DAYS = 90   # se puede sobreescribir en st.secrets
+ARCHIVE_BATCH = 5000      # items por transacción (cada lote es una escritura aparte)
+
+# Cerrados antes del corte (fecha de compra, o de creación si no se compró). Sin COALESCE:
+# así cada rama del OR usa su índice, (status, shopping_date) y (status, created_at).
+CLOSED_ITEMS = define("archive.closed_items", '''
+    SELECT id FROM shopping_list_items
+    WHERE status IN ('Comprado', 'Rechazado')
+      AND (shopping_date < ? OR (shopping_date IS NULL AND created_at < ?))
+    ORDER BY id
+    LIMIT ?
+''')
+
+COPY_TO_HISTORY = define("archive.copy_to_history", '''
+    INSERT INTO shopping_list_history (id, product_id, requester_id, quantity_requested, quantity_approved,
+                                       status, price_real, shopping_date, created_at, archived_at)
+    SELECT id, product_id, requester_id, quantity_requested, quantity_approved,
+           status, price_real, shopping_date, created_at, datetime('now')
+    FROM shopping_list_items
+    WHERE id IN (SELECT value FROM json_each(?))
+''', postgres='''
+    INSERT INTO shopping_list_history (id, product_id, requester_id, quantity_requested, quantity_approved,
+                                       status, price_real, shopping_date, created_at, archived_at)
+    SELECT id, product_id, requester_id, quantity_requested, quantity_approved,
+           status, price_real, shopping_date, created_at, datetime('now')
+    FROM shopping_list_items
+    WHERE id = ANY(?)
+''')
+
+DELETE_ARCHIVED = define("archive.delete_archived",
+    "DELETE FROM shopping_list_items WHERE id IN (SELECT value FROM json_each(?))",
+    postgres="DELETE FROM shopping_list_items WHERE id = ANY(?)")
+
+def archive_after_days():
+    return int(st.secrets.get("ARCHIVE_AFTER_DAYS", ARCHIVE_AFTER_DAYS))
+
+def archive_batch(conn, cutoff, batch_size=ARCHIVE_BATCH):
+    # Un lote, dentro de la transacción de submit_write. Devuelve cuántos movió.
+    ids = [row['id'] for row in fetchall(conn, CLOSED_ITEMS, (cutoff, cutoff, batch_size))]
+    if ids:
+        execute(conn, COPY_TO_HISTORY, (Array(ids),)).close()
+        execute(conn, DELETE_ARCHIVED, (Array(ids),)).close()
+        on_commit(conn, cache.bump, "shopping_list_items", "shopping_list_history")
+    return len(ids)
+
+def archive_closed_items(days=None, batch_size=ARCHIVE_BATCH, log=print):
+    # Mueve los items cerrados más antiguos que 'days' días. Devuelve cuántos movió.
+    # Cada lote va al escritor único como un trabajo aparte: entre lotes pasan las demás escrituras.
+    days = archive_after_days() if days is None else days
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    moved = 0
+    while True:
+        count = submit_write(archive_batch, cutoff, batch_size)
+        moved += count
+        if count:
+            log(f"ARCHIVO: {moved} items movidos a shopping_list_history")
+        if count < batch_size:
+            break
+    return moved
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archiva los items cerrados antiguos")
+    parser.add_argument("--days", type=int, default=None,
+                        help=f"antigüedad mínima en días (por defecto ARCHIVE_AFTER_DAYS o {ARCHIVE_AFTER_DAYS})")
+    args = parser.parse_args(argv)
+    moved = archive_closed_items(args.days)
+    print(f"{moved} items archivados.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import types
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Benchmarks de los caminos calientes: consultas de las vistas, carrito, aprobación, compra
+# y la importación del catálogo, sobre datos generados (mock_data.generate) de tamaño creciente.
+#   python src/bench.py --sizes 10000,100000,1000000
+#   python src/bench.py --save-baseline      # guarda esta corrida como línea base
+# Cada corrida se compara con la línea base del mismo backend y marca las regresiones
+# (p50 más de REGRESSION_THRESHOLD peor). Sale con código 1 si hay alguna.
+#
+# Backend: el que tenga configurado la app. En local usa un SQLite propio (BENCH_DB_PATH),
+# nunca data/shopping_app.db. Para Postgres, DB_URL en .streamlit/secrets.toml apuntando a
+# un Postgres local de pruebas y --postgres: las tablas se VACÍAN en cada tamaño.
+
+BENCH_DB_PATH = os.path.join("data", "bench.db")
+RESULTS_DIR = os.path.join("data", "bench")
+DEFAULT_SIZES = [10000, 100000]
+REPEAT = 7                  # Mediciones por benchmark (más una de calentamiento, que no cuenta)
+LOADER_REPEAT = 3           # La importación es lenta: menos repeticiones
+REGRESSION_THRESHOLD = 0.2  # +20% en p50 respecto a la línea base
+NOISE_FLOOR_MS = 1.0        # Diferencias menores que esto no cuentan como regresión
+
+CART_SIZE = 300             # Productos en el carrito (un tercio actualiza, inserta y borra)
+REVIEW_SIZE = 500           # Solicitudes por aprobación (80% aprobadas, 20% rechazadas)
+CHECKOUT_SIZE = 500         # Items por compra (80% comprados, 20% postergados)
+
+RESET_TABLES = ["shopping_list_items", "shopping_list_history", "spend_monthly",
+                "applied_operations", "catalog_sync_state", "products"]
+
+def _clear_statements():
+    from statements import define
+    return [define(f"bench.clear_{table}", f"DELETE FROM {table}",
+                   postgres=f"TRUNCATE {table} RESTART IDENTITY CASCADE")
+            for table in RESET_TABLES]
+
+def _statements():
+    from statements import define
+    return types.SimpleNamespace(
+        max_item_id=define("bench.max_item_id", "SELECT COALESCE(MAX(id), 0) as id FROM shopping_list_items"),
+        new_items=define("bench.new_items",
+            "SELECT id, product_id FROM shopping_list_items WHERE id > ? AND status = ? ORDER BY id"),
+        clear_pending=define("bench.clear_pending", '''
+            DELETE FROM shopping_list_items
+            WHERE status = 'Pendiente' AND product_id IN (SELECT value FROM json_each(?))
+        ''', postgres='''
+            DELETE FROM shopping_list_items WHERE status = 'Pendiente' AND product_id = ANY(?)
+        '''),
+        active_products=define("bench.active_products",
+            "SELECT id, name, category, uom FROM products WHERE active = 1 ORDER BY id"),
+    )
+
+# --- Medición ---
+
+def measure(name, fn, setup=None, repeat=REPEAT, warmup=1):
+    # fn(preparado) devuelve cuántas filas procesó; setup() prepara cada llamada sin contar tiempo
+    times, rows = [], 0
+    for i in range(warmup + repeat):
+        prepared = setup() if setup is not None else None
+        start = time.perf_counter()
+        n = fn(prepared)
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            times.append(elapsed)
+            rows += n or 0
+    total = sum(times)
+    ms = np.array(times) * 1000
+    return {
+        "name": name,
+        "runs": len(times),
+        "rows": rows // len(times),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "min_ms": round(float(ms.min()), 3),
+        "ops_per_s": round(len(times) / total, 2) if total else None,
+        "rows_per_s": round(rows / total, 1) if total else None,
+    }
+
+# --- Benchmarks ---
+
+def bench_queries(conn, rng, repeat):
+    import cache
+    import history
+    from rollups import SPEND_MONTHLY
+    from search import search_products
+    from statements import fetchall, read_frame
+    from ui.admin import PENDING
+    from ui.buyer import SHOPPING_LIST
+    from ui.requester import CATALOG, CATEGORIES
+
+    categories = [row['category'] for row in fetchall(conn, CATEGORIES)]
+    category = categories[int(rng.integers(len(categories)))] if categories else None
+
+    def frame(stmt, params=()):
+        return lambda _: len(read_frame(conn, stmt, params))
+
+    def page(**filters):
+        return lambda _: len(history.fetch_page(conn, **filters)[0])
+
+    yield measure("query.catalog", frame(CATALOG, (None, None)), repeat=repeat)
+    yield measure("query.catalog_category", frame(CATALOG, (category, category)), repeat=repeat)
+    yield measure("query.categories", lambda _: len(fetchall(conn, CATEGORIES)), repeat=repeat)
+    # Las búsquedas e historial pasan por la caché: se vacía antes de cada llamada
+    yield measure("query.search", lambda _: len(search_products(conn, "le")), setup=cache.clear, repeat=repeat)
+    yield measure("query.pending", frame(PENDING), repeat=repeat)
+    yield measure("query.buyer", frame(SHOPPING_LIST), repeat=repeat)
+    yield measure("query.spend_monthly", frame(SPEND_MONTHLY), repeat=repeat)
+    yield measure("query.history_page", page(), setup=cache.clear, repeat=repeat)
+    yield measure("query.history_filtered", page(category=category, product="a"), setup=cache.clear, repeat=repeat)
+    yield measure("cache.catalog_hit", lambda _: len(cache.cached_frame(
+        conn, CATALOG, (None, None), tables=("products", "shopping_list_items"))), repeat=repeat)
+
+def bench_cart(conn, rng, stmts, requester_id, repeat):
+    from db import submit_write, transaction
+    from statements import execute, executemany, fetchall, read_frame, Array
+    from ui.requester import CATALOG, INSERT_PENDING, apply_cart, diff_cart, empty_cart, save_cart
+
+    df_db = read_frame(conn, CATALOG, (None, None)).set_index('id')
+    df_db['Solicitado'] = pd.to_numeric(df_db['Solicitado'], errors='coerce').fillna(0.0)
+
+    # Cambios en el ~5% de las filas, como una sesión que edita la tabla
+    edited = df_db.copy()
+    touched = rng.choice(len(edited), size=max(1, len(edited) // 20), replace=False)
+    edited.iloc[touched, edited.columns.get_loc('Solicitado')] += rng.integers(1, 4, size=len(touched))
+    cart = diff_cart(df_db, edited, empty_cart())
+
+    def diff(_):
+        diff_cart(df_db, edited, empty_cart())
+        return len(df_db)   # filas comparadas
+
+    yield measure("cart.diff", diff, repeat=repeat)
+    yield measure("cart.apply", lambda _: len(apply_cart(df_db, cart)), repeat=repeat)
+
+    # Un tercio de los productos ya tiene pendiente (se actualiza), otro no (se inserta)
+    # y el último lo tiene y se pone en 0 (se borra)
+    ids = rng.choice(df_db.index.to_numpy(), size=min(CART_SIZE, len(df_db)), replace=False).tolist()
+    update, insert, delete = ids[0::3], ids[1::3], ids[2::3]
+    save = pd.Series({**{pid: 2.0 for pid in update}, **{pid: 1.0 for pid in insert},
+                      **{pid: 0.0 for pid in delete}}, dtype="float64", name="Solicitado")
+
+    def setup():
+        with transaction(conn):
+            execute(conn, stmts.clear_pending, (Array(ids),)).close()
+            executemany(conn, INSERT_PENDING, [(pid, requester_id, 1.0) for pid in update + delete])
+
+    yield measure("cart.save", lambda _: submit_write(save_cart, save, requester_id), setup=setup, repeat=repeat)
+
+def bench_review(conn, rng, stmts, requester_id, repeat):
+    from db import submit_write, transaction
+    from statements import executemany, fetchall, fetchone
+    from ui.admin import apply_review
+    from ui.requester import INSERT_PENDING
+
+    product_ids = [row['id'] for row in fetchall(conn, stmts.active_products)]
+
+    def setup():
+        # REVIEW_SIZE solicitudes nuevas: 80% se aprueban, el resto se rechaza
+        with transaction(conn):
+            last = fetchone(conn, stmts.max_item_id)['id']
+            picks = rng.choice(product_ids, size=REVIEW_SIZE).tolist()
+            executemany(conn, INSERT_PENDING, [(pid, requester_id, 1.0) for pid in picks])
+        ids = [row['id'] for row in fetchall(conn, stmts.new_items, (last, 'Pendiente'))]
+        cut = int(len(ids) * 0.8)
+        return [(item_id, 2.0) for item_id in ids[:cut]], ids[cut:]
+
+    yield measure("admin.apply_review", lambda args: sum(submit_write(apply_review, *args)), setup=setup, repeat=repeat)
+
+def bench_checkout(conn, rng, stmts, requester_id, repeat):
+    from db import submit_write, transaction
+    from mock_data import INSERT_MOCK_ITEM
+    from statements import executemany, fetchall, fetchone
+    from ui.buyer import commit_purchase
+
+    product_ids = [row['id'] for row in fetchall(conn, stmts.active_products)]
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def setup():
+        # CHECKOUT_SIZE items aprobados: 80% se compran, el resto se posterga
+        with transaction(conn):
+            last = fetchone(conn, stmts.max_item_id)['id']
+            picks = rng.choice(product_ids, size=CHECKOUT_SIZE).tolist()
+            executemany(conn, INSERT_MOCK_ITEM,
+                        [(pid, requester_id, 1.0, 1.0, 'Aprobado', None, None, now) for pid in picks])
+        rows = fetchall(conn, stmts.new_items, (last, 'Aprobado'))
+        cut = int(len(rows) * 0.8)
+        bought = [(row['id'], round(float(rng.uniform(1, 30)), 2), 1.0) for row in rows[:cut]]
+        prices = list({row['product_id']: (row['product_id'], price)
+                       for row, (_, price, _) in zip(rows, bought)}.values())
+        return bought, prices, [row['id'] for row in rows[cut:]]
+
+    yield measure("buyer.commit_purchase", lambda args: submit_write(commit_purchase, *args), setup=setup, repeat=repeat)
+
+def _write_fixtures(conn, stmts, rows, workdir):
+    # Catálogo actual + productos extra hasta 'rows' filas, en CSV y XLSX. Dos versiones
+    # que difieren en ~10% de las unidades: se alterna entre ellas para que cada
+    # importación tenga cambios que escribir.
+    from statements import fetchall
+    current = pd.DataFrame([dict(row) for row in fetchall(conn, stmts.active_products)])
+    extra = max(rows - len(current), 0)
+    sheet = pd.DataFrame({
+        "Producto": current['name'].tolist() + [f"Producto bench {i}" for i in range(extra)],
+        "Categoría": current['category'].tolist() + ["Bench"] * extra,
+        "Unidad": current['uom'].tolist() + ["Unidad"] * extra,
+    })
+    changed = sheet.copy()
+    changed.loc[changed.index % 10 == 0, "Unidad"] = "Caja"
+    paths = {"csv": [], "xlsx": []}
+    for i, version in enumerate((sheet, changed)):
+        path = os.path.join(workdir, f"catalogo-{i}")
+        version.to_csv(path + ".csv", index=False, encoding="utf-8")
+        version.to_excel(path + ".xlsx", index=False)
+        paths["csv"].append(path + ".csv")
+        paths["xlsx"].append(path + ".xlsx")
+    return paths, len(sheet)
+
+def bench_loader(conn, stmts, catalog_rows, workdir, repeat):
+    import loader
+    paths, total = _write_fixtures(conn, stmts, catalog_rows, workdir)
+    turn = {"i": 0}
+
+    def next_fixture(kind):
+        turn["i"] += 1
+        return paths[kind][turn["i"] % 2]
+
+    def local_download(path):
+        # En lugar de Google Sheets, el CSV local (mismo camino: tempfile + hash + chunks)
+        def download(url, headers):
+            return open(path, "rb"), loader._file_hash(path), types.SimpleNamespace(headers={})
+        return download
+
+    def load_csv(path):
+        loader._download_to_tempfile = local_download(path)
+        return loader.load_products_from_excel(force=True, log=lambda msg: None)['rows']
+
+    def load_xlsx(path):
+        loader.EXCEL_PATH = path
+        return loader.load_products_from_excel(force=True, log=lambda msg: None)['rows']
+
+    saved = (loader.SHEET_URL, loader.EXCEL_PATH, loader._download_to_tempfile)
+    try:
+        loader.SHEET_URL = "https://docs.google.com/bench.csv"
+        yield measure("loader.csv", load_csv, setup=lambda: next_fixture("csv"), repeat=repeat)
+        loader.SHEET_URL = ""
+        yield measure("loader.xlsx", load_xlsx, setup=lambda: next_fixture("xlsx"), repeat=repeat)
+    finally:
+        loader.SHEET_URL, loader.EXCEL_PATH, loader._download_to_tempfile = saved
+
+# --- Corrida ---
+
+def reset_data(conn):
+    import cache
+    from db import transaction
+    from statements import execute
+    with transaction(conn):
+        for stmt in _clear_statements():
+            execute(conn, stmt).close()
+    cache.clear()
+
+def run_size(items, seed, repeat, workdir, log=print):
+    import mock_data
+    from db import get_connection
+    from statements import fetchall
+    rng = np.random.default_rng(seed)
+    stmts = _statements()
+    conn = get_connection()
+    try:
+        reset_data(conn)
+        products = max(300, items // 200)
+        start = time.perf_counter()
+        info = mock_data.generate(products=products, items=items, seed=seed, batch=20000,
+                                  conn=conn, log=lambda msg: None)
+        seconds = time.perf_counter() - start
+        log(f"BENCH: {items} items / {info['products']} productos generados en "
+            f"{seconds:.1f}s ({items / max(seconds, 1e-9):.0f} filas/s)")
+        # Un solicitante de prueba (demoN, el último creado) para lo que se escribe
+        requester_id = fetchall(conn, mock_data.USER_IDS)[-1]['id']
+
+        # Primero lecturas (no dependen del orden), luego escrituras y al final la importación
+        groups = [
+            bench_queries(conn, rng, repeat),
+            bench_cart(conn, rng, stmts, requester_id, repeat),
+            bench_review(conn, rng, stmts, requester_id, repeat),
+            bench_checkout(conn, rng, stmts, requester_id, repeat),
+            bench_loader(conn, stmts, max(5000, items // 20), workdir, min(repeat, LOADER_REPEAT)),
+        ]
+        results = []
+        for group in groups:
+            for result in group:
+                result["size"] = items
+                results.append(result)
+                log(f"  {result['name']:<24} p50 {result['p50_ms']:>9.2f} ms | p95 {result['p95_ms']:>9.2f} ms"
+                    f" | {result['rows_per_s'] or 0:>11.0f} filas/s")
+        return results
+    finally:
+        conn.close()
+
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    # Añade a cada resultado su cambio contra la línea base; devuelve las regresiones
+    base = {(r['name'], r['size']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = base.get((result['name'], result['size']))
+        if before is None or not before['p50_ms']:
+            continue
+        change = result['p50_ms'] / before['p50_ms'] - 1
+        result['baseline_p50_ms'] = before['p50_ms']
+        result['change'] = round(change, 3)
+        if change > threshold and result['p50_ms'] - before['p50_ms'] > NOISE_FLOOR_MS:
+            regressions.append(result)
+    return regressions
+
+def report(results, regressions):
+    df = pd.DataFrame(results)
+    columns = ['size', 'name', 'rows', 'p50_ms', 'p95_ms', 'rows_per_s']
+    if 'change' in df.columns:
+        df['vs_base'] = df['change'].map(lambda c: "" if pd.isna(c) else f"{c:+.0%}")
+        df['flag'] = ["REGRESIÓN" if r in regressions else "" for r in results]
+        columns += ['vs_base', 'flag']
+    print(df[columns].to_string(index=False))
+
+def _check_postgres(allowed):
+    # Los datos se borran: solo contra un Postgres local y pidiéndolo explícitamente
+    import streamlit as st
+    from psycopg2.extensions import parse_dsn
+    host = parse_dsn(st.secrets["DB_URL"]).get("host") or ""
+    local = host in ("", "localhost", "127.0.0.1", "::1") or host.startswith("/")
+    if not allowed or not local:
+        sys.exit(f"DB_URL apunta a Postgres ({host or 'socket local'}). El benchmark vacía las tablas: "
+                 f"úsalo solo con un Postgres local de pruebas y --postgres.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de consultas, carrito, aprobación, compra e importación.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="items generados por corrida, separados por comas")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="JSON de resultados (por defecto data/bench/latest-<backend>.json)")
+    parser.add_argument("--baseline", help="JSON de línea base (por defecto data/bench/baseline-<backend>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="guardar esta corrida como línea base")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--postgres", action="store_true", help="permitir correr (y vaciar) el Postgres de DB_URL")
+    args = parser.parse_args(argv)
+
+    import db
+    backend = "postgres" if db.is_cloud_db() else "sqlite"
+    if backend == "postgres":
+        _check_postgres(args.postgres)
+    else:
+        db.DB_PATH = BENCH_DB_PATH
+    from startup import ensure_initialized
+    ensure_initialized()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out = args.out or os.path.join(RESULTS_DIR, f"latest-{backend}.json")
+    baseline_path = args.baseline or os.path.join(RESULTS_DIR, f"baseline-{backend}.json")
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    results = []
+    for items in sizes:
+        print(f"BENCH [{backend}] {items} items")
+        results += run_size(items, args.seed, args.repeat, RESULTS_DIR)
+
+    regressions = []
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    data = {
+        "meta": {"ts": time.time(), "backend": backend, "sizes": sizes, "seed": args.seed,
+                 "repeat": args.repeat, "git": _git_revision(), "python": platform.python_version(),
+                 "platform": platform.platform()},
+        "results": results,
+    }
+    for path in [out] + ([baseline_path] if args.save_baseline else []):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    print()
+    report(results, regressions)
+    print(f"\nResultados en {out}" + (f" (y como línea base en {baseline_path})" if args.save_baseline else ""))
+    if regressions:
+        print(f"{len(regressions)} regresión(es) de más de {args.threshold:.0%} en p50 frente a {baseline_path}.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
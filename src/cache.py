@@ -0,0 +1,105 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from statements import Array, dialect_of, fetchall, read_frame, _plain
+
+# Caché de lecturas compartida por todas las sesiones del proceso.
+# Cada entrada depende de unas tablas; cualquier escritura en esas tablas debe llamar
+# a bump(tabla) y las entradas afectadas dejan de servirse. LRU con tope de memoria.
+
+MAX_BYTES = 64 * 1024 * 1024
+MAX_ENTRIES = 256
+# Por si escribe otro proceso (p.ej. el loader desde la consola), nada vive más de esto
+MAX_AGE = 300
+
+_lock = threading.Lock()
+_versions = {}               # tabla -> contador de escrituras
+_entries = OrderedDict()     # clave -> (valor, bytes, tablas, creado)
+_bytes = 0
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+def _freeze(value):
+    if isinstance(value, Array):
+        return ("array",) + tuple(value.values)
+    return _plain(value)
+
+def _drop(key):
+    # Llamar con el lock tomado
+    global _bytes
+    value, nbytes, tables, created = _entries.pop(key)
+    _bytes -= nbytes
+
+def bump(*tables):
+    # Registrar una escritura: invalida lo cacheado que lea esas tablas
+    with _lock:
+        for table in tables:
+            _versions[table] = _versions.get(table, 0) + 1
+        stale = [key for key, entry in _entries.items() if set(entry[2]) & set(tables)]
+        for key in stale:
+            _drop(key)
+        _stats["invalidations"] += len(stale)
+
+def clear():
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _bytes = 0
+
+def _key(kind, conn, stmt, params, tables):
+    versions = tuple((t, _versions.get(t, 0)) for t in tables)
+    return (kind, stmt.name, dialect_of(conn), tuple(_freeze(p) for p in params), versions)
+
+def _get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and time.monotonic() - entry[3] > MAX_AGE:
+            _drop(key)
+            entry = None
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return entry[0]
+
+def _put(key, value, nbytes, tables):
+    global _bytes
+    if nbytes > MAX_BYTES:
+        return
+    with _lock:
+        if key in _entries:
+            _drop(key)
+        _entries[key] = (value, nbytes, tables, time.monotonic())
+        _bytes += nbytes
+        while _entries and (_bytes > MAX_BYTES or len(_entries) > MAX_ENTRIES):
+            _drop(next(iter(_entries)))
+            _stats["evictions"] += 1
+
+def cached_frame(conn, stmt, params=(), tables=()):
+    # Igual que statements.read_frame, pero compartido entre sesiones.
+    # Devuelve siempre una copia: las vistas modifican sus DataFrames.
+    key = _key("frame", conn, stmt, params, tables)
+    frame = _get(key)
+    if frame is None:
+        frame = read_frame(conn, stmt, params)
+        _put(key, frame.copy(), int(frame.memory_usage(deep=True).sum()), tables)
+    return frame.copy()
+
+def cached_rows(conn, stmt, params=(), tables=()):
+    # Igual que statements.fetchall, con las filas como dicts
+    key = _key("rows", conn, stmt, params, tables)
+    rows = _get(key)
+    if rows is None:
+        rows = [dict(row) for row in fetchall(conn, stmt, params)]
+        nbytes = sys.getsizeof(rows) + sum(sys.getsizeof(r) for r in rows)
+        _put(key, rows, nbytes, tables)
+    return [dict(row) for row in rows]
+
+def cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats.update({"entries": len(_entries), "bytes": _bytes})
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
@@ -1,135 +1,600 @@
-import sqlite3
-import os
-import streamlit as st
-import psycopg2
-from psycopg2.extras import DictCursor
-from datetime import datetime
-
-# DB CONFIG
-DB_PATH = os.path.join("data", "shopping_app.db")
-
-# Detect Cloud vs Local
-def is_cloud_db():
-    return "DB_URL" in st.secrets
-
-def get_connection():
-    if is_cloud_db():
-        # Postgres Connection (Cloud)
-        # Usamos DictCursor para que Pandas entienda que son filas de datos
-        conn = psycopg2.connect(st.secrets["DB_URL"], cursor_factory=DictCursor)
-        return PostgresConnectionWrapper(conn)
-    else:
-        # Local SQLite Connection
-        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        return conn
-
-# Wrapper to mimic SQLite behavior on top of Postgres
-class PostgresConnectionWrapper:
-    def __init__(self, conn):
-        self.conn = conn
-
-    def cursor(self):
-        return PostgresCursorWrapper(self.conn.cursor())
-
-    def commit(self):
-        self.conn.commit()
-
-    def close(self):
-        self.conn.close()
-        
-    def execute(self, sql, params=None):
-        cur = self.cursor()
-        cur.execute(sql, params)
-        return cur
-
-class PostgresCursorWrapper:
-    def __init__(self, cursor):
-        self.cursor = cursor
-        
-    def execute(self, sql, params=None):
-        # Translate '?' to '%s'
-        sql = sql.replace("?", "%s")
-        # Translate 'datetime('now')' to 'NOW()'
-        sql = sql.replace("datetime('now')", "NOW()")
-        # Handle 'INTEGER PRIMARY KEY AUTOINCREMENT' (for init script)
-        sql = sql.replace("INTEGER PRIMARY KEY AUTOINCREMENT", "SERIAL PRIMARY KEY")
-        
-        try:
-            if params:
-                self.cursor.execute(sql, params)
-            else:
-                self.cursor.execute(sql)
-        except Exception as e:
-            print(f"Error executing SQL: {sql} | Params: {params}")
-            raise e
-            
-    def fetchone(self):
-        return self.cursor.fetchone()
-        
-    def fetchall(self):
-        return self.cursor.fetchall()
-        
-    @property
-    def rowcount(self):
-        return self.cursor.rowcount
-
-    @property
-    def description(self):
-        # Necesario para que Pandas lea las columnas
-        return self.cursor.description
-
-    def close(self):
-        self.cursor.close()
-
-def init_db():
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # Usuarios
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            role TEXT NOT NULL
-        )
-    ''')
-    
-    # Productos (Inventario Maestro)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            category TEXT,
-            uom TEXT,
-            brand TEXT,
-            image_path TEXT,
-            last_price_estimate REAL DEFAULT 0.0
-        )
-    ''')
-    
-    # Items de Lista de Compras
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS shopping_list_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER NOT NULL,
-            requester_id INTEGER,
-            quantity_requested REAL DEFAULT 1,
-            quantity_approved REAL,
-            status TEXT DEFAULT 'Pendiente', -- Pendiente, Aprobado, Comprado, Postergado
-            price_real REAL,
-            shopping_date TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (product_id) REFERENCES products (id),
-            FOREIGN KEY (requester_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-if __name__ == "__main__":
-    init_db()
-    print("Base de datos inicializada (Modo Nube: " + str(is_cloud_db()) + ")")
+import contextvars
+import sqlite3
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from contextlib import contextmanager
+import streamlit as st
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extras import DictCursor, execute_values
+from datetime import datetime
+from querylog import QueryTimer
+from statements import POSTGRES, SQLITE
+
+# DB CONFIG
+DB_PATH = os.path.join("data", "shopping_app.db")
+
+# POOL CONFIG (se pueden sobreescribir en st.secrets)
+POOL_MAX_SIZE = 5           # Conexiones simultáneas a Postgres como máximo
+POOL_WAIT_TIMEOUT = 10      # Segundos esperando una conexión libre antes de fallar
+POOL_IDLE_TIMEOUT = 300     # Conexiones ociosas más de esto se cierran
+POOL_HEALTHCHECK_AFTER = 30 # Si estuvo ociosa más de esto, hacemos ping antes de entregarla
+
+# SQLITE CONFIG (modo local, varias sesiones a la vez)
+SQLITE_BUSY_TIMEOUT = 15    # Segundos esperando el lock antes de "database is locked"
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",     # lectores y escritor no se bloquean entre sí
+    "PRAGMA synchronous=NORMAL",   # seguro con WAL; fsync solo en checkpoint
+    "PRAGMA cache_size=-20000",    # ~20 MB de caché de páginas por conexión
+    "PRAGMA temp_store=MEMORY",
+]
+WRITER_MAX_BATCH = 64       # Escrituras confirmadas juntas en un solo COMMIT como máximo
+WRITER_TIMEOUT = 30         # Segundos que una sesión espera a que se aplique su escritura
+
+# Detect Cloud vs Local
+def is_cloud_db():
+    return "DB_URL" in st.secrets
+
+def get_connection():
+    if is_cloud_db():
+        # Postgres Connection (Cloud) - reutilizada desde el pool del proceso
+        pool = get_postgres_pool()
+        return PostgresConnectionWrapper(pool.acquire(), pool)
+    else:
+        # Local SQLite Connection - una conexión persistente por hilo
+        return get_sqlite_connection()
+
+class PoolExhaustedError(RuntimeError):
+    pass
+
+class PostgresPool:
+    """Pool acotado de conexiones psycopg2 compartido por todas las sesiones."""
+
+    def __init__(self, dsn, max_size=POOL_MAX_SIZE, wait_timeout=POOL_WAIT_TIMEOUT,
+                 idle_timeout=POOL_IDLE_TIMEOUT, healthcheck_after=POOL_HEALTHCHECK_AFTER):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self.idle_timeout = idle_timeout
+        self.healthcheck_after = healthcheck_after
+        self._idle = []          # [(conn, last_used)] - LIFO para reusar las más recientes
+        self._in_use = {}        # id(conn) -> (conn, weakref al wrapper)
+        self._cond = threading.Condition()
+        self.stats = {"checkouts": 0, "waits": 0, "creates": 0,
+                      "reconnects": 0, "evictions": 0, "discards": 0}
+
+    def _connect(self):
+        # Usamos DictCursor para que Pandas entienda que son filas de datos
+        conn = psycopg2.connect(self.dsn, cursor_factory=DictCursor)
+        with self._cond:
+            self.stats["creates"] += 1
+        return conn
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.healthcheck_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle(self):
+        # Llamar con el lock tomado. Devuelve las conexiones a cerrar.
+        now = time.monotonic()
+        expired = [conn for conn, last_used in self._idle if now - last_used > self.idle_timeout]
+        if expired:
+            self._idle = [(c, t) for c, t in self._idle if now - t <= self.idle_timeout]
+            self.stats["evictions"] += len(expired)
+        return expired
+
+    def _reclaim_orphans(self):
+        # Conexiones cuyo wrapper ya fue recolectado sin llamar a close() (p.ej. una
+        # vista que lanzó excepción). Se descartan para liberar su cupo.
+        orphans = [conn for conn, owner in self._in_use.values() if owner is not None and owner() is None]
+        for conn in orphans:
+            del self._in_use[id(conn)]
+            self.stats["discards"] += 1
+        return orphans
+
+    def acquire(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self.stats["checkouts"] += 1
+            to_close = self._evict_idle()
+            waited = False
+            while not self._idle and len(self._in_use) >= self.max_size:
+                to_close += self._reclaim_orphans()
+                if len(self._in_use) < self.max_size:
+                    break
+                if not waited:
+                    self.stats["waits"] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhaustedError(
+                        f"No hay conexiones libres en el pool ({self.max_size}) tras {self.wait_timeout}s")
+                self._cond.wait(remaining)
+            item = self._idle.pop() if self._idle else None
+            # Reservamos el cupo antes de conectar (fuera del lock)
+            placeholder = object()
+            self._in_use[id(placeholder)] = (placeholder, None)
+
+        for conn in to_close:
+            _close_quietly(conn)
+
+        try:
+            conn = None
+            if item:
+                conn, last_used = item
+                if not self._is_healthy(conn, last_used):
+                    _close_quietly(conn)
+                    conn = None
+                    with self._cond:
+                        self.stats["reconnects"] += 1
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                del self._in_use[id(placeholder)]
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            del self._in_use[id(placeholder)]
+            self._in_use[id(conn)] = (conn, None)
+        return conn
+
+    def attach(self, conn, owner):
+        with self._cond:
+            if id(conn) in self._in_use:
+                self._in_use[id(conn)] = (conn, weakref.ref(owner))
+
+    def release(self, conn, broken=False):
+        if not broken and not conn.closed:
+            try:
+                # Descartar cualquier transacción que haya quedado abierta
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken or conn.closed:
+            _close_quietly(conn)
+        with self._cond:
+            if self._in_use.pop(id(conn), None) is None:
+                return
+            if broken or conn.closed:
+                self.stats["discards"] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats.update({"in_use": len(self._in_use), "idle": len(self._idle), "max_size": self.max_size})
+        return stats
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+_pg_pool = None
+_pg_pool_lock = threading.Lock()
+
+def get_postgres_pool():
+    global _pg_pool
+    if _pg_pool is None:
+        with _pg_pool_lock:
+            if _pg_pool is None:
+                _pg_pool = PostgresPool(
+                    st.secrets["DB_URL"],
+                    max_size=int(st.secrets.get("DB_POOL_MAX_SIZE", POOL_MAX_SIZE)),
+                    wait_timeout=float(st.secrets.get("DB_POOL_WAIT_TIMEOUT", POOL_WAIT_TIMEOUT)),
+                    idle_timeout=float(st.secrets.get("DB_POOL_IDLE_TIMEOUT", POOL_IDLE_TIMEOUT)),
+                )
+    return _pg_pool
+
+# SQLite local: una conexión persistente por hilo (sqlite3 no comparte bien entre hilos)
+class SQLiteCursor(sqlite3.Cursor):
+    # Mide cada sentencia (execute + fetch) para querylog.py
+    _timer = None
+
+    def _finish(self):
+        if self._timer is not None:
+            self._timer.finish()
+            self._timer = None
+
+    def _run(self, method, sql, params):
+        self._finish()
+        timer = self._timer = QueryTimer(sql, params, self.connection)
+        start = time.perf_counter()
+        try:
+            method(self, sql, params)
+        except Exception as e:
+            timer.error = str(e)
+            timer.add(time.perf_counter() - start)
+            self._finish()
+            raise
+        # Sin resultado (INSERT/UPDATE/DELETE): filas afectadas. Con resultado: se cuentan al leer.
+        timer.add(time.perf_counter() - start, max(self.rowcount, 0) if self.description is None else 0)
+        return self
+
+    def execute(self, sql, params=()):
+        return self._run(sqlite3.Cursor.execute, sql, params)
+
+    def executemany(self, sql, rows):
+        return self._run(sqlite3.Cursor.executemany, sql, rows)
+
+    def _fetched(self, start, rows, exhausted):
+        if self._timer is not None:
+            self._timer.add(time.perf_counter() - start, rows)
+            if exhausted:
+                self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+class SQLiteConnection(sqlite3.Connection):
+    dialect = SQLITE
+    # El hilo escritor agrupa varias escrituras en una transacción (ver submit_write)
+    group_commit = False
+    pending_callbacks = None
+
+    def cursor(self, factory=SQLiteCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def close(self):
+        # La conexión se reutiliza: close() solo descarta lo no confirmado
+        if self.in_transaction:
+            self.rollback()
+
+_sqlite_local = threading.local()
+_sqlite_stats = {"checkouts": 0, "creates": 0, "reconnects": 0}
+_sqlite_stats_lock = threading.Lock()
+
+def get_sqlite_connection():
+    conn = getattr(_sqlite_local, "conn", None)
+    if conn is not None:
+        try:
+            conn.execute("SELECT 1")
+        except sqlite3.Error:
+            # Conexión inutilizable (cerrada o archivo reemplazado): reconectar
+            _count_sqlite("reconnects")
+            conn = None
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False,
+                               factory=SQLiteConnection)
+        conn.row_factory = sqlite3.Row
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        _sqlite_local.conn = conn
+        _count_sqlite("creates")
+    _count_sqlite("checkouts")
+    return conn
+
+def _count_sqlite(key):
+    with _sqlite_stats_lock:
+        _sqlite_stats[key] += 1
+
+# Escrituras locales: un solo hilo escritor las aplica en orden y confirma varias
+# juntas (group commit). Cada una corre en su SAVEPOINT: si falla, solo se deshace esa.
+_write_queue = queue.Queue()
+_writer_thread = None
+_writer_lock = threading.Lock()
+_writer_stats = {"jobs": 0, "errors": 0, "commits": 0, "max_batch": 0, "wait_seconds": 0.0,
+                 "busy_seconds": 0.0, "started_at": None}
+
+def submit_write(fn, *args, timeout=WRITER_TIMEOUT):
+    # Ejecuta fn(conn, *args) en una transacción y devuelve su resultado (o relanza su error).
+    # Local: en el hilo escritor. Postgres: directamente con una conexión del pool.
+    if is_cloud_db():
+        conn = get_connection()
+        try:
+            with transaction(conn):
+                return fn(conn, *args)
+        finally:
+            conn.close()
+    _ensure_writer()
+    future = Future()
+    # El contexto de quien escribe (vista de querylog, recarga del profiler) viaja con el
+    # trabajo: así las sentencias del hilo escritor se atribuyen a la sesión que las pidió
+    _write_queue.put((fn, args, future, time.perf_counter(), contextvars.copy_context()))
+    return future.result(timeout)
+
+def on_commit(conn, fn, *args):
+    # Ejecuta fn(*args) cuando lo escrito en conn ya está confirmado
+    # (p.ej. invalidar la caché: antes, otra sesión podría cachear datos viejos)
+    if getattr(conn, "pending_callbacks", None) is not None:
+        conn.pending_callbacks.append((fn, args))
+    else:
+        fn(*args)
+
+def _ensure_writer():
+    global _writer_thread
+    if _writer_thread is not None and _writer_thread.is_alive():
+        return
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_stats["started_at"] = time.time()
+            _writer_thread = threading.Thread(target=_writer_loop, name="sqlite-writer", daemon=True)
+            _writer_thread.start()
+
+def _writer_loop():
+    while True:
+        jobs = [_write_queue.get()]
+        while len(jobs) < WRITER_MAX_BATCH:
+            try:
+                jobs.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        _run_write_group(jobs)
+
+def _run_write_group(jobs):
+    start = time.perf_counter()
+    conn = get_sqlite_connection()
+    done = []
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.group_commit = True
+        for fn, args, future, queued, context in jobs:
+            conn.pending_callbacks = []
+            conn.execute("SAVEPOINT write_job")
+            try:
+                result = context.run(fn, conn, *args)
+            except Exception as e:
+                conn.execute("ROLLBACK TO write_job")
+                conn.execute("RELEASE write_job")
+                done.append((future, None, e, []))
+            else:
+                conn.execute("RELEASE write_job")
+                done.append((future, result, None, conn.pending_callbacks))
+        conn.commit()
+    except Exception as e:
+        # Falló el BEGIN o el COMMIT: no se aplicó nada del grupo
+        print(f"Error en el grupo de escrituras ({len(jobs)}): {e}")
+        if conn.in_transaction:
+            conn.rollback()
+        done = [(future, None, e, []) for fn, args, future, queued, context in jobs]
+    finally:
+        conn.group_commit = False
+        conn.pending_callbacks = None
+
+    finished = time.perf_counter()
+    with _sqlite_stats_lock:
+        _writer_stats["jobs"] += len(jobs)
+        _writer_stats["errors"] += sum(1 for item in done if item[2] is not None)
+        _writer_stats["commits"] += 1
+        _writer_stats["max_batch"] = max(_writer_stats["max_batch"], len(jobs))
+        _writer_stats["wait_seconds"] += sum(start - job[3] for job in jobs)
+        _writer_stats["busy_seconds"] += finished - start
+
+    for future, result, error, callbacks in done:
+        for fn, args in callbacks:
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Error en callback post-commit: {e}")
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+def writer_stats():
+    with _sqlite_stats_lock:
+        stats = dict(_writer_stats)
+    jobs = stats["jobs"]
+    stats["queued"] = _write_queue.qsize()
+    stats["avg_batch"] = jobs / stats["commits"] if stats["commits"] else 0.0
+    stats["avg_wait_ms"] = 1000 * stats["wait_seconds"] / jobs if jobs else 0.0
+    elapsed = time.time() - stats["started_at"] if stats["started_at"] else 0.0
+    stats["jobs_per_second"] = jobs / elapsed if elapsed > 0 else 0.0
+    return stats
+
+def get_pool_stats():
+    if is_cloud_db():
+        stats = get_postgres_pool().snapshot()
+        stats["backend"] = "postgres"
+    else:
+        with _sqlite_stats_lock:
+            stats = dict(_sqlite_stats)
+        stats["backend"] = "sqlite"
+    return stats
+
+# Wrapper to mimic SQLite behavior on top of Postgres
+class PostgresConnectionWrapper:
+    dialect = POSTGRES
+
+    def __init__(self, conn, pool=None):
+        self.conn = conn
+        self.pool = pool
+        self.broken = False
+        if pool is not None:
+            pool.attach(conn, self)
+
+    def cursor(self, name=None):
+        # Con nombre: cursor del lado del servidor (las filas llegan por lotes con fetchmany).
+        # Solo vive dentro de la transacción en curso.
+        return PostgresCursorWrapper(self.conn.cursor(name=name) if name else self.conn.cursor(), self)
+
+    @property
+    def in_transaction(self):
+        # Igual que sqlite3.Connection.in_transaction
+        return self.conn.get_transaction_status() != TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        # Devuelve la conexión al pool en lugar de cerrarla
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        if self.pool is not None:
+            self.pool.release(conn, broken=self.broken)
+        else:
+            conn.close()
+        
+    def execute(self, sql, params=None):
+        cur = self.cursor()
+        cur.execute(sql, params)
+        return cur
+
+class PostgresCursorWrapper:
+    def __init__(self, cursor, owner=None):
+        self.cursor = cursor
+        self.owner = owner
+        self._timer = None
+
+    def _finish(self):
+        # Registra la sentencia anterior en querylog.py (execute + fetch)
+        if self._timer is not None:
+            self._timer.finish()
+            self._timer = None
+
+    def _timed(self, sql, params, run):
+        self._finish()
+        timer = self._timer = QueryTimer(sql, params, self.owner)
+        start = time.perf_counter()
+        try:
+            result = run()
+        except Exception as e:
+            timer.error = str(e)
+            timer.add(time.perf_counter() - start)
+            self._finish()
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) and self.owner is not None:
+                # Conexión caída: que el pool la descarte al devolverla
+                self.owner.broken = True
+            raise
+        rows = max(self.cursor.rowcount, 0) if self.cursor.description is None else 0
+        timer.add(time.perf_counter() - start, rows)
+        return result
+        
+    def execute(self, sql, params=None):
+        # El SQL ya viene traducido por la capa de sentencias (statements.py)
+        try:
+            self._timed(sql, params, lambda: self.cursor.execute(sql, params))
+        except Exception as e:
+            print(f"Error executing SQL: {sql} | Params: {params}")
+            raise e
+
+    def executemany(self, sql, rows):
+        self._timed(sql, None, lambda: self.cursor.executemany(sql, rows))
+
+    def execute_values(self, sql, rows, template=None, page_size=1000, fetch=False):
+        # Inserta/actualiza muchas filas en pocas sentencias (psycopg2.extras)
+        return self._timed(sql, None, lambda: execute_values(self.cursor, sql, rows, template=template,
+                                                             page_size=page_size, fetch=fetch))
+
+    def _fetch(self, fetch, exhausted):
+        start = time.perf_counter()
+        try:
+            rows = fetch()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            if self.owner is not None:
+                self.owner.broken = True
+            raise
+        if self._timer is not None:
+            count = len(rows) if isinstance(rows, list) else int(rows is not None)
+            self._timer.add(time.perf_counter() - start, count)
+            if exhausted(rows):
+                self._finish()
+        return rows
+            
+    def fetchone(self):
+        return self._fetch(self.cursor.fetchone, lambda row: row is None)
+        
+    def fetchall(self):
+        return self._fetch(self.cursor.fetchall, lambda rows: True)
+
+    def fetchmany(self, size):
+        return self._fetch(lambda: self.cursor.fetchmany(size), lambda rows: len(rows) < size)
+        
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def description(self):
+        # Necesario para que Pandas lea las columnas
+        return self.cursor.description
+
+    def close(self):
+        self._finish()
+        self.cursor.close()
+
+@contextmanager
+def transaction(conn):
+    # Confirma al salir o deshace todo si hubo error.
+    # En SQLite tomamos el lock de escritura al inicio para no fallar a mitad.
+    if conn.dialect == SQLITE and conn.group_commit:
+        # Dentro del hilo escritor: confirma el grupo entero (los errores los maneja el SAVEPOINT)
+        yield conn
+        return
+    if conn.dialect == SQLITE and not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def init_db():
+    # El esquema se gestiona con migraciones versionadas (migrations.py)
+    from migrations import migrate
+    conn = get_connection()
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    init_db()
+    print("Base de datos inicializada (Modo Nube: " + str(is_cloud_db()) + ")")
@@ -0,0 +1,64 @@
+import argparse
+import sys
+from db import get_connection
+from statements import define, iter_frames, STREAM_BATCH_SIZE
+
+# Exportación a CSV leyendo por lotes (iter_frames): la memoria usada depende del
+# tamaño del lote, no del total de filas.
+#   python src/export.py compras data/compras.csv
+#   python src/export.py catalogo - --batch 5000
+
+EXPORT_PURCHASES = define("export.purchases", '''
+    SELECT
+        s.id,
+        s.shopping_date as "Fecha",
+        p.name as "Producto",
+        p.category as "Categoría",
+        s.quantity_approved as "Cantidad",
+        s.price_real as "Precio"
+    FROM shopping_list_all s
+    JOIN products p ON s.product_id = p.id
+    WHERE s.status = 'Comprado'
+    ORDER BY s.shopping_date, s.id
+''')
+
+EXPORT_CATALOG = define("export.catalog", '''
+    SELECT id, name as "Producto", category as "Categoría", uom as "Unidad",
+           last_price_estimate as "PrecioRef", active as "Activo"
+    FROM products
+    ORDER BY id
+''')
+
+EXPORTS = {
+    "compras": EXPORT_PURCHASES,
+    "catalogo": EXPORT_CATALOG,
+}
+
+def write_csv(conn, name, out, batch_size=STREAM_BATCH_SIZE):
+    # Escribe la exportación 'name' en el archivo de texto 'out'. Devuelve las filas escritas.
+    rows = 0
+    for frame in iter_frames(conn, EXPORTS[name], batch_size=batch_size):
+        frame.to_csv(out, index=False, header=rows == 0)
+        rows += len(frame)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta datos a CSV por lotes")
+    parser.add_argument("export", choices=sorted(EXPORTS))
+    parser.add_argument("path", help="archivo de salida, o - para la salida estándar")
+    parser.add_argument("--batch", type=int, default=STREAM_BATCH_SIZE, help="filas por lote")
+    args = parser.parse_args(argv)
+
+    conn = get_connection()
+    try:
+        if args.path == "-":
+            rows = write_csv(conn, args.export, sys.stdout, args.batch)
+        else:
+            with open(args.path, "w", newline="", encoding="utf-8") as out:
+                rows = write_csv(conn, args.export, out, args.batch)
+    finally:
+        conn.close()
+    print(f"{rows} filas exportadas", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from cache import cached_frame
+from statements import define
+
+# Historial de compras paginado en la base de datos (items vivos + archivados).
+# Paginación por clave (shopping_date, id) descendente: cada página continúa desde la
+# última fila de la anterior, así el costo no crece con el número de página.
+# Filtros opcionales (None = sin filtro): desde / hasta (fechas 'YYYY-MM-DD', hasta
+# exclusivo), categoría exacta y texto contenido en el nombre del producto.
+
+PAGE_SIZE = 50
+
+HISTORY_PAGE = define("history.page", '''
+    SELECT
+        s.id,
+        s.shopping_date as "Fecha",
+        p.name as "Producto",
+        p.category as "Categoría",
+        s.quantity_approved as "Cantidad",
+        s.price_real as "Precio"
+    FROM shopping_list_all s
+    JOIN products p ON s.product_id = p.id
+    WHERE s.status = 'Comprado'
+      AND (? IS NULL OR s.shopping_date >= ?)
+      AND (? IS NULL OR s.shopping_date < ?)
+      AND (? IS NULL OR p.category = ?)
+      AND (? IS NULL OR p.name LIKE '%' || ? || '%')
+      AND (? IS NULL OR (s.shopping_date, s.id) < (?, ?))
+    ORDER BY s.shopping_date DESC, s.id DESC
+    LIMIT ?
+''', postgres='''
+    SELECT
+        s.id,
+        s.shopping_date as "Fecha",
+        p.name as "Producto",
+        p.category as "Categoría",
+        s.quantity_approved as "Cantidad",
+        s.price_real as "Precio"
+    FROM shopping_list_all s
+    JOIN products p ON s.product_id = p.id
+    WHERE s.status = 'Comprado'
+      AND (?::timestamp IS NULL OR s.shopping_date >= ?::timestamp)
+      AND (?::timestamp IS NULL OR s.shopping_date < ?::timestamp)
+      AND (?::text IS NULL OR p.category = ?)
+      AND (?::text IS NULL OR p.name ILIKE '%' || ? || '%')
+      AND (?::timestamp IS NULL OR (s.shopping_date, s.id) < (?::timestamp, ?))
+    ORDER BY s.shopping_date DESC, s.id DESC
+    LIMIT ?
+''')
+
+def fetch_page(conn, cursor=None, start=None, end=None, category=None, product=None,
+               page_size=PAGE_SIZE):
+    # cursor = (fecha, id) de la última fila de la página anterior, o None para la primera.
+    # Devuelve (página, cursor de la siguiente o None si no hay más).
+    product = product.strip() if product else None
+    after_date, after_id = cursor if cursor else (None, None)
+    params = (start, start, end, end, category, category, product or None, product or None,
+              after_date, after_date, after_id, page_size + 1)
+    page = cached_frame(conn, HISTORY_PAGE, params, tables=("products", "shopping_list_items", "shopping_list_history"))
+    next_cursor = None
+    if len(page) > page_size:
+        page = page.iloc[:page_size]
+        last = page.iloc[-1]
+        after = last['Fecha']
+        if hasattr(after, 'to_pydatetime'):
+            after = after.to_pydatetime()
+        next_cursor = (after, int(last['id']))
+    return page, next_cursor
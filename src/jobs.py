@@ -0,0 +1,115 @@
+import threading
+import time
+import traceback
+from itertools import count
+
+# Registro de trabajos en segundo plano, compartido por todas las sesiones del proceso.
+# Solo puede haber un trabajo en curso por nombre (p.ej. una sola importación de catálogo).
+
+RUNNING = "En curso"
+DONE = "Completado"
+CANCELLED = "Cancelado"
+FAILED = "Error"
+
+MAX_LOG_LINES = 500
+
+_ids = count(1)
+_lock = threading.Lock()
+_jobs = {}  # nombre -> último Job
+
+class Job:
+    def __init__(self, name, target):
+        self.id = next(_ids)
+        self.name = name
+        self.target = target
+        self.status = RUNNING
+        self.started_at = time.time()
+        self.finished_at = None
+        self.rows = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self._log = []
+        self._lock = threading.Lock()
+
+    def log(self, *args):
+        line = " ".join(str(a) for a in args)
+        with self._lock:
+            self._log.append(line)
+            if len(self._log) > MAX_LOG_LINES:
+                del self._log[:len(self._log) - MAX_LOG_LINES]
+
+    def progress(self, rows, total=None):
+        with self._lock:
+            self.rows = rows
+            if total is not None:
+                self.total = total
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _run(self):
+        try:
+            result = self.target(self)
+            status = CANCELLED if self.cancel_event.is_set() else DONE
+            error = None
+        except Exception as e:
+            result = None
+            status = CANCELLED if self.cancel_event.is_set() else FAILED
+            error = str(e)
+            if status == FAILED:
+                self.log(traceback.format_exc())
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.status = status
+            self.finished_at = time.time()
+
+    def snapshot(self):
+        # Copia consistente para mostrar en la UI
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = max(end - self.started_at, 1e-6)
+            rate = self.rows / elapsed
+            eta = None
+            if self.status == RUNNING and self.total and rate > 0:
+                eta = max(self.total - self.rows, 0) / rate
+            return {
+                "id": self.id,
+                "name": self.name,
+                "status": self.status,
+                "running": self.status == RUNNING,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed": elapsed,
+                "rows": self.rows,
+                "total": self.total,
+                "rate": rate,
+                "eta": eta,
+                "result": self.result,
+                "error": self.error,
+                "log": "\n".join(self._log),
+            }
+
+def start(name, target):
+    # Lanza target(job) en un hilo. Si ya hay uno en curso con ese nombre, devuelve ese.
+    with _lock:
+        current = _jobs.get(name)
+        if current is not None and current.status == RUNNING:
+            return current, False
+        job = Job(name, target)
+        _jobs[name] = job
+    threading.Thread(target=job._run, name=f"job-{name}-{job.id}", daemon=True).start()
+    return job, True
+
+def get(name):
+    with _lock:
+        return _jobs.get(name)
+
+def cancel(name):
+    job = get(name)
+    if job is not None and job.status == RUNNING:
+        job.cancel()
+        return True
+    return False
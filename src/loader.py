@@ -1,106 +1,330 @@
-from db import get_connection, init_db
-import io
-import requests
-import pandas as pd
-import os
-
-# --- ASEGÚRATE DE QUE ESTA LÍNEA TENGA TU ENLACE REAL ---
-SHEET_URL = "https://docs.google.com/spreadsheets/d/1Eu9f5rabzwIIfaMWg4ZpyhPBQR_IAmpC1zbv3Za4dpk/export?format=csv"
-EXCEL_PATH = "Cosas Casa.xlsx"
-
-def load_products_from_excel():
-    init_db()
-    
-    df = None
-    source_name = ""
-
-    # CHIVATO 1: Ver si detecta la URL
-    print(f"DEBUG: Revisando URL... Longitud: {len(SHEET_URL) if SHEET_URL else 0}")
-    
-    if SHEET_URL and "docs.google.com" in SHEET_URL:
-        try:
-            print(f"DEBUG: Intentando descargar desde Google Sheets: {SHEET_URL[:30]}...")
-            response = requests.get(SHEET_URL)
-            response.raise_for_status()
-            df = pd.read_csv(io.StringIO(response.content.decode('utf-8')))
-            source_name = "Google Sheets"
-            print(f"DEBUG: Datos descargados. Filas encontradas: {len(df)}")
-        except Exception as e:
-            print(f"ERROR: Fallo al conectar con Google Sheets: {e}")
-            print("Intentando archivo local...")
-    else:
-        print("DEBUG: NO se detectó URL válida de Google Sheets en el código.")
-    
-    # INTENTO 2: Archivo Local
-    if df is None:
-        if os.path.exists(EXCEL_PATH):
-            try:
-                df = pd.read_excel(EXCEL_PATH)
-                source_name = "Archivo Local Excel"
-            except Exception as e:
-                print(f"Error leyendo archivo local: {e}")
-                return
-        else:
-            print(f"ERROR FATAL: No se encontró URL ni archivo local.")
-            return
-
-    # PROCESAMIENTO
-    try:
-        # Standardize columns
-        df.columns = [str(c).strip().lower() for c in df.columns]
-        
-        col_map = {
-            'product': 'name', 'producto': 'name', 'item': 'name', 'nombre': 'name',
-            'category': 'category', 'categoría': 'category', 'categoria': 'category', 'tipo': 'category',
-            'unit': 'uom', 'unidad': 'uom', 'medida': 'uom', 'uom': 'uom', 'u/m': 'uom'
-        }
-        df = df.rename(columns={c: col_map[c] for c in df.columns if c in col_map})
-        
-        if 'name' not in df.columns:
-            print(f"ERROR: Columnas encontradas: {df.columns.tolist()}. Falta 'name/producto'.")
-            return
-
-        conn = get_connection()
-        c = conn.cursor()
-        
-        count = 0
-        updated = 0
-        for _, row in df.iterrows():
-            name = row.get('name')
-            if pd.isna(name): continue
-            
-            category = row.get('category', 'General')
-            uom = row.get('uom', 'Unidad')
-            
-            # Check existance
-            c.execute("SELECT id FROM products WHERE name = %s", (name,)) # USAMOS %s POR SI ES POSTGRES
-            existing = c.fetchone()
-            
-            if not existing:
-                c.execute("SELECT id FROM products WHERE name = ?", (name,)) # FALLBACK SQLITE
-                existing = c.fetchone()
-
-            if not existing:
-                # INSERT (Try generic first)
-                try:
-                    c.execute('INSERT INTO products (name, category, uom) VALUES (?, ?, ?)', (name, category, uom))
-                except:
-                     c.execute('INSERT INTO products (name, category, uom) VALUES (%s, %s, %s)', (name, category, uom))
-                count += 1
-            else:
-                # UPDATE
-                try:
-                    c.execute('UPDATE products SET category = ?, uom = ? WHERE name = ?', (category, uom, name))
-                except:
-                    c.execute('UPDATE products SET category = %s, uom = %s WHERE name = %s', (category, uom, name))
-                updated += 1
-        
-        conn.commit()
-        conn.close()
-        print(f"ÉXITO: Se cargaron {count} nuevos y se actualizaron {updated}.")
-        
-    except Exception as e:
-        print(f"ERROR PROCESANDO DATOS: {e}")
-
-if __name__ == "__main__":
-    load_products_from_excel()
+import cache
+from db import get_connection, on_commit, submit_write
+from statements import define, execute, executemany, fetchone, read_frame, Array
+import hashlib
+import requests
+import tempfile
+import pandas as pd
+import os
+
+# --- ASEGÚRATE DE QUE ESTA LÍNEA TENGA TU ENLACE REAL ---
+SHEET_URL = "https://docs.google.com/spreadsheets/d/1Eu9f5rabzwIIfaMWg4ZpyhPBQR_IAmpC1zbv3Za4dpk/export?format=csv"
+EXCEL_PATH = "Cosas Casa.xlsx"
+
+# Huella de los productos de un bloque de la hoja, tal como quedaron en la última importación
+PRODUCT_HASHES = define("loader.product_hashes",
+    "SELECT name, row_hash, active FROM products WHERE name IN (SELECT value FROM json_each(?))",
+    postgres="SELECT name, row_hash, active FROM products WHERE name = ANY(?)")
+
+# Nombres vistos en esta importación (tabla catalog_seen, ver migraciones): para detectar
+# los que desaparecieron sin tener que cargar todo el catálogo en memoria
+CLEAR_SEEN = define("loader.clear_seen", "DELETE FROM catalog_seen")
+
+MARK_SEEN = define("loader.mark_seen",
+    "INSERT INTO catalog_seen (name) VALUES (?) ON CONFLICT (name) DO NOTHING")
+
+# Upsert por nombre (clave única ux_products_name). Reactiva productos dados de baja.
+UPSERT_PRODUCTS = define("loader.upsert_products", '''
+    INSERT INTO products (name, category, uom, row_hash, active) VALUES (?, ?, ?, ?, 1)
+    ON CONFLICT (name) DO UPDATE SET
+        category = excluded.category, uom = excluded.uom,
+        row_hash = excluded.row_hash, active = 1
+''')
+
+# Los productos que desaparecen de la hoja no se borran (tienen historial): se desactivan
+DEACTIVATE_MISSING = define("loader.deactivate_missing",
+    "UPDATE products SET active = 0 WHERE active = 1 AND name NOT IN (SELECT name FROM catalog_seen)")
+
+SYNC_STATE = define("loader.sync_state",
+    "SELECT etag, last_modified, content_hash FROM catalog_sync_state WHERE source = ?")
+
+SAVE_SYNC_STATE = define("loader.save_sync_state", '''
+    INSERT INTO catalog_sync_state (source, etag, last_modified, content_hash, row_count, synced_at)
+    VALUES (?, ?, ?, ?, ?, datetime('now'))
+    ON CONFLICT (source) DO UPDATE SET
+        etag = excluded.etag, last_modified = excluded.last_modified,
+        content_hash = excluded.content_hash, row_count = excluded.row_count,
+        synced_at = excluded.synced_at
+''')
+
+BATCH_SIZE = 1000
+CHUNK_ROWS = 5000            # Filas de la hoja procesadas a la vez
+DOWNLOAD_BLOCK = 64 * 1024   # Bytes por bloque al descargar
+DOWNLOAD_TIMEOUT = 60
+
+COL_MAP = {
+    'product': 'name', 'producto': 'name', 'item': 'name', 'nombre': 'name',
+    'category': 'category', 'categoría': 'category', 'categoria': 'category', 'tipo': 'category',
+    'unit': 'uom', 'unidad': 'uom', 'medida': 'uom', 'uom': 'uom', 'u/m': 'uom'
+}
+
+def normalize_columns(df):
+    # Standardize columns
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    return df.rename(columns={c: COL_MAP[c] for c in df.columns if c in COL_MAP})
+
+def _row_hash(name, category, uom):
+    raw = "\x1f".join("" if v is None else str(v) for v in (name, category, uom))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def prepare_products(df):
+    # DataFrame normalizado -> (filas válidas en la hoja, frame name/category/uom/row_hash)
+    df = df[df['name'].notna()]
+    frame = pd.DataFrame({
+        'name': df['name'].astype(str),
+        'category': df['category'] if 'category' in df.columns else 'General',
+        'uom': df['uom'] if 'uom' in df.columns else 'Unidad',
+    })
+    # Un mismo nombre solo puede tocarse una vez por sentencia: gana la última fila
+    frame = frame.drop_duplicates('name', keep='last')
+    frame = frame.astype(object).where(frame.notna(), None)
+    frame['row_hash'] = [_row_hash(*row) for row in frame[['name', 'category', 'uom']].itertuples(index=False, name=None)]
+    return len(df), frame
+
+class ImportCancelled(Exception):
+    pass
+
+def _clear_seen(conn):
+    execute(conn, CLEAR_SEEN).close()
+
+def _sync_chunk(conn, frame):
+    # Un bloque, en su propia transacción del escritor. Devuelve (nuevos, modificados, sin cambios).
+    existing = read_frame(conn, PRODUCT_HASHES, (Array(frame['name']),))
+    merged = frame.merge(existing, on='name', how='left', suffixes=('', '_db'), indicator=True)
+    is_new = merged['_merge'] == 'left_only'
+    is_modified = ~is_new & ((merged['row_hash'] != merged['row_hash_db']) | (merged['active'] != 1))
+    to_write = merged.loc[is_new | is_modified, ['name', 'category', 'uom', 'row_hash']]
+
+    executemany(conn, MARK_SEEN, ((name,) for name in frame['name']), page_size=BATCH_SIZE)
+    if len(to_write):
+        executemany(conn, UPSERT_PRODUCTS, to_write.itertuples(index=False, name=None), page_size=BATCH_SIZE)
+        on_commit(conn, cache.bump, "products")
+    inserted, updated = int(is_new.sum()), int(is_modified.sum())
+    return inserted, updated, len(merged) - inserted - updated
+
+def _deactivate_missing(conn):
+    cur = execute(conn, DEACTIVATE_MISSING)
+    deactivated = max(cur.rowcount, 0)
+    cur.close()
+    execute(conn, CLEAR_SEEN).close()
+    on_commit(conn, cache.bump, "products")
+    return deactivated
+
+def sync_products(chunks, progress=None, cancel=None):
+    # 'chunks' son DataFrames ya normalizados (bloques de la hoja). Compara cada bloque
+    # con la huella guardada y escribe solo lo que cambió. La memoria depende del tamaño
+    # del bloque, no del de la hoja.
+    # Cada bloque es una escritura del escritor único (submit_write): el resto de la app
+    # sigue escribiendo entre bloque y bloque en vez de esperar a toda la importación.
+    # progress(filas) se llama tras cada bloque; si cancel (threading.Event) se activa, se
+    # detiene: lo ya escrito se queda, pero no se desactiva nada (la hoja no se vio entera).
+    summary = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'deactivated': 0}
+
+    submit_write(_clear_seen)
+    for chunk in chunks:
+        if cancel is not None and cancel.is_set():
+            raise ImportCancelled("Importación cancelada")
+        total_rows, frame = prepare_products(chunk)
+        summary['rows'] += total_rows
+        if progress is not None:
+            progress(summary['rows'])
+        if frame.empty:
+            continue
+        inserted, updated, unchanged = submit_write(_sync_chunk, frame)
+        summary['inserted'] += inserted
+        summary['updated'] += updated
+        summary['unchanged'] += unchanged
+
+    summary['deactivated'] = submit_write(_deactivate_missing)
+    return summary
+
+def _download_to_tempfile(url, headers):
+    # Descarga por bloques a un archivo temporal calculando el hash por el camino.
+    # Devuelve (archivo, hash sha256, response), o (None, None, response) si el servidor
+    # responde 304.
+    response = requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    with response:
+        if response.status_code == 304:
+            return None, None, response
+        response.raise_for_status()
+        digest = hashlib.sha256()
+        tmp = tempfile.TemporaryFile()
+        for block in response.iter_content(chunk_size=DOWNLOAD_BLOCK):
+            digest.update(block)
+            tmp.write(block)
+    tmp.seek(0)
+    return tmp, digest.hexdigest(), response
+
+def count_csv_rows(fileobj):
+    # Estimación barata del total (para progreso/ETA): cuenta saltos de línea por bloques
+    lines = 0
+    for block in iter(lambda: fileobj.read(1 << 20), b""):
+        lines += block.count(b"\n")
+    fileobj.seek(0)
+    return max(lines - 1, 0)
+
+def count_excel_rows(path):
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True)
+    try:
+        max_row = wb.active.max_row
+    finally:
+        wb.close()
+    return max(max_row - 1, 0) if max_row else None
+
+def iter_csv_chunks(fileobj):
+    for chunk in pd.read_csv(fileobj, encoding='utf-8', chunksize=CHUNK_ROWS):
+        yield normalize_columns(chunk)
+
+def iter_excel_chunks(path):
+    # openpyxl en modo solo-lectura recorre las filas sin cargar el libro entero
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [f"col_{i}" if h is None else h for i, h in enumerate(header)]
+        batch = []
+        yielded = False
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= CHUNK_ROWS:
+                yield normalize_columns(pd.DataFrame(batch, columns=header))
+                batch = []
+                yielded = True
+        if batch or not yielded:
+            yield normalize_columns(pd.DataFrame(batch, columns=header))
+    finally:
+        wb.close()
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _require_name(chunks, log=print):
+    # Valida las columnas con el primer bloque antes de escribir nada
+    first = next(chunks, None)
+    if first is None:
+        return None
+    if 'name' not in first.columns:
+        log(f"ERROR: Columnas encontradas: {first.columns.tolist()}. Falta 'name/producto'.")
+        # Error, no "sin datos": el trabajo en segundo plano debe quedar como fallido
+        raise ValueError("falta la columna 'name'")
+
+    def all_chunks():
+        yield first
+        yield from chunks
+    return all_chunks()
+
+def _save_state(conn, source, fingerprint, row_count):
+    execute(conn, SAVE_SYNC_STATE, (source, fingerprint.get('etag'), fingerprint.get('last_modified'),
+                                    fingerprint['content_hash'], row_count)).close()
+
+def load_products_from_excel(force=False, log=print, progress=None, cancel=None):
+    # log/progress/cancel permiten ejecutarlo como trabajo en segundo plano (ver jobs.py)
+    from startup import ensure_initialized
+    ensure_initialized()
+
+    chunks = None
+    source_name = ""
+    source_key = None
+    fingerprint = None
+    tmp = None
+    total_rows = None
+
+    conn = get_connection()
+    try:
+        # CHIVATO 1: Ver si detecta la URL
+        log(f"DEBUG: Revisando URL... Longitud: {len(SHEET_URL) if SHEET_URL else 0}")
+
+        if SHEET_URL and "docs.google.com" in SHEET_URL:
+            try:
+                log(f"DEBUG: Intentando descargar desde Google Sheets: {SHEET_URL[:30]}...")
+                state = None if force else fetchone(conn, SYNC_STATE, (SHEET_URL,))
+                headers = {}
+                if state and state['etag']:
+                    headers['If-None-Match'] = state['etag']
+                if state and state['last_modified']:
+                    headers['If-Modified-Since'] = state['last_modified']
+
+                tmp, content_hash, response = _download_to_tempfile(SHEET_URL, headers)
+                if tmp is None:
+                    log("SIN CAMBIOS: Google Sheets no ha cambiado desde la última importación.")
+                    return {'source': "Google Sheets", 'changed': False}
+                if state and state['content_hash'] == content_hash:
+                    log("SIN CAMBIOS: El contenido descargado es idéntico a la última importación.")
+                    return {'source': "Google Sheets", 'changed': False}
+
+                total_rows = count_csv_rows(tmp)
+                chunks = iter_csv_chunks(tmp)
+                source_name = "Google Sheets"
+                source_key = SHEET_URL
+                fingerprint = {'etag': response.headers.get('ETag'),
+                               'last_modified': response.headers.get('Last-Modified'),
+                               'content_hash': content_hash}
+                log(f"DEBUG: Datos descargados. Filas encontradas: {total_rows}")
+            except Exception as e:
+                log(f"ERROR: Fallo al conectar con Google Sheets: {e}")
+                log("Intentando archivo local...")
+        else:
+            log("DEBUG: NO se detectó URL válida de Google Sheets en el código.")
+
+        # INTENTO 2: Archivo Local
+        if chunks is None:
+            if os.path.exists(EXCEL_PATH):
+                try:
+                    content_hash = _file_hash(EXCEL_PATH)
+                    state = None if force else fetchone(conn, SYNC_STATE, (EXCEL_PATH,))
+                    if state and state['content_hash'] == content_hash:
+                        log("SIN CAMBIOS: El archivo local no ha cambiado desde la última importación.")
+                        return {'source': "Archivo Local Excel", 'changed': False}
+
+                    total_rows = count_excel_rows(EXCEL_PATH)
+                    chunks = iter_excel_chunks(EXCEL_PATH)
+                    source_name = "Archivo Local Excel"
+                    source_key = EXCEL_PATH
+                    fingerprint = {'last_modified': str(os.path.getmtime(EXCEL_PATH)),
+                                   'content_hash': content_hash}
+                except Exception as e:
+                    log(f"Error leyendo archivo local: {e}")
+                    raise
+            else:
+                log(f"ERROR FATAL: No se encontró URL ni archivo local.")
+                raise FileNotFoundError(f"No se encontró URL ni archivo local ({EXCEL_PATH})")
+
+        # PROCESAMIENTO (por bloques)
+        try:
+            chunks = _require_name(chunks, log)
+            if chunks is None:
+                return
+
+            on_progress = None
+            if progress is not None:
+                on_progress = lambda rows: progress(rows, total_rows)
+            summary = sync_products(chunks, progress=on_progress, cancel=cancel)
+            submit_write(_save_state, source_key, fingerprint, summary['rows'])
+            log(f"DEBUG: Filas procesadas: {summary['rows']}")
+            log(f"ÉXITO: Se cargaron {summary['inserted']} nuevos y se actualizaron {summary['updated']}.")
+            log(f"Sin cambios: {summary['unchanged']} | Desactivados (ya no están en {source_name}): {summary['deactivated']}")
+            summary.update({'source': source_name, 'changed': True})
+            return summary
+
+        except ImportCancelled:
+            log("CANCELADO: Se conservan los bloques ya importados; no se desactivó ningún producto.")
+            raise
+        except Exception as e:
+            log(f"ERROR PROCESANDO DATOS: {e}")
+            # Que el trabajo en segundo plano (jobs.py) lo registre como fallido
+            raise
+    finally:
+        if tmp is not None:
+            tmp.close()
+        conn.close()
+
+if __name__ == "__main__":
+    load_products_from_excel()
@@ -0,0 +1,347 @@
+import rollups
+from db import get_connection, is_cloud_db, transaction
+from statements import define, dialect_of, execute, fetchone, POSTGRES
+
+# Migraciones versionadas del esquema. Cada una se aplica una sola vez, en orden y
+# dentro de su propia transacción; la versión aplicada queda en schema_version.
+# Para cambiar el esquema: añadir una función nueva con @migration(N + 1, "...").
+
+CREATE_SCHEMA_VERSION = define("migrations.create_schema_version", '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+''')
+
+CURRENT_VERSION = define("migrations.current_version",
+    "SELECT COALESCE(MAX(version), 0) as version FROM schema_version")
+
+RECORD_VERSION = define("migrations.record_version",
+    "INSERT INTO schema_version (version, description) VALUES (?, ?)")
+
+# Evita que dos procesos migren a la vez (en SQLite ya lo garantiza BEGIN IMMEDIATE)
+MIGRATION_LOCK = define("migrations.lock",
+    "SELECT 1",
+    postgres="SELECT pg_advisory_xact_lock(7270501)")
+
+# Usuarios
+CREATE_USERS = define("migrations.create_users", '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL
+    )
+''')
+
+# Productos (Inventario Maestro)
+CREATE_PRODUCTS = define("migrations.create_products", '''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        category TEXT,
+        uom TEXT,
+        brand TEXT,
+        image_path TEXT,
+        last_price_estimate REAL DEFAULT 0.0
+    )
+''')
+
+# Items de Lista de Compras
+CREATE_SHOPPING_LIST_ITEMS = define("migrations.create_shopping_list_items", '''
+    CREATE TABLE IF NOT EXISTS shopping_list_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        requester_id INTEGER,
+        quantity_requested REAL DEFAULT 1,
+        quantity_approved REAL,
+        status TEXT DEFAULT 'Pendiente', -- Pendiente, Aprobado, Comprado, Postergado
+        price_real REAL,
+        shopping_date TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES products (id),
+        FOREIGN KEY (requester_id) REFERENCES users (id)
+    )
+''')
+
+# Clave única por nombre de producto (la usa el upsert del loader)
+PRODUCTS_NAME_KEY_EXISTS = define("migrations.products_name_key_exists",
+    "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_products_name'",
+    postgres="SELECT 1 FROM pg_indexes WHERE indexname = 'ux_products_name'")
+
+# Antes de crear la clave: los items de productos duplicados pasan al de menor id
+REPOINT_DUPLICATE_PRODUCT_ITEMS = define("migrations.repoint_duplicate_product_items", '''
+    UPDATE shopping_list_items
+    SET product_id = (
+        SELECT MIN(p2.id) FROM products p1 JOIN products p2 ON p2.name = p1.name
+        WHERE p1.id = shopping_list_items.product_id
+    )
+    WHERE product_id IN (
+        SELECT p.id FROM products p
+        WHERE p.id > (SELECT MIN(p3.id) FROM products p3 WHERE p3.name = p.name)
+    )
+''')
+
+DELETE_DUPLICATE_PRODUCTS = define("migrations.delete_duplicate_products", '''
+    DELETE FROM products
+    WHERE id > (SELECT MIN(p2.id) FROM products p2 WHERE p2.name = products.name)
+''')
+
+CREATE_PRODUCTS_NAME_KEY = define("migrations.create_products_name_key",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_products_name ON products (name)")
+
+# Sincronización incremental del catálogo: productos dados de baja y huella por fila
+PRODUCTS_HAS_COLUMN = define("migrations.products_has_column",
+    "SELECT 1 FROM pragma_table_info('products') WHERE name = ?",
+    postgres="SELECT 1 FROM information_schema.columns WHERE table_name = 'products' AND column_name = ?")
+
+ADD_PRODUCTS_ACTIVE = define("migrations.add_products_active",
+    "ALTER TABLE products ADD COLUMN active INTEGER DEFAULT 1")
+
+ADD_PRODUCTS_ROW_HASH = define("migrations.add_products_row_hash",
+    "ALTER TABLE products ADD COLUMN row_hash TEXT")
+
+# Última importación de cada fuente (URL o archivo)
+CREATE_CATALOG_SYNC_STATE = define("migrations.create_catalog_sync_state", '''
+    CREATE TABLE IF NOT EXISTS catalog_sync_state (
+        source TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        content_hash TEXT,
+        row_count INTEGER,
+        synced_at TIMESTAMP
+    )
+''')
+
+# Índices de las consultas frecuentes
+CREATE_INDEXES = [
+    # Requester (carrito) y admin: items por estado unidos a productos
+    define("migrations.ix_items_status_product",
+        "CREATE INDEX IF NOT EXISTS ix_items_status_product ON shopping_list_items (status, product_id)"),
+    # Historial / estadísticas: compras ordenadas por fecha
+    define("migrations.ix_items_status_date",
+        "CREATE INDEX IF NOT EXISTS ix_items_status_date ON shopping_list_items (status, shopping_date)"),
+    # Admin: pendientes en orden de llegada
+    define("migrations.ix_items_status_created",
+        "CREATE INDEX IF NOT EXISTS ix_items_status_created ON shopping_list_items (status, created_at)"),
+    # Filtro por categoría en el catálogo
+    define("migrations.ix_products_category",
+        "CREATE INDEX IF NOT EXISTS ix_products_category ON products (category)"),
+]
+
+# Índice de búsqueda de productos (ver search.py)
+SQLITE_SEARCH_INDEX = [
+    define("migrations.create_products_fts", '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, category,
+            content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    '''),
+    define("migrations.products_fts_insert", '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, name, category) VALUES (new.id, new.name, new.category);
+        END
+    '''),
+    define("migrations.products_fts_delete", '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, category) VALUES ('delete', old.id, old.name, old.category);
+        END
+    '''),
+    define("migrations.products_fts_update", '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, category ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, category) VALUES ('delete', old.id, old.name, old.category);
+            INSERT INTO products_fts (rowid, name, category) VALUES (new.id, new.name, new.category);
+        END
+    '''),
+    define("migrations.products_fts_rebuild",
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')"),
+]
+
+POSTGRES_SEARCH_INDEX = [
+    define("migrations.create_pg_trgm", "CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+    define("migrations.create_unaccent", "CREATE EXTENSION IF NOT EXISTS unaccent"),
+    # unaccent() no es IMMUTABLE; este envoltorio sí, para poder indexarlo
+    define("migrations.create_f_unaccent", '''
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS
+        $$ SELECT public.unaccent('public.unaccent', $1) $$
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    '''),
+    define("migrations.ix_products_name_trgm",
+        "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (f_unaccent(lower(name)) gin_trgm_ops)"),
+]
+
+# Resumen de gasto para las estadísticas (ver rollups.py)
+CREATE_SPEND_MONTHLY = define("migrations.create_spend_monthly", '''
+    CREATE TABLE IF NOT EXISTS spend_monthly (
+        month TEXT NOT NULL,
+        category TEXT NOT NULL DEFAULT '',
+        total REAL NOT NULL DEFAULT 0,
+        items INTEGER NOT NULL DEFAULT 0,
+        priced_items INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (month, category)
+    )
+''')
+
+SPEND_MONTHLY_HAS_PRICED_ITEMS = define("migrations.spend_monthly_has_priced_items",
+    "SELECT 1 FROM pragma_table_info('spend_monthly') WHERE name = 'priced_items'",
+    postgres="SELECT 1 FROM information_schema.columns WHERE table_name = 'spend_monthly' AND column_name = 'priced_items'")
+
+ADD_SPEND_MONTHLY_PRICED_ITEMS = define("migrations.add_spend_monthly_priced_items",
+    "ALTER TABLE spend_monthly ADD COLUMN priced_items INTEGER NOT NULL DEFAULT 0")
+
+# Archivo de items cerrados (ver archive.py) y vista que une ambas tablas para el historial.
+# Los ids se conservan: AUTOINCREMENT / SERIAL no los reutiliza.
+CREATE_SHOPPING_LIST_HISTORY = define("migrations.create_shopping_list_history", '''
+    CREATE TABLE IF NOT EXISTS shopping_list_history (
+        id INTEGER PRIMARY KEY,
+        product_id INTEGER NOT NULL,
+        requester_id INTEGER,
+        quantity_requested REAL,
+        quantity_approved REAL,
+        status TEXT,
+        price_real REAL,
+        shopping_date TIMESTAMP,
+        created_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES products (id),
+        FOREIGN KEY (requester_id) REFERENCES users (id)
+    )
+''')
+
+CREATE_HISTORY_INDEX = define("migrations.ix_history_status_date",
+    "CREATE INDEX IF NOT EXISTS ix_history_status_date ON shopping_list_history (status, shopping_date)")
+
+CREATE_SHOPPING_LIST_ALL = define("migrations.create_shopping_list_all", '''
+    CREATE VIEW shopping_list_all AS
+    SELECT id, product_id, requester_id, quantity_requested, quantity_approved,
+           status, price_real, shopping_date, created_at
+    FROM shopping_list_items
+    UNION ALL
+    SELECT id, product_id, requester_id, quantity_requested, quantity_approved,
+           status, price_real, shopping_date, created_at
+    FROM shopping_list_history
+''')
+
+DROP_SHOPPING_LIST_ALL = define("migrations.drop_shopping_list_all",
+    "DROP VIEW IF EXISTS shopping_list_all")
+
+# Nombres vistos por la importación en curso (ver loader.sync_products). Tabla normal y no
+# temporal: cada bloque se escribe en su propia transacción, quizá con otra conexión.
+CREATE_CATALOG_SEEN = define("migrations.create_catalog_seen",
+    "CREATE TABLE IF NOT EXISTS catalog_seen (name TEXT PRIMARY KEY)")
+
+# Operaciones de la cola local ya aplicadas (ver outbox.py): evita aplicarlas dos veces
+CREATE_APPLIED_OPERATIONS = define("migrations.create_applied_operations", '''
+    CREATE TABLE IF NOT EXISTS applied_operations (
+        key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+''')
+
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migración {version} fuera de orden")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+@migration(1, "Tablas base: users, products, shopping_list_items")
+def _base_tables(conn):
+    # IF NOT EXISTS: las instalaciones anteriores a las migraciones ya las tienen
+    execute(conn, CREATE_USERS)
+    execute(conn, CREATE_PRODUCTS)
+    execute(conn, CREATE_SHOPPING_LIST_ITEMS)
+
+@migration(2, "Clave única products(name), fusionando duplicados")
+def _products_name_key(conn):
+    if fetchone(conn, PRODUCTS_NAME_KEY_EXISTS):
+        return
+    execute(conn, REPOINT_DUPLICATE_PRODUCT_ITEMS)
+    execute(conn, DELETE_DUPLICATE_PRODUCTS)
+    execute(conn, CREATE_PRODUCTS_NAME_KEY)
+
+@migration(3, "Sincronización incremental del catálogo (active, row_hash, catalog_sync_state)")
+def _catalog_sync(conn):
+    if not fetchone(conn, PRODUCTS_HAS_COLUMN, ("active",)):
+        execute(conn, ADD_PRODUCTS_ACTIVE)
+    if not fetchone(conn, PRODUCTS_HAS_COLUMN, ("row_hash",)):
+        execute(conn, ADD_PRODUCTS_ROW_HASH)
+    execute(conn, CREATE_CATALOG_SYNC_STATE)
+
+@migration(4, "Índices compuestos para las consultas de las vistas")
+def _hot_path_indexes(conn):
+    for stmt in CREATE_INDEXES:
+        execute(conn, stmt)
+
+@migration(5, "Índice de búsqueda de productos (FTS5 / pg_trgm + unaccent)")
+def _search_index(conn):
+    statements = POSTGRES_SEARCH_INDEX if dialect_of(conn) == POSTGRES else SQLITE_SEARCH_INDEX
+    for stmt in statements:
+        execute(conn, stmt)
+
+@migration(6, "Resumen de gasto por mes y categoría (spend_monthly)")
+def _spend_rollup(conn):
+    # Se llena en la migración 7: rollups.refill lee la vista shopping_list_all
+    execute(conn, CREATE_SPEND_MONTHLY)
+
+@migration(7, "Archivo de items cerrados (shopping_list_history + vista shopping_list_all)")
+def _history_archive(conn):
+    execute(conn, CREATE_SHOPPING_LIST_HISTORY)
+    execute(conn, CREATE_HISTORY_INDEX)
+    execute(conn, DROP_SHOPPING_LIST_ALL)
+    execute(conn, CREATE_SHOPPING_LIST_ALL)
+    # spend_monthly se recalcula desde shopping_list_all en la migración 9
+
+@migration(8, "Claves de idempotencia de la cola local (applied_operations)")
+def _applied_operations(conn):
+    execute(conn, CREATE_APPLIED_OPERATIONS)
+
+@migration(9, "Items con precio en spend_monthly (ticket promedio)")
+def _spend_priced_items(conn):
+    # Las bases creadas antes de esta versión no tienen la columna
+    if not fetchone(conn, SPEND_MONTHLY_HAS_PRICED_ITEMS):
+        execute(conn, ADD_SPEND_MONTHLY_PRICED_ITEMS)
+    rollups.refill(conn)
+
+@migration(10, "Tabla de trabajo de la importación del catálogo (catalog_seen)")
+def _catalog_seen(conn):
+    execute(conn, CREATE_CATALOG_SEEN)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def current_version(conn):
+    execute(conn, CREATE_SCHEMA_VERSION)
+    return fetchone(conn, CURRENT_VERSION)['version']
+
+def migrate(conn, log=print):
+    # Aplica las migraciones pendientes. Devuelve la lista de versiones aplicadas.
+    with transaction(conn):
+        execute(conn, CREATE_SCHEMA_VERSION)
+
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        with transaction(conn):
+            execute(conn, MIGRATION_LOCK)
+            # Releer dentro de la transacción: otro proceso pudo haberla aplicado ya
+            if fetchone(conn, CURRENT_VERSION)['version'] >= version:
+                continue
+            fn(conn)
+            execute(conn, RECORD_VERSION, (version, description))
+        log(f"MIGRACIÓN {version} aplicada: {description}")
+        applied.append(version)
+    return applied
+
+if __name__ == "__main__":
+    conn = get_connection()
+    try:
+        applied = migrate(conn)
+        print(f"Esquema en versión {current_version(conn)} (Modo Nube: {is_cloud_db()}). "
+              f"Aplicadas ahora: {applied or 'ninguna'}")
+    finally:
+        conn.close()
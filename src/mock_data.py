@@ -1,52 +1,246 @@
-import sqlite3
-import pandas as pd
-from datetime import datetime, timedelta
-from db import get_connection
-
-def insert_mock_data():
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # Check if we have products
-    c.execute("SELECT id, name, last_price_estimate FROM products LIMIT 5")
-    products = c.fetchall()
-    
-    if not products:
-        print("No products found. Load products first.")
-        return
-
-    # Mock Purchase 1 (2 weeks ago)
-    date1 = datetime.now() - timedelta(days=14)
-    # Pick first 2 products appropriately if available
-    if len(products) >= 1:
-        p = products[0] # e.g. Leche
-        price = 6.5
-        c.execute('''
-            INSERT INTO shopping_list_items (product_id, requester_id, quantity_requested, quantity_approved, status, price_real, shopping_date)
-            VALUES (?, 1, 3, 3, 'Comprado', ?, ?)
-        ''', (p['id'], price, date1))
-        
-    if len(products) >= 2:
-        p = products[1] # e.g. Pan
-        price = 12.0
-        c.execute('''
-            INSERT INTO shopping_list_items (product_id, requester_id, quantity_requested, quantity_approved, status, price_real, shopping_date)
-            VALUES (?, 1, 2, 2, 'Comprado', ?, ?)
-        ''', (p['id'], price, date1))
-
-    # Mock Purchase 2 (Added today/yesterday)
-    date2 = datetime.now() - timedelta(days=1)
-    if len(products) >= 3:
-        p = products[2] # e.g. Huevos/Others
-        price = 18.5
-        c.execute('''
-            INSERT INTO shopping_list_items (product_id, requester_id, quantity_requested, quantity_approved, status, price_real, shopping_date)
-            VALUES (?, 1, 1, 1, 'Comprado', ?, ?)
-        ''', (p['id'], price, date2))
-        
-    conn.commit()
-    conn.close()
-    print("Datos simulados insertados correctamente.")
-
-if __name__ == "__main__":
-    insert_mock_data()
+import argparse
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+import cache
+import rollups
+from datetime import datetime, timedelta
+from db import get_connection, on_commit, submit_write
+from statements import define, execute, executemany, fetchall, fetchone
+
+FIRST_PRODUCTS = define("mock.first_products", "SELECT id, name, last_price_estimate FROM products LIMIT 5")
+
+INSERT_PURCHASE = define("mock.insert_purchase", '''
+    INSERT INTO shopping_list_items (product_id, requester_id, quantity_requested, quantity_approved, status, price_real, shopping_date)
+    VALUES (?, 1, ?, ?, 'Comprado', ?, ?)
+''')
+
+def insert_mock_data():
+    conn = get_connection()
+    
+    # Check if we have products
+    products = fetchall(conn, FIRST_PRODUCTS)
+    conn.close()
+    
+    if not products:
+        print("No products found. Load products first.")
+        return
+
+    submit_write(_insert_samples, products)
+    print("Datos simulados insertados correctamente.")
+
+def _insert_samples(conn, products):
+    # Mock Purchase 1 (2 weeks ago)
+    date1 = datetime.now() - timedelta(days=14)
+    # Pick first 2 products appropriately if available
+    if len(products) >= 1:
+        p = products[0] # e.g. Leche
+        price = 6.5
+        execute(conn, INSERT_PURCHASE, (p['id'], 3, 3, price, date1))
+        
+    if len(products) >= 2:
+        p = products[1] # e.g. Pan
+        price = 12.0
+        execute(conn, INSERT_PURCHASE, (p['id'], 2, 2, price, date1))
+
+    # Mock Purchase 2 (Added today/yesterday)
+    date2 = datetime.now() - timedelta(days=1)
+    if len(products) >= 3:
+        p = products[2] # e.g. Huevos/Others
+        price = 18.5
+        execute(conn, INSERT_PURCHASE, (p['id'], 1, 1, price, date2))
+        
+    # Las compras simuladas no pasan por el comprador: recalcular el resumen
+    rollups.refill(conn)
+    on_commit(conn, cache.bump, "shopping_list_items")
+
+# --- Generador de datos sintéticos a escala ---
+# python src/mock_data.py --products 5000 --items 1000000 --seed 7
+# Productos: categoría -> (nombres base, unidad, precio base)
+MOCK_CATALOG = {
+    "Frutas": (["Plátano", "Manzana", "Naranja", "Papaya", "Fresa", "Uva", "Mandarina", "Piña"], "Kg", 6.0),
+    "Verduras": (["Tomate", "Cebolla", "Papa", "Zanahoria", "Lechuga", "Brócoli", "Pimiento", "Zapallo"], "Kg", 4.0),
+    "Lácteos": (["Leche", "Yogur", "Queso", "Mantequilla", "Crema de leche"], "Unidad", 7.0),
+    "Panadería": (["Pan", "Tostadas", "Galletas", "Keke"], "Unidad", 5.0),
+    "Carnes": (["Pollo", "Carne molida", "Bistec", "Cerdo", "Pescado"], "Kg", 22.0),
+    "Abarrotes": (["Arroz", "Azúcar", "Fideos", "Aceite", "Lentejas", "Atún", "Avena", "Harina"], "Unidad", 8.0),
+    "Limpieza": (["Detergente", "Lejía", "Jabón", "Papel higiénico", "Esponja"], "Unidad", 10.0),
+    "Bebidas": (["Agua", "Gaseosa", "Jugo", "Café", "Té"], "Unidad", 6.0),
+}
+MOCK_BRANDS = ["", "Premium", "Económico", "Orgánico", "Familiar", "Light", "Andino", "Clásico"]
+
+# Estados de los items: los de más de RECENT_DAYS días ya están cerrados
+RECENT_DAYS = 14
+RECENT_STATUS = (["Pendiente", "Aprobado", "Postergado", "Comprado", "Rechazado"], [0.35, 0.25, 0.1, 0.25, 0.05])
+CLOSED_STATUS = (["Comprado", "Rechazado"], [0.9, 0.1])
+
+INSERT_MOCK_PRODUCT = define("mock.insert_product", '''
+    INSERT INTO products (name, category, uom, last_price_estimate, active) VALUES (?, ?, ?, ?, 1)
+    ON CONFLICT (name) DO NOTHING
+''')
+
+ACTIVE_PRODUCTS = define("mock.active_products",
+    "SELECT id, category, last_price_estimate FROM products WHERE active = 1 ORDER BY id")
+
+MAX_USER_ID = define("mock.max_user_id", "SELECT COALESCE(MAX(id), 0) as id FROM users")
+
+USER_IDS = define("mock.user_ids", "SELECT id FROM users ORDER BY id")
+
+INSERT_MOCK_USER = define("mock.insert_user", '''
+    INSERT INTO users (id, username, password_hash, role) VALUES (?, ?, ?, 'Solicitante')
+    ON CONFLICT (username) DO NOTHING
+''')
+
+INSERT_MOCK_ITEM = define("mock.insert_item", '''
+    INSERT INTO shopping_list_items (product_id, requester_id, quantity_requested, quantity_approved,
+                                     status, price_real, shopping_date, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+''')
+
+def mock_products(n, rng):
+    # n productos con nombres únicos, repartidos entre categorías
+    categories = list(MOCK_CATALOG)
+    rows = []
+    for i in range(n):
+        category = categories[i % len(categories)]
+        bases, uom, price = MOCK_CATALOG[category]
+        k = i // len(categories)
+        base = bases[k % len(bases)]
+        variant = k // len(bases)
+        brand = MOCK_BRANDS[variant % len(MOCK_BRANDS)]
+        name = " ".join(part for part in (base, brand) if part)
+        if variant >= len(MOCK_BRANDS):
+            name += f" {variant // len(MOCK_BRANDS) + 1}"
+        rows.append((name, category, uom, round(price * float(rng.lognormal(0, 0.4)), 2)))
+    return rows
+
+def _ensure_requesters(conn, count):
+    ids = [row['id'] for row in fetchall(conn, USER_IDS)]
+    next_id = fetchone(conn, MAX_USER_ID)['id'] + 1
+    new_users = [(next_id + i, f"demo{next_id + i}", f"demo{next_id + i}") for i in range(count - len(ids))]
+    if new_users:
+        executemany(conn, INSERT_MOCK_USER, new_users)
+        ids += [user[0] for user in new_users]
+    return ids[:count]
+
+def mock_items(n, products, requester_ids, rng, years=3, drift=0.06, now=None):
+    # DataFrame con n items: fechas con estacionalidad (diciembre y fiestas patrias más altos,
+    # más actividad cuanto más reciente), popularidad tipo Zipf y precios que suben 'drift' al año.
+    now = now or datetime.now().replace(microsecond=0)
+    span = int(years * 365)
+    start = now - timedelta(days=span)
+
+    day = np.arange(span)
+    month = (np.datetime64(start.date()) + day).astype("datetime64[M]").astype(int) % 12 + 1
+    weight = 1 + 0.25 * np.sin(2 * np.pi * day / 365) + 0.5 * (month == 12) + 0.3 * (month == 7) + day / span
+    days = rng.choice(span, size=n, p=weight / weight.sum())
+    days.sort()     # ids crecientes en el tiempo, como en la app (y los índices se llenan en orden)
+    created = (np.datetime64(start.date(), "s") + days.astype("timedelta64[D]")
+               + rng.integers(8 * 3600, 21 * 3600, size=n).astype("timedelta64[s]"))
+
+    popularity = 1 / np.arange(1, len(products) + 1) ** 0.8
+    rng.shuffle(popularity)
+    pick = rng.choice(len(products), size=n, p=popularity / popularity.sum())
+    product_ids = products['id'].to_numpy()[pick]
+    base_price = products['price'].to_numpy()[pick]
+
+    recent = (span - days) < RECENT_DAYS
+    status = np.where(recent,
+                      rng.choice(RECENT_STATUS[0], size=n, p=RECENT_STATUS[1]),
+                      rng.choice(CLOSED_STATUS[0], size=n, p=CLOSED_STATUS[1]))
+    requested = rng.choice([0.5, 1, 1, 1, 2, 2, 3, 4, 6], size=n)
+    approved_status = np.isin(status, ["Aprobado", "Postergado", "Comprado"])
+    bought = status == "Comprado"
+
+    years_ago = (span - days) / 365
+    price = base_price * requested * (1 + drift) ** (years - years_ago) * rng.lognormal(0, 0.1, size=n)
+    shopping = np.minimum(created + rng.integers(0, 3 * 86400, size=n).astype("timedelta64[s]"),
+                          np.datetime64(now, "s"))
+
+    def as_text(values):
+        # 'YYYY-MM-DDTHH:MM:SS' -> 'YYYY-MM-DD HH:MM:SS' cambiando el carácter 10 en el buffer
+        # (np.char.replace recorre las cadenas una a una)
+        text = np.datetime_as_string(values, unit="s")
+        if not len(text):
+            return text
+        text.view(np.uint32).reshape(len(text), -1)[:, 10] = ord(" ")
+        return text
+
+    shopping_date = np.full(n, None, dtype=object)
+    shopping_date[bought] = as_text(shopping[bought])    # solo se formatean las compradas
+
+    frame = pd.DataFrame({
+        "product_id": product_ids,
+        "requester_id": rng.choice(requester_ids, size=n),
+        "quantity_requested": requested,
+        "quantity_approved": np.where(approved_status, requested, np.nan),
+        "status": status,
+        "price_real": np.where(bought, np.round(price, 2), np.nan),
+        "shopping_date": shopping_date,
+        "created_at": as_text(created),
+    })
+    return frame
+
+def _insert_catalog(conn, products, requesters, page_size):
+    executemany(conn, INSERT_MOCK_PRODUCT, products, page_size=page_size)
+    return _ensure_requesters(conn, requesters)
+
+def _insert_items(conn, rows, page_size):
+    executemany(conn, INSERT_MOCK_ITEM, rows, page_size=page_size, native=True)
+
+def generate(products=1000, items=100000, seed=42, requesters=5, years=3, drift=0.06,
+             batch=10000, now=None, conn=None, log=print):
+    # Inserta datos sintéticos en la base actual (SQLite o Postgres). Determinista para una
+    # semilla (y 'now', si se fija: las fechas se cuentan hacia atrás desde ahí).
+    rng = np.random.default_rng(seed)
+    own = conn is None
+    conn = conn or get_connection()
+    start = time.perf_counter()
+    try:
+        # Cada lote es una escritura del escritor único: la app puede seguir escribiendo mientras tanto
+        requester_ids = submit_write(_insert_catalog, mock_products(products, rng), requesters, batch)
+        catalog = pd.DataFrame([dict(row) for row in fetchall(conn, ACTIVE_PRODUCTS)])
+        catalog['price'] = pd.to_numeric(catalog['last_price_estimate'], errors='coerce').fillna(0.0)
+        fallback = catalog['category'].map(lambda c: MOCK_CATALOG.get(c, (None, None, 5.0))[2])
+        catalog['price'] = catalog['price'].where(catalog['price'] > 0, fallback)
+        log(f"MOCK: {len(catalog)} productos, {len(requester_ids)} solicitantes")
+
+        frame = mock_items(items, catalog, requester_ids, rng, years=years, drift=drift, now=now)
+        # Columnas como listas de Python (NaN -> NULL) y filas por zip: mucho más rápido que itertuples
+        columns = [[None if v != v else v for v in frame[c].tolist()] if frame[c].hasnans else frame[c].tolist()
+                   for c in frame.columns]
+        for offset in range(0, items, batch):
+            rows = list(zip(*(column[offset:offset + batch] for column in columns)))
+            submit_write(_insert_items, rows, batch)
+            log(f"MOCK: {min(offset + batch, items)}/{items} items")
+        submit_write(rollups.refill)
+    finally:
+        if own:
+            conn.close()
+    cache.bump("products", "users", "shopping_list_items")
+    seconds = time.perf_counter() - start
+    log(f"MOCK: {items} items generados en {seconds:.1f}s ({items / max(seconds, 1e-9):.0f} filas/s)")
+    return {"products": len(catalog), "items": items, "requesters": len(requester_ids), "seconds": seconds}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Datos simulados. Sin --items: las 3 compras de ejemplo.")
+    parser.add_argument("--products", type=int, default=1000, help="productos a crear (por categorías)")
+    parser.add_argument("--items", type=int, default=None, help="items de lista a generar")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requesters", type=int, default=5, help="solicitantes (se crean demoN si faltan)")
+    parser.add_argument("--years", type=float, default=3, help="años de historial")
+    parser.add_argument("--drift", type=float, default=0.06, help="subida anual de precios")
+    parser.add_argument("--batch", type=int, default=10000, help="filas por lote de inserción")
+    args = parser.parse_args(argv)
+
+    if args.items is None:
+        insert_mock_data()
+        return
+    from startup import ensure_initialized
+    ensure_initialized()
+    generate(products=args.products, items=args.items, seed=args.seed, requesters=args.requesters,
+             years=args.years, drift=args.drift, batch=args.batch)
+
+if __name__ == "__main__":
+    main()
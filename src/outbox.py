@@ -0,0 +1,235 @@
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import psycopg2
+from db import PoolExhaustedError, submit_write
+from statements import define, execute
+
+# Cola local de escrituras (outbox) para operaciones que no se pueden perder, como la
+# confirmación de una compra. La operación se guarda primero en un SQLite local
+# (data/outbox.db) y la UI vuelve enseguida; un hilo la aplica después en la base
+# principal, con reintentos y espera creciente si la conexión falla.
+# Cada operación lleva una clave única: la base principal la registra en
+# applied_operations en la misma transacción, así un reintento nunca la aplica dos veces.
+# Solo los errores de conexión se reintentan; las que fallan por otra cosa (o agotan
+# MAX_ATTEMPTS) quedan como 'failed' y se ven en el panel de administración.
+
+OUTBOX_PATH = os.path.join("data", "outbox.db")
+FLUSH_INTERVAL = 5      # Segundos entre revisiones de la cola (además de al encolar)
+FLUSH_BATCH = 50        # Operaciones por pasada
+BACKOFF_BASE = 2        # Primer reintento a los 2s, luego 4, 8, ...
+BACKOFF_MAX = 300
+MAX_ATTEMPTS = 10       # Reintentos por conexión antes de darla por fallida
+
+PENDING, FAILED = "pending", "failed"
+
+# Errores de la base/conexión: vale la pena reintentar (y no seguir con el resto de la cola)
+TRANSIENT_ERRORS = (sqlite3.OperationalError, psycopg2.OperationalError, psycopg2.InterfaceError,
+                    PoolExhaustedError, TimeoutError, ConnectionError)
+
+# Tipo de operación -> "módulo:función", llamada como función(conn, *payload)
+HANDLERS = {
+    "checkout": "ui.buyer:commit_purchase",
+}
+
+RECORD_OPERATION = define("outbox.record_operation", '''
+    INSERT INTO applied_operations (key, kind) VALUES (?, ?)
+    ON CONFLICT (key) DO NOTHING
+''')
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_flusher = None
+_stats = {"applied": 0, "applied_items": 0, "duplicates": 0, "failures": 0, "last_error": None, "last_flush": None}
+
+def _connect():
+    os.makedirs(os.path.dirname(OUTBOX_PATH), exist_ok=True)
+    conn = sqlite3.connect(OUTBOX_PATH, timeout=15)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            last_error TEXT,
+            status TEXT NOT NULL DEFAULT 'pending'
+        )
+    ''')
+    # Colas creadas antes de que existiera el estado 'failed'
+    columns = [row['name'] for row in conn.execute("PRAGMA table_info(outbox)")]
+    if "status" not in columns:
+        conn.execute("ALTER TABLE outbox ADD COLUMN status TEXT NOT NULL DEFAULT 'pending'")
+    return conn
+
+def enqueue(kind, *payload, key=None):
+    # Guarda la operación en disco y despierta al hilo que la aplica. Devuelve la clave.
+    if kind not in HANDLERS:
+        raise ValueError(f"Operación desconocida: {kind}")
+    key = key or uuid.uuid4().hex
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO outbox (key, kind, payload, created_at, next_attempt) "
+                             "VALUES (?, ?, ?, ?, ?)", (key, kind, json.dumps(payload), now, now))
+        finally:
+            conn.close()
+    start_flusher()
+    _wake.set()
+    return key
+
+def _ops(status, kind=None):
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute("SELECT * FROM outbox WHERE status = ? ORDER BY created_at", (status,)).fetchall()
+        finally:
+            conn.close()
+    ops = [dict(row, payload=json.loads(row['payload'])) for row in rows]
+    return [op for op in ops if kind is None or op['kind'] == kind]
+
+def pending(kind=None):
+    # Operaciones aún no aplicadas (con su payload ya decodificado)
+    return _ops(PENDING, kind)
+
+def failed(kind=None):
+    # Operaciones descartadas: error no transitorio o MAX_ATTEMPTS agotados
+    return _ops(FAILED, kind)
+
+def retry_failed(keys=None):
+    # Vuelve a encolar las fallidas (todas o las indicadas)
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                sql = "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt = ? WHERE status = 'failed'"
+                if keys is None:
+                    conn.execute(sql, (time.time(),))
+                else:
+                    conn.executemany(sql + " AND key = ?", [(time.time(), key) for key in keys])
+        finally:
+            conn.close()
+    _wake.set()
+
+def discard_failed(keys=None):
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                sql = "DELETE FROM outbox WHERE status = 'failed'"
+                if keys is None:
+                    conn.execute(sql)
+                else:
+                    conn.executemany(sql + " AND key = ?", [(key,) for key in keys])
+        finally:
+            conn.close()
+
+def _resolve(kind):
+    module_name, func_name = HANDLERS[kind].split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+def _apply(conn, key, kind, payload):
+    # Corre dentro de la transacción de submit_write: la marca y los cambios van juntos.
+    # Devuelve lo que devuelva el handler (filas cambiadas), o None si ya estaba aplicada.
+    cur = execute(conn, RECORD_OPERATION, (key, kind))
+    inserted = cur.rowcount
+    cur.close()
+    if inserted == 0:
+        return None
+    return _resolve(kind)(conn, *payload) or 0
+
+def flush(limit=FLUSH_BATCH):
+    # Aplica las operaciones pendientes que ya toca reintentar. Devuelve cuántas se aplicaron.
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        try:
+            due = conn.execute("SELECT * FROM outbox WHERE status = 'pending' AND next_attempt <= ? "
+                               "ORDER BY created_at LIMIT ?", (now, limit)).fetchall()
+        finally:
+            conn.close()
+
+    applied = 0
+    for op in due:
+        transient = False
+        try:
+            result = submit_write(_apply, op['key'], op['kind'], json.loads(op['payload']))
+            error = None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+            transient = isinstance(e, TRANSIENT_ERRORS)
+
+        attempts = op['attempts'] + (error is not None)
+        give_up = error is not None and (not transient or attempts >= MAX_ATTEMPTS)
+        with _lock:
+            conn = _connect()
+            try:
+                with conn:
+                    if error is None:
+                        conn.execute("DELETE FROM outbox WHERE key = ?", (op['key'],))
+                    elif give_up:
+                        conn.execute("UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? "
+                                     "WHERE key = ?", (attempts, error, op['key']))
+                    else:
+                        delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+                        conn.execute("UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? "
+                                     "WHERE key = ?", (attempts, time.time() + delay, error, op['key']))
+            finally:
+                conn.close()
+            if error is None:
+                applied += 1
+                if result is None:
+                    _stats["duplicates"] += 1
+                else:
+                    _stats["applied"] += 1
+                    _stats["applied_items"] += result
+            else:
+                _stats["failures"] += 1
+                _stats["last_error"] = error
+                state = "descartada" if give_up else "se reintentará"
+                print(f"OUTBOX: {op['kind']} {op['key']} falló (intento {attempts}, {state}): {error}")
+        if transient:
+            # Si la base no responde, no insistir con el resto hasta la próxima pasada.
+            # Un error propio de la operación no frena a las que vienen detrás.
+            break
+    _stats["last_flush"] = time.time()
+    return applied
+
+def _flush_loop():
+    while True:
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            flush()
+        except Exception as e:
+            print(f"OUTBOX: error revisando la cola: {e}")
+
+def start_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name="outbox-flusher", daemon=True)
+            _flusher.start()
+
+def wake():
+    _wake.set()
+
+def outbox_stats():
+    ops = pending()
+    stats = dict(_stats)
+    stats["pending"] = len(ops)
+    stats["retrying"] = sum(1 for op in ops if op['attempts'] > 0)
+    stats["failed"] = len(failed())
+    stats["oldest"] = time.time() - ops[0]['created_at'] if ops else None
+    return stats
@@ -0,0 +1,205 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Perfil de cada recarga (rerun) de Streamlit, por fases:
+#   init (migraciones/usuarios), auth, sql (todas las consultas, vía querylog), pandas,
+#   render (data_editor, gráficos, tablas) y other (el resto del script).
+# Cada fase cuenta solo su tiempo propio: lo que corre dentro de una fase anidada
+# (o una consulta dentro de "pandas") se descuenta de la de fuera.
+# Se agrega por (vista, rol) y se exporta a un archivo que lee el scraper local:
+# formato Prometheus (texto), o JSON si la ruta termina en .json.
+
+METRICS_PATH = os.environ.get("METRICS_PATH", os.path.join("data", "metrics.prom"))
+EXPORT_INTERVAL = 10    # Segundos mínimos entre escrituras del archivo de métricas
+PROFILES_DIR = os.path.join("data", "profiles")
+
+# Límites de las cubetas del histograma de duración de la recarga (segundos)
+BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+_current = ContextVar("profiler_run", default=None)
+_lock = threading.Lock()
+_stats = {}     # (vista, rol) -> acumulados
+_state = {"capture_requested": False, "last_capture": None, "last_export": 0.0}
+
+class Run:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.stack = []     # [nombre, inicio, tiempo de hijos]
+        self.profile = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        if self.stack:
+            self.stack[-1][2] += seconds
+
+def start_run():
+    # Al principio de main.py. Si se pidió una captura, esta recarga corre bajo cProfile.
+    run = Run()
+    with _lock:
+        capture = _state["capture_requested"]
+        _state["capture_requested"] = False
+    if capture:
+        run.profile = cProfile.Profile()
+        run.profile.enable()
+    _current.set(run)
+    return run
+
+@contextmanager
+def span(phase):
+    run = _current.get()
+    if run is None:
+        yield
+        return
+    frame = [phase, time.perf_counter(), 0.0]
+    run.stack.append(frame)
+    try:
+        yield
+    finally:
+        run.stack.pop()
+        elapsed = time.perf_counter() - frame[1]
+        run.phases[phase] = run.phases.get(phase, 0.0) + elapsed - frame[2]
+        if run.stack:
+            run.stack[-1][2] += elapsed
+
+def record_sql(seconds):
+    # Lo llama querylog por cada sentencia terminada
+    run = _current.get()
+    if run is not None:
+        run.add("sql", seconds)
+
+def finish_run(view, role):
+    run = _current.get()
+    if run is None:
+        return None
+    _current.set(None)
+    total = time.perf_counter() - run.start
+    if run.profile is not None:
+        run.profile.disable()
+        _save_capture(run.profile, view, role, total)
+    phases = dict(run.phases)
+    phases["other"] = max(total - sum(phases.values()), 0.0)
+
+    with _lock:
+        entry = _stats.get((view, role))
+        if entry is None:
+            entry = _stats[(view, role)] = {"count": 0, "seconds": 0.0, "max": 0.0, "phases": {},
+                                            "buckets": [0] * len(BUCKETS)}
+        entry["count"] += 1
+        entry["seconds"] += total
+        entry["max"] = max(entry["max"], total)
+        for phase, seconds in phases.items():
+            entry["phases"][phase] = entry["phases"].get(phase, 0.0) + seconds
+        for i, limit in enumerate(BUCKETS):
+            if total <= limit:
+                entry["buckets"][i] += 1
+        export_due = time.time() - _state["last_export"] >= EXPORT_INTERVAL
+        if export_due:
+            _state["last_export"] = time.time()
+    if export_due:
+        try:
+            write_metrics()
+        except OSError as e:
+            print(f"No se pudieron exportar las métricas: {e}")
+    return total, phases
+
+def request_capture():
+    # La próxima recarga (de cualquier sesión) se perfila con cProfile
+    with _lock:
+        _state["capture_requested"] = True
+
+def _save_capture(profile, view, role, total):
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    name = time.strftime("rerun-%Y%m%d-%H%M%S") + f"-{view}.prof"
+    path = os.path.join(PROFILES_DIR, name)
+    profile.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(30)
+    with _lock:
+        _state["last_capture"] = {"path": path, "view": view, "role": role, "seconds": total,
+                                  "summary": out.getvalue()}
+
+def last_capture():
+    with _lock:
+        return _state["last_capture"]
+
+def rerun_stats():
+    # Una fila por (vista, rol) con los promedios por fase
+    with _lock:
+        items = [(key, dict(entry, phases=dict(entry["phases"]))) for key, entry in _stats.items()]
+    rows = []
+    for (view, role), entry in sorted(items):
+        row = {"view": view, "role": role, "reruns": entry["count"],
+               "avg_ms": round(1000 * entry["seconds"] / entry["count"], 1),
+               "max_ms": round(1000 * entry["max"], 1)}
+        for phase, seconds in sorted(entry["phases"].items()):
+            row[f"{phase}_ms"] = round(1000 * seconds / entry["count"], 1)
+        rows.append(row)
+    return rows
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+def metrics():
+    # Todo lo exportable, como dict (base del JSON y del texto Prometheus)
+    import cache
+    import querylog
+    with _lock:
+        reruns = {f"{view}|{role}": dict(entry, phases=dict(entry["phases"]), buckets=list(entry["buckets"]))
+                  for (view, role), entry in _stats.items()}
+    return {"ts": time.time(), "buckets": BUCKETS, "reruns": reruns,
+            "sql": querylog.view_stats(), "cache": cache.cache_stats()}
+
+def prometheus_text(data=None):
+    data = data or metrics()
+    lines = [
+        "# HELP compras_rerun_seconds Duración de cada recarga de Streamlit",
+        "# TYPE compras_rerun_seconds histogram",
+    ]
+    for key, entry in sorted(data["reruns"].items()):
+        view, role = key.split("|", 1)
+        labels = f'view="{_label(view)}",role="{_label(role)}"'
+        for limit, n in zip(data["buckets"], entry["buckets"]):
+            lines.append(f'compras_rerun_seconds_bucket{{{labels},le="{limit}"}} {n}')
+        lines.append(f'compras_rerun_seconds_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+        lines.append(f"compras_rerun_seconds_sum{{{labels}}} {entry['seconds']:.6f}")
+        lines.append(f"compras_rerun_seconds_count{{{labels}}} {entry['count']}")
+    lines += ["# HELP compras_rerun_phase_seconds_total Tiempo propio por fase de la recarga",
+              "# TYPE compras_rerun_phase_seconds_total counter"]
+    for key, entry in sorted(data["reruns"].items()):
+        view, role = key.split("|", 1)
+        for phase, seconds in sorted(entry["phases"].items()):
+            lines.append(f'compras_rerun_phase_seconds_total{{view="{_label(view)}",role="{_label(role)}",'
+                         f'phase="{_label(phase)}"}} {seconds:.6f}')
+    lines += ["# HELP compras_sql_queries_total Consultas SQL por vista",
+              "# TYPE compras_sql_queries_total counter"]
+    for view, v in sorted(data["sql"].items()):
+        lines.append(f'compras_sql_queries_total{{view="{_label(view)}"}} {v["count"]}')
+    lines += ["# HELP compras_sql_seconds_total Tiempo en consultas SQL por vista",
+              "# TYPE compras_sql_seconds_total counter"]
+    for view, v in sorted(data["sql"].items()):
+        lines.append(f'compras_sql_seconds_total{{view="{_label(view)}"}} {v["seconds"]:.6f}')
+    cs = data["cache"]
+    lines += ["# TYPE compras_cache_hits_total counter", f"compras_cache_hits_total {cs['hits']}",
+              "# TYPE compras_cache_misses_total counter", f"compras_cache_misses_total {cs['misses']}",
+              "# TYPE compras_cache_bytes gauge", f"compras_cache_bytes {cs['bytes']}"]
+    return "\n".join(lines) + "\n"
+
+def write_metrics(path=None):
+    # Escritura atómica (archivo temporal + rename) para que el scraper no lea a medias
+    path = path or METRICS_PATH
+    data = metrics()
+    text = json.dumps(data, default=str) if path.endswith(".json") else prometheus_text(data)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return path
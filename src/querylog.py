@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import profiler
+
+# Tiempos de las consultas SQL, para ambos backends (los cursores de db.py llaman a QueryTimer).
+# Por cada sentencia normalizada se guarda un histograma de latencias, filas y desde qué vista
+# se llamó; las que superan SLOW_QUERY_MS van además a un log JSONL, opcionalmente con su EXPLAIN.
+
+SLOW_QUERY_MS = 250
+SLOW_LOG_PATH = os.path.join("data", "slow_queries.jsonl")
+EXPLAIN_SLOW = False    # ajuste de todo el proceso: se cambia con set_explain_slow()
+
+# Límites superiores de cada cubeta del histograma (ms); la última es "más que eso"
+BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000]
+
+# Vista que está ejecutando la consulta (main.py la fija al enrutar)
+current_view = ContextVar("current_view", default="-")
+
+_lock = threading.Lock()
+_stats = {}      # sql normalizado -> acumulados
+_views = {}      # vista -> {"count", "seconds"}
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s|\?\d*")
+_SPACES = re.compile(r"\s+")
+
+def normalize(sql):
+    # Mismo texto para la misma sentencia con distintos valores
+    return _SPACES.sub(" ", _LITERALS.sub("?", sql)).strip()
+
+def set_explain_slow(enabled):
+    # Lo llama el botón del panel de diagnóstico: afecta a todas las sesiones
+    global EXPLAIN_SLOW
+    EXPLAIN_SLOW = bool(enabled)
+
+@contextmanager
+def view_context(view):
+    token = current_view.set(view)
+    try:
+        yield
+    finally:
+        current_view.reset(token)
+
+class QueryTimer:
+    # Una ejecución: se suman el execute y los fetch hasta que el cursor la cierra
+    __slots__ = ("sql", "params", "conn", "view", "seconds", "rows", "error", "done")
+
+    def __init__(self, sql, params, conn):
+        self.sql = sql
+        self.params = params
+        self.conn = conn
+        self.view = current_view.get()
+        self.seconds = 0.0
+        self.rows = 0
+        self.error = None
+        self.done = False
+
+    def add(self, seconds, rows=0):
+        self.seconds += seconds
+        self.rows += rows
+
+    def finish(self):
+        if self.done:
+            return
+        self.done = True
+        _record(self)
+
+def _bucket(ms):
+    for i, limit in enumerate(BUCKETS_MS):
+        if ms <= limit:
+            return i
+    return len(BUCKETS_MS)
+
+def _record(timer):
+    ms = timer.seconds * 1000
+    key = normalize(timer.sql)
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            entry = _stats[key] = {"count": 0, "errors": 0, "seconds": 0.0, "max_ms": 0.0, "rows": 0,
+                                   "buckets": [0] * (len(BUCKETS_MS) + 1), "views": Counter()}
+        entry["count"] += 1
+        entry["errors"] += timer.error is not None
+        entry["seconds"] += timer.seconds
+        entry["max_ms"] = max(entry["max_ms"], ms)
+        entry["rows"] += timer.rows
+        entry["buckets"][_bucket(ms)] += 1
+        entry["views"][timer.view] += 1
+        view = _views.setdefault(timer.view, {"count": 0, "seconds": 0.0})
+        view["count"] += 1
+        view["seconds"] += timer.seconds
+    profiler.record_sql(timer.seconds)
+    if ms >= SLOW_QUERY_MS:
+        _log_slow(timer, key, ms)
+
+def _explain(timer):
+    # Plan de la consulta lenta (solo lecturas). Se ejecuta sin instrumentar.
+    if not re.match(r"\s*(SELECT|WITH)\b", timer.sql, re.IGNORECASE):
+        return None
+    try:
+        if getattr(timer.conn, "dialect", None) == "postgres":
+            cur = timer.conn.conn.cursor()
+            cur.execute("EXPLAIN " + timer.sql, timer.params)
+            plan = [row[0] for row in cur.fetchall()]
+            cur.close()
+        else:
+            # Cursor sqlite3 normal, no el SQLiteCursor instrumentado de db.py
+            cur = sqlite3.Connection.cursor(timer.conn, sqlite3.Cursor)
+            cur.execute("EXPLAIN QUERY PLAN " + timer.sql, timer.params or ())
+            plan = [row[-1] for row in cur.fetchall()]
+            cur.close()
+        return plan
+    except Exception as e:
+        return [f"(sin plan: {e})"]
+
+def _log_slow(timer, key, ms):
+    entry = {"ts": time.time(), "view": timer.view, "ms": round(ms, 1), "rows": timer.rows,
+             "error": timer.error, "sql": key}
+    if EXPLAIN_SLOW and timer.conn is not None and timer.error is None:
+        entry["plan"] = _explain(timer)
+    try:
+        os.makedirs(os.path.dirname(SLOW_LOG_PATH), exist_ok=True)
+        with _lock, open(SLOW_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        print(f"No se pudo escribir el log de consultas lentas: {e}")
+
+def _percentile(buckets, fraction):
+    # Estimación por cubetas: devuelve el límite superior de la cubeta que lo contiene
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    seen = 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= fraction * total:
+            return float(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else float("inf")
+    return float("inf")
+
+def query_stats():
+    # Una fila por sentencia, de mayor a menor tiempo total
+    with _lock:
+        items = [(key, dict(entry, buckets=list(entry["buckets"]), views=Counter(entry["views"])))
+                 for key, entry in _stats.items()]
+    result = []
+    for key, entry in items:
+        result.append({
+            "sql": key,
+            "count": entry["count"],
+            "errors": entry["errors"],
+            "total_ms": round(entry["seconds"] * 1000, 1),
+            "avg_ms": round(entry["seconds"] * 1000 / entry["count"], 2),
+            "p50_ms": _percentile(entry["buckets"], 0.5),
+            "p95_ms": _percentile(entry["buckets"], 0.95),
+            "max_ms": round(entry["max_ms"], 1),
+            "rows": entry["rows"],
+            "views": ", ".join(f"{v} ({n})" for v, n in entry["views"].most_common()),
+            "buckets": entry["buckets"],
+        })
+    result.sort(key=lambda row: row["total_ms"], reverse=True)
+    return result
+
+def view_stats():
+    with _lock:
+        return {view: dict(v) for view, v in _views.items()}
+
+def slow_queries(limit=50):
+    # Las últimas entradas del log de consultas lentas, la más reciente primero
+    if not os.path.exists(SLOW_LOG_PATH):
+        return []
+    with open(SLOW_LOG_PATH, encoding="utf-8") as f:
+        lines = deque(f, maxlen=limit)
+    return [json.loads(line) for line in reversed(lines) if line.strip()]
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _views.clear()
@@ -0,0 +1,73 @@
+import cache
+from db import get_connection, on_commit, transaction
+from statements import define, execute, Array
+
+# Resumen de gasto por mes y categoría (tabla spend_monthly, ver migraciones).
+# Se actualiza al confirmar cada compra y se puede reconstruir desde el historial
+# (shopping_list_all: items vivos + archivados).
+# category = '' para productos sin categoría (forma parte de la clave primaria).
+# priced_items cuenta solo los items con precio (para el ticket promedio).
+
+_SPEND_SELECT = '''
+    SELECT strftime('%Y-%m', s.shopping_date) as month, COALESCE(p.category, '') as category,
+           SUM(COALESCE(s.price_real, 0)) as total, COUNT(*) as items,
+           COUNT(s.price_real) as priced_items
+    FROM {source} s
+    JOIN products p ON p.id = s.product_id
+    WHERE s.status = 'Comprado' {where}
+    GROUP BY 1, 2
+'''
+
+_SPEND_SELECT_PG = _SPEND_SELECT.replace("strftime('%Y-%m', s.shopping_date)", "to_char(s.shopping_date, 'YYYY-MM')")
+
+_SPEND_ADD = '''
+    INSERT INTO spend_monthly (month, category, total, items, priced_items)
+    {select}
+    ON CONFLICT (month, category) DO UPDATE
+    SET total = spend_monthly.total + excluded.total, items = spend_monthly.items + excluded.items,
+        priced_items = spend_monthly.priced_items + excluded.priced_items
+'''
+
+# Suma los items recién comprados (lista de ids) a sus meses/categorías
+SPEND_ADD_ITEMS = define("rollups.spend_add_items",
+    _SPEND_ADD.format(select=_SPEND_SELECT.format(source="shopping_list_items", where="AND s.id IN (SELECT value FROM json_each(?))")),
+    postgres=_SPEND_ADD.format(select=_SPEND_SELECT_PG.format(source="shopping_list_items", where="AND s.id = ANY(?)")))
+
+SPEND_CLEAR = define("rollups.spend_clear", "DELETE FROM spend_monthly")
+
+SPEND_REFILL = define("rollups.spend_refill",
+    "INSERT INTO spend_monthly (month, category, total, items, priced_items)" + _SPEND_SELECT.format(source="shopping_list_all", where=""),
+    postgres="INSERT INTO spend_monthly (month, category, total, items, priced_items)" + _SPEND_SELECT_PG.format(source="shopping_list_all", where=""))
+
+SPEND_MONTHLY = define("rollups.spend_monthly", '''
+    SELECT month as "Mes", category as "Categoría", total as "Total", items as "Items",
+           priced_items as "Con precio"
+    FROM spend_monthly
+    ORDER BY month, category
+''')
+
+def add_purchases(conn, item_ids):
+    # Llamar dentro de la transacción que marcó los items como 'Comprado'
+    if len(item_ids):
+        execute(conn, SPEND_ADD_ITEMS, (Array(item_ids),)).close()
+
+def refill(conn):
+    # Recalcula todo desde el historial (sin transacción propia: la pone quien llama;
+    # desde la app, submit_write(refill))
+    execute(conn, SPEND_CLEAR).close()
+    execute(conn, SPEND_REFILL).close()
+    on_commit(conn, cache.bump, "spend_monthly")
+
+def rebuild(conn=None):
+    own = conn is None
+    conn = conn or get_connection()
+    try:
+        with transaction(conn):
+            refill(conn)
+    finally:
+        if own:
+            conn.close()
+
+if __name__ == "__main__":
+    rebuild()
+    print("Resumen de gasto reconstruido.")
@@ -0,0 +1,76 @@
+import re
+from cache import cached_frame
+from statements import define, dialect_of, POSTGRES
+
+# Búsqueda de productos en la base de datos (índice mantenido junto a products):
+#   SQLite:   tabla FTS5 'products_fts' con unicode61 remove_diacritics (platano = Plátano),
+#             cada palabra como prefijo ("plat" encuentra "Plátano").
+#   Postgres: pg_trgm + unaccent sobre el nombre (tolera acentos y errores de tipeo).
+# Devuelve las filas del catálogo del requester, ordenadas por relevancia y limitadas.
+
+SEARCH_LIMIT = 200
+
+SEARCH_PRODUCTS = define("search.products", '''
+    WITH matches AS (
+        SELECT f.rowid AS id, f.rank AS score
+        FROM products_fts f
+        JOIN products p ON p.id = f.rowid
+        WHERE products_fts MATCH ? AND p.active = 1 AND (? IS NULL OR p.category = ?)
+        ORDER BY f.rank
+        LIMIT ?
+    )
+    SELECT 
+        p.id, 
+        p.name as "Producto", 
+        p.category as "Categoría", 
+        p.uom as "Unidad",
+        SUM(s.quantity_requested) as "Solicitado"
+    FROM matches m
+    JOIN products p ON p.id = m.id
+    LEFT JOIN shopping_list_items s 
+        ON p.id = s.product_id 
+        AND s.status = 'Pendiente'
+    GROUP BY p.id
+    ORDER BY MIN(m.score)
+''', postgres='''
+    WITH matches AS (
+        SELECT p.id, similarity(f_unaccent(lower(p.name)), f_unaccent(lower(?))) AS score
+        FROM products p
+        WHERE (f_unaccent(lower(p.name)) % f_unaccent(lower(?))
+               OR f_unaccent(lower(p.name)) LIKE '%' || f_unaccent(lower(?)) || '%')
+          AND p.active = 1 AND (? IS NULL OR p.category = ?)
+        ORDER BY score DESC
+        LIMIT ?
+    )
+    SELECT 
+        p.id, 
+        p.name as "Producto", 
+        p.category as "Categoría", 
+        p.uom as "Unidad",
+        SUM(s.quantity_requested) as "Solicitado"
+    FROM matches m
+    JOIN products p ON p.id = m.id
+    LEFT JOIN shopping_list_items s 
+        ON p.id = s.product_id 
+        AND s.status = 'Pendiente'
+    GROUP BY p.id
+    ORDER BY MAX(m.score) DESC
+''')
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+def fts_query(term):
+    # "leche entera" -> '"leche"* "entera"*' (todas las palabras, como prefijo)
+    words = _WORDS.findall(term or "")
+    return " ".join('"' + w.replace('"', '""') + '"*' for w in words)
+
+def search_products(conn, term, category=None, limit=SEARCH_LIMIT):
+    if dialect_of(conn) == POSTGRES:
+        term = term.strip()
+        params = (term, term, term, category, category, limit)
+    else:
+        query = fts_query(term)
+        if not query:
+            return None
+        params = (query, category, category, limit)
+    return cached_frame(conn, SEARCH_PRODUCTS, params, tables=("products", "shopping_list_items"))
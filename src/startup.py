@@ -0,0 +1,35 @@
+import threading
+import time
+import cache
+import outbox
+from auth import sync_users_to_db
+from db import init_db
+from migrations import SCHEMA_VERSION
+
+# Inicialización una sola vez por proceso (Streamlit re-ejecuta main.py en cada
+# interacción de cada sesión). Se repite solo si cambia la versión del esquema
+# (p.ej. tras desplegar una migración nueva) o si un admin la fuerza.
+
+_lock = threading.Lock()
+_state = {"version": None, "runs": 0, "last_run": None, "seconds": None}
+
+def ensure_initialized(force=False):
+    # Devuelve True si esta llamada ejecutó la inicialización
+    if not force and _state["version"] == SCHEMA_VERSION:
+        return False
+    with _lock:
+        if not force and _state["version"] == SCHEMA_VERSION:
+            return False
+        start = time.perf_counter()
+        init_db()
+        sync_users_to_db()
+        # El esquema pudo cambiar: nada de lo cacheado sirve
+        cache.clear()
+        # Aplica lo que haya quedado en la cola local (p.ej. tras un reinicio)
+        outbox.start_flusher()
+        _state.update(version=SCHEMA_VERSION, runs=_state["runs"] + 1,
+                      last_run=time.time(), seconds=time.perf_counter() - start)
+        return True
+
+def startup_state():
+    return dict(_state)
@@ -0,0 +1,212 @@
+import json
+import re
+from itertools import count, islice
+
+# Dialectos soportados
+SQLITE = "sqlite"
+POSTGRES = "postgres"
+
+# Las sentencias se escriben una sola vez en estilo SQLite ('?' como parámetro)
+# y se traducen a cada backend la primera vez que se usan.
+_POSTGRES_REWRITES = [
+    ("datetime('now')", "NOW()"),
+    ("INTEGER PRIMARY KEY AUTOINCREMENT", "SERIAL PRIMARY KEY"),
+]
+
+# Grupo 'VALUES (?, ?, ...)' que execute_values sustituye por muchas filas
+_VALUES_GROUP = re.compile(r"VALUES\s*(\((?:[^()]|\([^()]*\))*\))", re.IGNORECASE)
+
+# Literales de texto, identificadores entre comillas, parámetros y '%'
+_TOKENS = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|\?|%")
+
+def _to_postgres(sql):
+    for old, new in _POSTGRES_REWRITES:
+        sql = sql.replace(old, new)
+
+    def replace(match):
+        token = match.group(0)
+        if token == "?":
+            return "%s"
+        # psycopg2 interpreta '%' en todo el texto (también dentro de literales)
+        return token.replace("%", "%%")
+
+    return _TOKENS.sub(replace, sql)
+
+_TRANSLATORS = {
+    SQLITE: lambda sql: sql,
+    POSTGRES: _to_postgres,
+}
+
+class Statement:
+    def __init__(self, name, sql, overrides=None):
+        self.name = name
+        self.sql = sql
+        self.overrides = overrides or {}
+        self._compiled = {}
+
+    def compile(self, dialect):
+        compiled = self._compiled.get(dialect)
+        if compiled is None:
+            source = self.overrides.get(dialect, self.sql)
+            compiled = self._compiled[dialect] = _TRANSLATORS[dialect](source)
+        return compiled
+
+    def compile_batch(self, dialect):
+        # En Postgres las sentencias con 'VALUES (?, ...)' se envían con execute_values:
+        # devuelve (sql con 'VALUES %s', plantilla de fila). En SQLite va a executemany.
+        key = dialect + ":batch"
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            sql = self.compile(dialect)
+            match = _VALUES_GROUP.search(sql) if dialect == POSTGRES else None
+            if match:
+                compiled = (sql[:match.start(1)] + "%s" + sql[match.end(1):], match.group(1))
+            else:
+                compiled = (sql, None)
+            self._compiled[key] = compiled
+        return compiled
+
+    def __repr__(self):
+        return f"<Statement {self.name}>"
+
+_registry = {}
+
+def define(name, sql, postgres=None, sqlite=None):
+    # 'postgres' / 'sqlite' permiten dar una versión específica para ese backend
+    # (también en estilo '?'). Redefinir reemplaza: Streamlit recarga módulos al editarlos.
+    overrides = {}
+    if postgres is not None:
+        overrides[POSTGRES] = postgres
+    if sqlite is not None:
+        overrides[SQLITE] = sqlite
+    stmt = Statement(name, sql, overrides)
+    _registry[name] = stmt
+    return stmt
+
+def get(name):
+    return _registry[name]
+
+def registered():
+    return dict(_registry)
+
+def dialect_of(conn):
+    return getattr(conn, "dialect", SQLITE)
+
+def _plain(value):
+    # Escalares de numpy/pandas (p.ej. ids que vienen de un DataFrame) -> tipos de Python
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        return value.item()
+    return value
+
+class Array:
+    # Lista de valores como UN solo parámetro, para no generar SQL distinto según el tamaño:
+    #   Postgres: "col = ANY(?)"                          -> lista (psycopg2 la adapta a ARRAY)
+    #   SQLite:   "col IN (SELECT value FROM json_each(?))" -> texto JSON
+    __slots__ = ("values",)
+
+    def __init__(self, values):
+        self.values = [_plain(v) for v in values]
+
+    def __len__(self):
+        return len(self.values)
+
+def _adapt(value, dialect):
+    if isinstance(value, Array):
+        return value.values if dialect == POSTGRES else json.dumps(value.values)
+    return _plain(value)
+
+# Tipos que el driver acepta tal cual (sin subclases: np.float64 hereda de float)
+_NATIVE = {int, float, str, bytes, type(None)}
+
+def bind(params, dialect=SQLITE):
+    # Camino rápido para filas ya nativas (cargas masivas): sin adaptar valor por valor
+    if _NATIVE.issuperset(map(type, params)):
+        return params if type(params) is tuple else tuple(params)
+    return tuple(_adapt(v, dialect) for v in params)
+
+def execute(conn, stmt, params=()):
+    dialect = dialect_of(conn)
+    cur = conn.cursor()
+    # Siempre pasamos una tupla: así psycopg2 aplica el formateo de forma consistente
+    cur.execute(stmt.compile(dialect), bind(params, dialect))
+    return cur
+
+def executemany(conn, stmt, rows, page_size=1000, fetch=False, native=False):
+    # Una sola sentencia para muchas filas. Devuelve cuántas filas cambiaron; con fetch=True
+    # (solo Postgres, RETURNING) devuelve las filas resultantes (en SQLite, None).
+    # native=True: las filas ya son tuplas de tipos nativos (cargas masivas), no se revisan.
+    dialect = dialect_of(conn)
+    sql, template = stmt.compile_batch(dialect)
+    if not native:
+        rows = (bind(row, dialect) for row in rows)
+    cur = conn.cursor()
+    if template is None:
+        cur.executemany(sql, rows)
+        result = None if fetch else max(cur.rowcount, 0)
+    elif fetch:
+        result = cur.execute_values(sql, rows, template=template, page_size=page_size, fetch=True)
+    else:
+        # execute_values solo deja el rowcount de su última página: una llamada por página
+        result = 0
+        rows = iter(rows)
+        for page in iter(lambda: list(islice(rows, page_size)), []):
+            cur.execute_values(sql, page, template=template, page_size=page_size)
+            result += max(cur.rowcount, 0)
+    cur.close()
+    return result
+
+def fetchone(conn, stmt, params=()):
+    cur = execute(conn, stmt, params)
+    row = cur.fetchone()
+    cur.close()
+    return row
+
+def fetchall(conn, stmt, params=()):
+    cur = execute(conn, stmt, params)
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+# Filas por lote al leer en streaming (iter_rows / iter_frames)
+STREAM_BATCH_SIZE = 2000
+
+_cursor_ids = count(1)
+
+def iter_rows(conn, stmt, params=(), batch_size=STREAM_BATCH_SIZE):
+    # Recorre el resultado por lotes (listas de filas) sin cargarlo entero en memoria:
+    #   Postgres: cursor con nombre (del lado del servidor), fetchmany por lote
+    #   SQLite:   fetchmany sobre el cursor normal (ya es incremental)
+    dialect = dialect_of(conn)
+    opened = False
+    if dialect == POSTGRES:
+        # El cursor con nombre necesita una transacción; si la abrimos nosotros, la cerramos
+        opened = not conn.in_transaction
+        cur = conn.cursor(name=f"stream_{next(_cursor_ids)}")
+    else:
+        cur = conn.cursor()
+    try:
+        cur.execute(stmt.compile(dialect), bind(params, dialect))
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+        if opened:
+            conn.commit()
+
+def iter_frames(conn, stmt, params=(), batch_size=STREAM_BATCH_SIZE):
+    # Igual que iter_rows pero cada lote como DataFrame (mismas columnas que read_frame)
+    import pandas as pd
+    columns = None
+    for rows in iter_rows(conn, stmt, params, batch_size):
+        if columns is None:
+            # sqlite3.Row y DictRow exponen keys()
+            columns = list(rows[0].keys())
+        yield pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns)
+
+def read_frame(conn, stmt, params=()):
+    import pandas as pd
+    dialect = dialect_of(conn)
+    return pd.read_sql(stmt.compile(dialect), conn, params=bind(params, dialect))
@@ -1,112 +1,305 @@
-import streamlit as st
-import pandas as pd
-from db import get_connection
-
-def render_admin_view(user):
-    st.header(f"👑 Administración - Hola {user['username']}")
-    
-    conn = get_connection()
-
-    # -- Sync Button --
-    with st.expander("🔄 Actualizar Catálogo (Google Sheets / Excel)"):
-        # Diagnostics
-        c = conn.cursor()
-        try:
-            c.execute("SELECT COUNT(*) as count FROM products")
-            result = c.fetchone()
-            # Handle DictCursor vs Tuple
-            prod_count = result['count'] if isinstance(result, dict) else result[0]
-            
-            c.execute("SELECT COUNT(*) as count FROM users")
-            result_u = c.fetchone()
-            user_count = result_u['count'] if isinstance(result_u, dict) else result_u[0]
-            
-            st.write(f"📊 Estado actual DB: **{prod_count}** Productos | **{user_count}** Usuarios")
-        except Exception as e:
-            st.error(f"Error DB: {e}")
-
-        st.info("Pega tu enlace de Google Sheets en 'src/loader.py' si aún no lo has hecho.")
-        if st.button("Descargar y Actualizar Productos"):
-            with st.spinner("Actualizando..."):
-                import sys
-                from io import StringIO
-                
-                # Capture output to show user
-                old_stdout = sys.stdout
-                sys.stdout = mystdout = StringIO()
-                
-                try:
-                    from loader import load_products_from_excel
-                    load_products_from_excel()
-                    output = mystdout.getvalue()
-                    st.success("Proceso completado.")
-                    st.code(output)
-                except Exception as e:
-                    st.error(f"Error: {e}")
-                finally:
-                    sys.stdout = old_stdout
-    
-    # Fetch Pending Requests
-    pending_df = pd.read_sql('''
-        SELECT 
-            s.id, 
-            p.name as "Producto", 
-            s.quantity_requested as "Cantidad", 
-            p.uom as "Unidad",
-            u.username as "Solicitante", 
-            'Pendiente' as "Estado"
-        FROM shopping_list_items s
-        JOIN products p ON s.product_id = p.id
-        JOIN users u ON s.requester_id = u.id
-        WHERE s.status = 'Pendiente'
-        ORDER BY s.created_at ASC
-    ''', conn)
-    
-    if pending_df.empty:
-        st.success("No hay solicitudes pendientes por revisar.")
-    else:
-        st.subheader("Solicitudes Pendientes")
-        
-        # Add "Aprobar" columns
-        pending_df['Aprobar'] = False 
-        pending_df['Rechazar'] = False
-        
-        edited_df = st.data_editor(
-            pending_df,
-            column_config={
-                "id": None, # Hide
-                "Estado": None, # Hide
-                "Aprobar": st.column_config.CheckboxColumn("✅ Aprobar", default=False),
-                "Rechazar": st.column_config.CheckboxColumn("❌ Rechazar", default=False),
-                "Producto": st.column_config.TextColumn("Producto", disabled=True),
-                "Cantidad": st.column_config.NumberColumn("Cantidad", min_value=0.0, step=0.5),
-                "Unidad": st.column_config.TextColumn("Unidad", disabled=True),
-                "Solicitante": st.column_config.TextColumn("Solicitante", disabled=True)
-            },
-            use_container_width=True,
-            hide_index=True,
-            key="admin_editor"
-        )
-        
-        if st.button("Procesar Cambios", type="primary"):
-            c = conn.cursor()
-            count_approved = 0
-            count_rejected = 0
-            
-            for index, row in edited_df.iterrows():
-                if row['Rechazar']:
-                    # Use %s for native Postgres compatibility
-                    c.execute("UPDATE shopping_list_items SET status = 'Rechazado' WHERE id = %s", (row['id'],))
-                    count_rejected += 1
-                elif row['Aprobar']:
-                    c.execute("UPDATE shopping_list_items SET status = 'Aprobado', quantity_approved = %s WHERE id = %s", (float(row['Cantidad']), row['id']))
-                    count_approved += 1
-            
-            conn.commit()
-            if count_approved > 0 or count_rejected > 0:
-                st.success(f"Procesado: {count_approved} aprobados, {count_rejected} rechazados.")
-                st.rerun()
-            else:
-                st.info("No seleccionaste ninguna acción.")
-
-    conn.close()
+import streamlit as st
+import pandas as pd
+from profiler import span
+import jobs
+from db import get_connection, get_pool_stats, on_commit, submit_write, transaction, writer_stats
+import cache
+from statements import define, execute, executemany, Array
+
+COUNT_PRODUCTS = define("admin.count_products", "SELECT COUNT(*) as count FROM products")
+
+COUNT_USERS = define("admin.count_users", "SELECT COUNT(*) as count FROM users")
+
+PENDING = define("admin.pending", '''
+    SELECT 
+        s.id, 
+        p.name as "Producto", 
+        s.quantity_requested as "Cantidad", 
+        p.uom as "Unidad",
+        u.username as "Solicitante", 
+        'Pendiente' as "Estado"
+    FROM shopping_list_items s
+    JOIN products p ON s.product_id = p.id
+    JOIN users u ON s.requester_id = u.id
+    WHERE s.status = 'Pendiente'
+    ORDER BY s.created_at ASC
+''')
+
+# Solo se tocan filas que siguen pendientes (otra sesión pudo procesarlas ya)
+REJECT_ITEMS = define("admin.reject_items", '''
+    UPDATE shopping_list_items SET status = 'Rechazado'
+    WHERE status = 'Pendiente' AND id IN (SELECT value FROM json_each(?))
+''', postgres='''
+    UPDATE shopping_list_items SET status = 'Rechazado'
+    WHERE status = 'Pendiente' AND id = ANY(?)
+''')
+
+# Filas (id, cantidad): en Postgres un solo UPDATE ... FROM (VALUES ...)
+APPROVE_ITEMS = define("admin.approve_items", '''
+    UPDATE shopping_list_items SET status = 'Aprobado', quantity_approved = ?2
+    WHERE id = ?1 AND status = 'Pendiente'
+''', postgres='''
+    UPDATE shopping_list_items AS s SET status = 'Aprobado', quantity_approved = v.qty
+    FROM (VALUES (?::integer, ?::real)) AS v(id, qty)
+    WHERE s.id = v.id AND s.status = 'Pendiente'
+''')
+
+CATALOG_JOB = "catalogo"
+
+def review_changes(pending_df, edited_df):
+    # Solo las filas marcadas. Rechazar gana si marcaron ambas casillas.
+    # Devuelve ([(id, cantidad), ...], [id, ...])
+    rejected = edited_df['Rechazar'].fillna(False).astype(bool)
+    approved = edited_df['Aprobar'].fillna(False).astype(bool) & ~rejected
+    qty = pd.to_numeric(edited_df['Cantidad'], errors='coerce')
+    qty = qty.fillna(pd.to_numeric(pending_df['Cantidad'], errors='coerce')).fillna(0.0)
+    approvals = list(zip(edited_df.loc[approved, 'id'].tolist(), qty[approved].astype(float).tolist()))
+    rejections = edited_df.loc[rejected, 'id'].tolist()
+    return approvals, rejections
+
+def apply_review(conn, approvals, rejections):
+    # Un lote para aprobaciones y uno para rechazos, en una sola transacción.
+    # Devuelve cuántos se aprobaron/rechazaron de verdad (los que seguían pendientes).
+    approved = rejected = 0
+    with transaction(conn):
+        if approvals:
+            approved = executemany(conn, APPROVE_ITEMS, approvals)
+        if rejections:
+            cur = execute(conn, REJECT_ITEMS, (Array(rejections),))
+            rejected = max(cur.rowcount, 0)
+            cur.close()
+    on_commit(conn, cache.bump, "shopping_list_items")
+    return approved, rejected
+
+def start_catalog_refresh(force=False):
+    # La importación corre en un hilo aparte; una sola a la vez para todas las sesiones
+    def run(job):
+        from loader import load_products_from_excel
+        return load_products_from_excel(force=force, log=job.log, progress=job.progress,
+                                        cancel=job.cancel_event)
+    return jobs.start(CATALOG_JOB, run)
+
+def _catalog_job_panel():
+    # Devuelve True mientras la importación sigue en curso
+    job = jobs.get(CATALOG_JOB)
+    if job is None:
+        return False
+    info = job.snapshot()
+
+    if info['running']:
+        rows, total = info['rows'], info['total']
+        label = f"Importando... {rows} filas" + (f" de ~{total}" if total else "")
+        st.progress(min(rows / total, 1.0) if total else 0.0, text=label)
+        eta = f" | ETA {info['eta']:.0f}s" if info['eta'] is not None else ""
+        st.caption(f"⏱️ {info['elapsed']:.0f}s | {info['rate']:.0f} filas/s{eta}")
+        if st.button("Cancelar importación"):
+            jobs.cancel(CATALOG_JOB)
+    else:
+        summary = f"{info['rows']} filas en {info['elapsed']:.1f}s"
+        if info['status'] == jobs.DONE:
+            st.success(f"Última importación completada: {summary}.")
+        elif info['status'] == jobs.CANCELLED:
+            st.warning(f"Última importación cancelada: {summary}.")
+        else:
+            st.error(f"Última importación con error: {info['error']}")
+    if info['log']:
+        st.code(info['log'])
+    return info['running']
+
+def _catalog_job_live_panel():
+    # Se refresca solo mientras la importación avanza; al terminar, una recarga completa
+    # dibuja el panel final sin fragmento (y deja de consultar el registro de trabajos)
+    if not _catalog_job_panel():
+        st.rerun()
+
+def _failed_operations(outbox):
+    # Operaciones de la cola que no se van a reintentar solas (error propio o MAX_ATTEMPTS)
+    ops = outbox.failed()
+    st.error(f"{len(ops)} operación(es) de la cola fallaron y no se aplicaron.")
+    st.dataframe(pd.DataFrame([{
+        "Clave": op['key'],
+        "Tipo": op['kind'],
+        "Creada": pd.to_datetime(op['created_at'], unit='s'),
+        "Intentos": op['attempts'],
+        "Error": op['last_error'],
+    } for op in ops]), hide_index=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Reintentar las fallidas"):
+            outbox.retry_failed()
+            st.rerun()
+    with col2:
+        if st.button("Descartar las fallidas"):
+            outbox.discard_failed()
+            st.rerun()
+
+def _query_diagnostics():
+    # Tiempos por sentencia y consultas lentas (querylog.py)
+    import querylog
+    stats = querylog.query_stats()
+    if stats:
+        total_ms = sum(row['total_ms'] for row in stats)
+        st.caption(f"🐢 Consultas SQL en este proceso: {sum(row['count'] for row in stats)} "
+                   f"ejecuciones, {total_ms / 1000:.2f}s en total")
+        by_view = querylog.view_stats()
+        st.caption(" | ".join(f"{view}: {v['count']} consultas, {v['seconds'] * 1000:.0f} ms"
+                              for view, v in sorted(by_view.items())))
+        st.dataframe(pd.DataFrame(stats).drop(columns=['buckets']), hide_index=True, height=240)
+    # Ajuste de todo el proceso: solo cambia cuando un admin pulsa el botón
+    if querylog.EXPLAIN_SLOW:
+        st.caption(f"🔍 Se guarda el EXPLAIN de las consultas de más de {querylog.SLOW_QUERY_MS} ms "
+                   f"(para todas las sesiones).")
+        if st.button("Dejar de guardar EXPLAIN"):
+            querylog.set_explain_slow(False)
+            st.rerun()
+    elif st.button(f"Guardar EXPLAIN de las consultas de más de {querylog.SLOW_QUERY_MS} ms"):
+        querylog.set_explain_slow(True)
+        st.rerun()
+    slow = querylog.slow_queries(20)
+    if slow:
+        st.caption(f"Últimas consultas lentas (`{querylog.SLOW_LOG_PATH}`):")
+        st.dataframe(pd.DataFrame(slow), hide_index=True, height=200)
+    if st.button("Reiniciar contadores de consultas"):
+        querylog.reset()
+
+def render_admin_view(user):
+    st.header(f"👑 Administración - Hola {user['username']}")
+    
+    conn = get_connection()
+
+    # -- Sync Button --
+    with st.expander("🔄 Actualizar Catálogo (Google Sheets / Excel)"):
+        # Diagnostics
+        try:
+            prod_count = cache.cached_rows(conn, COUNT_PRODUCTS, tables=("products",))[0]['count']
+            user_count = cache.cached_rows(conn, COUNT_USERS, tables=("users",))[0]['count']
+            
+            st.write(f"📊 Estado actual DB: **{prod_count}** Productos | **{user_count}** Usuarios")
+
+            pool = get_pool_stats()
+            st.caption(f"🔌 Conexiones ({pool['backend']}): {pool['checkouts']} usos | "
+                       f"{pool['creates']} creadas | {pool.get('waits', 0)} esperas")
+            if pool['backend'] == "sqlite":
+                ws = writer_stats()
+                st.caption(f"✍️ Escritor SQLite: {ws['jobs']} escrituras en {ws['commits']} commits "
+                           f"(media {ws['avg_batch']:.1f}, máx {ws['max_batch']}) | espera media "
+                           f"{ws['avg_wait_ms']:.1f} ms | {ws['errors']} errores | {ws['queued']} en cola")
+            import outbox
+            ob = outbox.outbox_stats()
+            st.caption(f"📮 Cola de compras: {ob['pending']} pendientes ({ob['retrying']} reintentando) | "
+                       f"{ob['applied']} aplicadas ({ob['applied_items']} items cambiados), "
+                       f"{ob['duplicates']} duplicadas ignoradas")
+            if ob['retrying']:
+                st.warning(f"Último error de la cola: {ob['last_error']}")
+                if st.button("Reintentar envío ahora"):
+                    outbox.wake()
+            if ob['failed']:
+                _failed_operations(outbox)
+            _query_diagnostics()
+
+            cs = cache.cache_stats()
+            st.caption(f"🗃️ Caché de consultas: {cs['hits']} aciertos | {cs['misses']} fallos "
+                       f"({cs['hit_ratio']:.0%}) | {cs['entries']} entradas, {cs['bytes'] / 1024:.0f} KB | "
+                       f"{cs['invalidations']} invalidadas, {cs['evictions']} desalojadas")
+        except Exception as e:
+            st.error(f"Error DB: {e}")
+
+        st.info("Pega tu enlace de Google Sheets en 'src/loader.py' si aún no lo has hecho.")
+        force_sync = st.checkbox("Revisar aunque la fuente no haya cambiado")
+        job = jobs.get(CATALOG_JOB)
+        running = job is not None and job.status == jobs.RUNNING
+        if st.button("Descargar y Actualizar Productos", disabled=running):
+            start_catalog_refresh(force=force_sync)
+            running = True
+
+        if running:
+            # Refresca solo este panel mientras la importación avanza
+            st.fragment(run_every=2)(_catalog_job_live_panel)()
+        else:
+            _catalog_job_panel()
+    
+    with st.expander("🛠️ Mantenimiento"):
+        from startup import ensure_initialized, startup_state
+        state = startup_state()
+        if state['last_run']:
+            st.caption(f"Esquema v{state['version']} | inicializado {state['runs']}x en este proceso "
+                       f"({state['seconds']:.2f}s la última)")
+        from views import import_report, COLD_START_BUDGET
+        report = import_report()
+        if report:
+            st.caption(f"⏱️ Import de vistas en este proceso (presupuesto en frío {COLD_START_BUDGET}s; "
+                       f"medir con `python src/views.py`):")
+            st.dataframe(pd.DataFrame(report, columns=["Módulo", "Segundos"]), hide_index=True)
+        import profiler
+        reruns = profiler.rerun_stats()
+        if reruns:
+            st.caption("⏱️ Recargas por vista y rol (ms promedio por fase):")
+            st.dataframe(pd.DataFrame(reruns), hide_index=True)
+        if st.button("Perfilar la próxima recarga (cProfile)"):
+            profiler.request_capture()
+            st.info("La próxima recarga de cualquier sesión quedará perfilada.")
+        capture = profiler.last_capture()
+        if capture:
+            st.caption(f"Última captura: {capture['view']} ({capture['role']}), {capture['seconds']:.2f}s "
+                       f"→ `{capture['path']}`")
+            st.code(capture['summary'])
+        if st.button("Exportar métricas ahora"):
+            st.success(f"Métricas escritas en `{profiler.write_metrics()}`.")
+        if st.button("Re-sincronizar esquema y usuarios"):
+            ensure_initialized(force=True)
+            st.success("Migraciones y usuarios sincronizados.")
+        if st.button("Recalcular resumen de gasto"):
+            import rollups
+            submit_write(rollups.refill)
+            st.success("Resumen de gasto recalculado desde el historial.")
+        import archive
+        days = archive.archive_after_days()
+        if st.button(f"Archivar items cerrados de más de {days} días"):
+            moved = archive.archive_closed_items(days)
+            st.success(f"{moved} items archivados en el historial.")
+    
+    # Fetch Pending Requests
+    pending_df = cache.cached_frame(conn, PENDING, tables=("products", "shopping_list_items", "users"))
+    
+    if pending_df.empty:
+        st.success("No hay solicitudes pendientes por revisar.")
+    else:
+        st.subheader("Solicitudes Pendientes")
+        
+        # Add "Aprobar" columns
+        pending_df['Aprobar'] = False 
+        pending_df['Rechazar'] = False
+        
+        with span("render"):
+            edited_df = st.data_editor(
+                pending_df,
+                column_config={
+                    "id": None, # Hide
+                    "Estado": None, # Hide
+                    "Aprobar": st.column_config.CheckboxColumn("✅ Aprobar", default=False),
+                    "Rechazar": st.column_config.CheckboxColumn("❌ Rechazar", default=False),
+                    "Producto": st.column_config.TextColumn("Producto", disabled=True),
+                    "Cantidad": st.column_config.NumberColumn("Cantidad", min_value=0.0, step=0.5),
+                    "Unidad": st.column_config.TextColumn("Unidad", disabled=True),
+                    "Solicitante": st.column_config.TextColumn("Solicitante", disabled=True)
+                },
+                use_container_width=True,
+                hide_index=True,
+                key="admin_editor"
+            )
+        
+        if st.button("Procesar Cambios", type="primary"):
+            approvals, rejections = review_changes(pending_df, edited_df)
+            if approvals or rejections:
+                count_approved, count_rejected = submit_write(apply_review, approvals, rejections)
+                # Otra sesión pudo revisar algunas mientras tanto: solo se cuentan las que cambiaron
+                skipped = len(approvals) + len(rejections) - count_approved - count_rejected
+                message = f"Procesado: {count_approved} aprobados, {count_rejected} rechazados."
+                if skipped:
+                    message += f" {skipped} ya no estaban pendientes."
+                st.success(message)
+                st.rerun()
+            else:
+                st.info("No seleccionaste ninguna acción.")
+
+    conn.close()
@@ -1,103 +1,189 @@
-import streamlit as st
-import pandas as pd
-from datetime import datetime
-from db import get_connection
-
-def render_buyer_view(user):
-    st.header(f"🛍️ Lista de Compras - Modo Comprador")
-    
-    conn = get_connection()
-    
-    # query
-    df = pd.read_sql('''
-        SELECT 
-            s.id, 
-            p.name as "Producto", 
-            s.quantity_approved as "Cantidad", 
-            p.uom as "Unidad", 
-            p.category as "Categoría", 
-            s.status as "Estado", 
-            p.last_price_estimate as "PrecioRef"
-        FROM shopping_list_items s
-        JOIN products p ON s.product_id = p.id
-        WHERE s.status IN ('Aprobado', 'Postergado')
-        ORDER BY p.category, p.name
-    ''', conn)
-    
-    if df.empty:
-        st.info("No hay items pendientes de compra. ¡Todo listo!")
-        conn.close()
-        return
-
-    st.caption("Marca 'Comprar' ✅ o 'Postergar' ⏭️ y procesa todo al final.")
-
-    # 1. Añadir columnas de acción
-    df['Comprado'] = False
-    df['Postergar'] = False
-    
-    # 2. Preparar numéricos
-    df['PrecioRef'] = pd.to_numeric(df['PrecioRef'], errors='coerce').fillna(0.0)
-    df['Precio Real'] = df['PrecioRef'] # Pre-llenar con el último precio
-    df['Cantidad'] = pd.to_numeric(df['Cantidad'], errors='coerce').fillna(1.0)
-
-    # 3. CONFIGURAR TABLA
-    edited_df = st.data_editor(
-        df,
-        column_config={
-            "id": None, 
-            "Estado": None, 
-            "PrecioRef": None, # Lo ocultamos para mostrar el editable
-            "Comprado": st.column_config.CheckboxColumn("✅ Comprar", default=False),
-            "Postergar": st.column_config.CheckboxColumn("⏭️ Postergar", default=False),
-            "Producto": st.column_config.TextColumn("Producto", disabled=True),
-            "Categoría": st.column_config.TextColumn("Categoría", disabled=True),
-            "Unidad": st.column_config.TextColumn("Unidad", disabled=True, width="small"),
-            "Cantidad": st.column_config.NumberColumn("Cantidad", min_value=0.0, step=0.5, format="%.2f"),
-            "Precio Real": st.column_config.NumberColumn("Precio Real (S/)", min_value=0.0, step=0.5, format="%.2f")
-        },
-        use_container_width=True,
-        hide_index=True,
-        # Orden visual de columnas
-        column_order=["Comprado", "Postergar", "Producto", "Cantidad", "Unidad", "Precio Real"],
-        key="buyer_editor"
-    )
-
-    # BOTÓN DE PROCESAR
-    if st.button("Procesar Compra 🛒", type="primary"):
-        c = conn.cursor()
-        processed_count = 0
-        
-        for index, row in edited_df.iterrows():
-            item_id = row['id']
-            is_bought = row['Comprado']
-            is_deferred = row['Postergar']
-            
-            if is_bought:
-                real_price = float(row['Precio Real'])
-                real_qty = float(row['Cantidad'])
-                product_name = row['Producto']
-                
-                # Marcar como comprado
-                c.execute('''
-                    UPDATE shopping_list_items 
-                    SET status = 'Comprado', price_real = %s, shopping_date = NOW(), quantity_approved = %s 
-                    WHERE id = %s
-                ''', (real_price, real_qty, item_id))
-                
-                # Actualizar precio maestro del producto
-                c.execute('UPDATE products SET last_price_estimate = %s WHERE name = %s', (real_price, product_name))
-                processed_count += 1
-                
-            elif is_deferred:
-                # Postergar
-                c.execute("UPDATE shopping_list_items SET status = 'Postergado' WHERE id = %s", (item_id,))
-                processed_count += 1
-        
-        conn.commit()
-        if processed_count > 0:
-            st.success(f"✅ Se procesaron {processed_count} items.")
-            st.rerun()
-        else:
-            st.info("No has marcado nada. Selecciona 'Comprar' o 'Postergar' en la tabla.")
-
-    conn.close()
+import streamlit as st
+import pandas as pd
+from profiler import span
+from datetime import datetime
+from db import get_connection, on_commit, transaction
+import cache
+import outbox
+import rollups
+from statements import define, execute, executemany, fetchall, Array
+
+SHOPPING_LIST = define("buyer.shopping_list", '''
+    SELECT 
+        s.id, 
+        s.product_id,
+        p.name as "Producto", 
+        s.quantity_approved as "Cantidad", 
+        p.uom as "Unidad", 
+        p.category as "Categoría", 
+        s.status as "Estado", 
+        p.last_price_estimate as "PrecioRef"
+    FROM shopping_list_items s
+    JOIN products p ON s.product_id = p.id
+    WHERE s.status IN ('Aprobado', 'Postergado')
+    ORDER BY p.category, p.name
+''')
+
+# De los items a comprar, los que siguen en la lista (otra sesión pudo comprarlos ya).
+# En Postgres se bloquean hasta el final de la transacción.
+BUYABLE = define("buyer.buyable", '''
+    SELECT id, product_id FROM shopping_list_items
+    WHERE status IN ('Aprobado', 'Postergado') AND id IN (SELECT value FROM json_each(?))
+''', postgres='''
+    SELECT id, product_id FROM shopping_list_items
+    WHERE status IN ('Aprobado', 'Postergado') AND id = ANY(?)
+    FOR UPDATE
+''')
+
+# Filas (id, precio, cantidad)
+MARK_BOUGHT = define("buyer.mark_bought", '''
+    UPDATE shopping_list_items 
+    SET status = 'Comprado', price_real = ?2, shopping_date = datetime('now'), quantity_approved = ?3 
+    WHERE id = ?1 AND status IN ('Aprobado', 'Postergado')
+''', postgres='''
+    UPDATE shopping_list_items AS s
+    SET status = 'Comprado', price_real = v.price, shopping_date = datetime('now'), quantity_approved = v.qty
+    FROM (VALUES (?::integer, ?::real, ?::real)) AS v(id, price, qty)
+    WHERE s.id = v.id AND s.status IN ('Aprobado', 'Postergado')
+''')
+
+# Filas (product_id, precio): por id, no por nombre
+UPDATE_PRICES = define("buyer.update_prices",
+    "UPDATE products SET last_price_estimate = ?2 WHERE id = ?1",
+    postgres='''
+    UPDATE products AS p SET last_price_estimate = v.price
+    FROM (VALUES (?::integer, ?::real)) AS v(id, price)
+    WHERE p.id = v.id
+''')
+
+DEFER_ITEMS = define("buyer.defer_items", '''
+    UPDATE shopping_list_items SET status = 'Postergado'
+    WHERE status = 'Aprobado' AND id IN (SELECT value FROM json_each(?))
+''', postgres='''
+    UPDATE shopping_list_items SET status = 'Postergado'
+    WHERE status = 'Aprobado' AND id = ANY(?)
+''')
+
+def checkout_changes(edited_df):
+    # Devuelve (comprados [(id, precio, cantidad)], precios [(product_id, precio)], postergados [id])
+    bought_mask = edited_df['Comprado'].fillna(False).astype(bool)
+    deferred_mask = edited_df['Postergar'].fillna(False).astype(bool) & ~bought_mask
+    bought = edited_df.loc[bought_mask, ['id', 'product_id', 'Precio Real', 'Cantidad']].copy()
+    bought['Precio Real'] = pd.to_numeric(bought['Precio Real'], errors='coerce').fillna(0.0).astype(float)
+    bought['Cantidad'] = pd.to_numeric(bought['Cantidad'], errors='coerce').fillna(1.0).astype(float)
+    items = list(bought[['id', 'Precio Real', 'Cantidad']].itertuples(index=False, name=None))
+    # Mismo producto dos veces en la lista: queda el último precio
+    last = bought.drop_duplicates('product_id', keep='last')
+    prices = list(last[['product_id', 'Precio Real']].itertuples(index=False, name=None))
+    deferred = edited_df.loc[deferred_mask, 'id'].tolist()
+    return items, prices, deferred
+
+def commit_purchase(conn, bought, prices, deferred):
+    # Toda la compra en una transacción: un lote por tipo de cambio
+    # y el resumen de gasto se incrementa con lo recién comprado.
+    # Devuelve cuántos items cambiaron (comprados + postergados).
+    marked = deferred_count = 0
+    with transaction(conn):
+        if bought:
+            rows = fetchall(conn, BUYABLE, (Array([item[0] for item in bought]),))
+            buyable = {row['id']: row['product_id'] for row in rows}
+            bought = [item for item in bought if item[0] in buyable]
+            # Solo precios de productos que de verdad se compran aquí: una compra que
+            # otra sesión ya hizo no pisa el precio actual
+            bought_products = set(buyable.values())
+            prices = [price for price in prices if price[0] in bought_products]
+        else:
+            prices = []
+        if bought:
+            # Las filas siguen bloqueadas (FOR UPDATE / escritor único): se actualizan todas
+            executemany(conn, MARK_BOUGHT, bought)
+            marked = len(bought)
+            rollups.add_purchases(conn, [item[0] for item in bought])
+        if prices:
+            executemany(conn, UPDATE_PRICES, prices)
+        if deferred:
+            cur = execute(conn, DEFER_ITEMS, (Array(deferred),))
+            deferred_count = max(cur.rowcount, 0)
+            cur.close()
+    on_commit(conn, cache.bump, "products", "shopping_list_items", "spend_monthly")
+    return marked + deferred_count
+
+def render_buyer_view(user):
+    st.header(f"🛍️ Lista de Compras - Modo Comprador")
+    
+    conn = get_connection()
+    
+    # query
+    df = cache.cached_frame(conn, SHOPPING_LIST, tables=("products", "shopping_list_items"))
+
+    # Compras ya confirmadas que siguen en la cola local: no volver a mostrarlas
+    queued = outbox.pending("checkout")
+    if queued:
+        sent_ids = set()
+        for op in queued:
+            bought, prices, deferred = op['payload']
+            sent_ids.update(item[0] for item in bought)
+            sent_ids.update(deferred)
+        df = df[~df['id'].isin(sent_ids)].reset_index(drop=True)
+        st.caption(f"🕒 {len(queued)} compra(s) en cola, enviándose a la base de datos.")
+        retrying = [op for op in queued if op['attempts'] > 0]
+        if retrying:
+            st.warning(f"Reintentando envío ({retrying[0]['attempts']} intentos): {retrying[0]['last_error']}")
+    
+    if df.empty:
+        st.info("No hay items pendientes de compra. ¡Todo listo!")
+        conn.close()
+        return
+
+    st.caption("Marca 'Comprar' ✅ o 'Postergar' ⏭️ y procesa todo al final.")
+
+    # 1. Añadir columnas de acción
+    df['Comprado'] = False
+    df['Postergar'] = False
+    
+    # 2. Preparar numéricos
+    with span("pandas"):
+        df['PrecioRef'] = pd.to_numeric(df['PrecioRef'], errors='coerce').fillna(0.0)
+        df['Precio Real'] = df['PrecioRef'] # Pre-llenar con el último precio
+        df['Cantidad'] = pd.to_numeric(df['Cantidad'], errors='coerce').fillna(1.0)
+
+    # 3. CONFIGURAR TABLA
+    with span("render"):
+        edited_df = st.data_editor(
+            df,
+            column_config={
+                "id": None, 
+                "product_id": None,
+                "Estado": None, 
+                "PrecioRef": None, # Lo ocultamos para mostrar el editable
+                "Comprado": st.column_config.CheckboxColumn("✅ Comprar", default=False),
+                "Postergar": st.column_config.CheckboxColumn("⏭️ Postergar", default=False),
+                "Producto": st.column_config.TextColumn("Producto", disabled=True),
+                "Categoría": st.column_config.TextColumn("Categoría", disabled=True),
+                "Unidad": st.column_config.TextColumn("Unidad", disabled=True, width="small"),
+                "Cantidad": st.column_config.NumberColumn("Cantidad", min_value=0.0, step=0.5, format="%.2f"),
+                "Precio Real": st.column_config.NumberColumn("Precio Real (S/)", min_value=0.0, step=0.5, format="%.2f")
+            },
+            use_container_width=True,
+            hide_index=True,
+            # Orden visual de columnas
+            column_order=["Comprado", "Postergar", "Producto", "Cantidad", "Unidad", "Precio Real"],
+            key="buyer_editor"
+        )
+
+    # BOTÓN DE PROCESAR
+    if st.button("Procesar Compra 🛒", type="primary"):
+        bought, prices, deferred = checkout_changes(edited_df)
+        processed_count = 0
+        if bought or deferred:
+            # Se guarda en la cola local y se aplica en segundo plano (commit_purchase,
+            # todo junto y una sola vez aunque haya que reintentar)
+            outbox.enqueue("checkout", bought, prices, deferred)
+            processed_count = len(bought) + len(deferred)
+        if processed_count > 0:
+            st.success(f"✅ {processed_count} items enviados; se aplican en segundo plano.")
+            st.rerun()
+        else:
+            st.info("No has marcado nada. Selecciona 'Comprar' o 'Postergar' en la tabla.")
+
+    conn.close()
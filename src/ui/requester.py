@@ -1,155 +1,210 @@
-import streamlit as st
-import pandas as pd
-from db import get_connection
-
-def render_requester_view(user):
-    st.header(f"📝 Solicitud de Productos - Hola {user['username']}")
-    
-    # --- MEMORIA (CARRITO) ---
-    if 'cart_updates' not in st.session_state:
-        st.session_state['cart_updates'] = {}
-
-    conn = get_connection()
-    
-    # 1. Cargar datos de la BD
-    query = '''
-        SELECT 
-            p.id, 
-            p.name as "Producto", 
-            p.category as "Categoría", 
-            p.uom as "Unidad",
-            SUM(s.quantity_requested) as "Solicitado"
-        FROM products p
-        LEFT JOIN shopping_list_items s 
-            ON p.id = s.product_id 
-            AND s.status = 'Pendiente'
-        GROUP BY p.id
-    '''
-    
-    df_db = pd.read_sql(query, conn)
-    df_db['Solicitado'] = pd.to_numeric(df_db['Solicitado'], errors='coerce').fillna(0.0)
-
-    # 2. Aplicar cambios de la Memoria sobre la vista
-    df_display = df_db.copy()
-    
-    for pid, new_qty in st.session_state['cart_updates'].items():
-        idx = df_display.index[df_display['id'] == pid]
-        if not idx.empty:
-            df_display.loc[idx, 'Solicitado'] = new_qty
-            
-    pending_count = len(st.session_state['cart_updates'])
-
-    # -- BARRA DE HERRAMIENTAS --
-    col1, col2, col3 = st.columns([2, 2, 1])
-    with col1:
-        search_term = st.text_input("🔍 Buscar producto...")
-    with col2:
-        if df_display.empty:
-            categories = ["Todas"]
-        else:
-            categories = ["Todas"] + sorted(df_display['Categoría'].dropna().unique().tolist())
-        category_filter = st.selectbox("Categoría", categories)
-    with col3:
-        # Botón inteligente
-        btn_label = "💾 Guardar"
-        if pending_count > 0:
-            btn_label = f"💾 Guardar ({pending_count})"
-            st.warning(f"Tienes {pending_count} cambios sin guardar.")
-            
-        save_clicked = st.button(btn_label, type="primary", use_container_width=True)
-
-    # -- FILTRADO --
-    filtered = df_display.copy()
-    if search_term:
-        filtered = filtered[filtered['Producto'].str.contains(search_term, case=False, na=False)]
-    if category_filter != "Todas":
-        filtered = filtered[filtered['Categoría'] == category_filter]
-
-    # -- TABLA --
-    edited_df = st.data_editor(
-        filtered,
-        column_config={
-            "id": None, 
-            "Producto": st.column_config.TextColumn("Producto", disabled=True),
-            "Categoría": None, # Oculto para ahorrar espacio en móvil
-            "Unidad": st.column_config.TextColumn("Unidad", disabled=True, width="small"),
-            "Solicitado": st.column_config.NumberColumn(
-                "Cantidad",
-                min_value=0.0,
-                step=0.5,
-                format="%.1f"
-            )
-        },
-        use_container_width=True,
-        hide_index=True,
-        disabled=["Producto", "Categoría", "Unidad"],
-        key="requester_editor"
-    )
-
-    # -- DETECTAR CAMBIOS --
-    # Si la tabla editada es diferente a lo que mostramos, actualizamos la memoria
-    if not edited_df.equals(filtered):
-        for index, row in edited_df.iterrows():
-            pid = row['id']
-            current_val = float(row['Solicitado'])
-            
-            # Buscamos el valor original en la BASE DE DATOS
-            db_row = df_db[df_db['id'] == pid]
-            original_val = float(db_row.iloc[0]['Solicitado']) if not db_row.empty else 0.0
-                
-            # Si es diferente a lo que hay en la BD, lo guardamos en el carrito
-            if current_val != original_val:
-                st.session_state['cart_updates'][pid] = current_val
-            else:
-                # Si volvió al valor original, lo quitamos del carrito
-                if pid in st.session_state['cart_updates']:
-                    del st.session_state['cart_updates'][pid]
-                    
-            # Nota: Necesitas interactuar otra vez para que se actualice el contador visual,
-            # (Limitación de Streamlit), pero los datos SÍ se están guardando en memoria.
-
-    # -- GUARDAR EN BD --
-    if save_clicked:
-        if not st.session_state['cart_updates']:
-            st.info("No hay cambios para guardar.")
-        else:
-            c = conn.cursor()
-            changes_count = 0
-            
-            try:
-                for pid, new_qty in st.session_state['cart_updates'].items():
-                    # Buscar si ya existe pendiente
-                    c.execute("SELECT id FROM shopping_list_items WHERE product_id = %s AND status = 'Pendiente'", (pid,))
-                    existing = c.fetchone()
-                    
-                    if new_qty > 0:
-                        if existing:
-                            # Update
-                            item_id = existing['id'] if isinstance(existing, dict) else existing[0]
-                            c.execute("UPDATE shopping_list_items SET quantity_requested = %s WHERE id = %s", (new_qty, item_id))
-                        else:
-                            # Insert
-                            c.execute('''
-                                INSERT INTO shopping_list_items (product_id, requester_id, quantity_requested, status, created_at)
-                                VALUES (%s, %s, %s, 'Pendiente', NOW())
-                            ''', (pid, user['id'], new_qty))
-                            
-                    else:
-                        # Quantity 0 -> Delete
-                        if existing:
-                            item_id = existing['id'] if isinstance(existing, dict) else existing[0]
-                            c.execute("DELETE FROM shopping_list_items WHERE id = %s", (item_id,))
-                    
-                    changes_count += 1
-                
-                conn.commit()
-                st.success(f"✅ Se guardaron {changes_count} actualizaciones correctamente.")
-                
-                # Vaciar carrito
-                st.session_state['cart_updates'] = {}
-                st.rerun()
-                
-            except Exception as e:
-                st.error(f"Error al guardar: {e}")
-
-    conn.close()
+import streamlit as st
+import pandas as pd
+from profiler import span
+from db import get_connection, on_commit, submit_write, transaction
+import cache
+from search import search_products, SEARCH_LIMIT
+from statements import define, execute, executemany, fetchall, Array
+
+CATALOG = define("requester.catalog", '''
+    SELECT 
+        p.id, 
+        p.name as "Producto", 
+        p.category as "Categoría", 
+        p.uom as "Unidad",
+        SUM(s.quantity_requested) as "Solicitado"
+    FROM products p
+    LEFT JOIN shopping_list_items s 
+        ON p.id = s.product_id 
+        AND s.status = 'Pendiente'
+    WHERE p.active = 1 AND (? IS NULL OR p.category = ?)
+    GROUP BY p.id
+''')
+
+CATEGORIES = define("requester.categories", '''
+    SELECT DISTINCT category FROM products
+    WHERE active = 1 AND category IS NOT NULL
+    ORDER BY category
+''')
+
+# Pendientes ya existentes para los productos del carrito (una sola consulta)
+PENDING_FOR_PRODUCTS = define("requester.pending_for_products", '''
+    SELECT product_id, MIN(id) as id FROM shopping_list_items
+    WHERE status = 'Pendiente' AND product_id IN (SELECT value FROM json_each(?))
+    GROUP BY product_id
+''', postgres='''
+    SELECT product_id, MIN(id) as id FROM shopping_list_items
+    WHERE status = 'Pendiente' AND product_id = ANY(?)
+    GROUP BY product_id
+''')
+
+# Filas (id, cantidad): en Postgres un solo UPDATE ... FROM (VALUES ...)
+UPDATE_PENDING = define("requester.update_pending",
+    "UPDATE shopping_list_items SET quantity_requested = ?2 WHERE id = ?1",
+    postgres='''
+    UPDATE shopping_list_items AS s SET quantity_requested = v.qty
+    FROM (VALUES (?::integer, ?::real)) AS v(id, qty)
+    WHERE s.id = v.id
+''')
+
+INSERT_PENDING = define("requester.insert_pending", '''
+    INSERT INTO shopping_list_items (product_id, requester_id, quantity_requested, status, created_at)
+    VALUES (?, ?, ?, 'Pendiente', datetime('now'))
+''')
+
+DELETE_PENDING = define("requester.delete_pending",
+    "DELETE FROM shopping_list_items WHERE id IN (SELECT value FROM json_each(?))",
+    postgres="DELETE FROM shopping_list_items WHERE id = ANY(?)")
+
+def empty_cart():
+    # Carrito = Serie de cantidades indexada por id de producto (solo lo que difiere de la BD)
+    return pd.Series(dtype="float64", name="Solicitado")
+
+def load_cart(state):
+    cart = state.get('cart_updates')
+    if cart is None:
+        return empty_cart()
+    if not isinstance(cart, pd.Series):
+        # Sesiones antiguas guardaban un dict {pid: cantidad}
+        cart = pd.Series(cart, dtype="float64", name="Solicitado")
+    return cart
+
+def apply_cart(df_db, cart):
+    # Superpone el carrito sobre el catálogo (ambos indexados por id de producto)
+    df_display = df_db.copy()
+    ids = cart.index.intersection(df_display.index)
+    if len(ids):
+        df_display.loc[ids, 'Solicitado'] = cart.loc[ids]
+    return df_display
+
+def diff_cart(df_db, edited_df, cart):
+    # Compara columnas completas: lo que difiere de la BD entra/actualiza el carrito,
+    # lo que volvió a su valor original sale del carrito.
+    current = pd.to_numeric(edited_df['Solicitado'], errors='coerce').fillna(0.0).astype("float64")
+    original = df_db['Solicitado'].reindex(current.index).fillna(0.0)
+    differs = current != original
+    cart = cart.drop(current.index[~differs], errors='ignore')
+    changed = current[differs]
+    if len(changed):
+        cart = changed.combine_first(cart)
+    cart.name = "Solicitado"
+    return cart
+
+def save_cart(conn, cart, requester_id):
+    # Aplica todo el carrito en una transacción: 1 SELECT + un lote por tipo de cambio.
+    # Devuelve cuántos productos se actualizaron.
+    with transaction(conn):
+        rows = fetchall(conn, PENDING_FOR_PRODUCTS, (Array(cart.index),))
+        existing = {row['product_id']: row['id'] for row in rows}
+
+        updates, inserts, deletes = [], [], []
+        for pid, new_qty in cart.items():
+            item_id = existing.get(pid)
+            if new_qty > 0:
+                if item_id is not None:
+                    updates.append((item_id, new_qty))
+                else:
+                    inserts.append((pid, requester_id, new_qty))
+            elif item_id is not None:
+                # Quantity 0 -> Delete
+                deletes.append(item_id)
+
+        if updates:
+            executemany(conn, UPDATE_PENDING, updates)
+        if inserts:
+            executemany(conn, INSERT_PENDING, inserts)
+        if deletes:
+            execute(conn, DELETE_PENDING, (Array(deletes),))
+    on_commit(conn, cache.bump, "shopping_list_items")
+    return len(cart)
+
+def render_requester_view(user):
+    st.header(f"📝 Solicitud de Productos - Hola {user['username']}")
+    
+    # --- MEMORIA (CARRITO) ---
+    cart = load_cart(st.session_state)
+
+    conn = get_connection()
+    
+    pending_count = len(cart)
+
+    # -- BARRA DE HERRAMIENTAS --
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        search_term = st.text_input("🔍 Buscar producto...")
+    with col2:
+        categories = ["Todas"] + [row['category'] for row in cache.cached_rows(conn, CATEGORIES, tables=("products",))]
+        category_filter = st.selectbox("Categoría", categories)
+    with col3:
+        # Botón inteligente
+        btn_label = "💾 Guardar"
+        if pending_count > 0:
+            btn_label = f"💾 Guardar ({pending_count})"
+            st.warning(f"Tienes {pending_count} cambios sin guardar.")
+            
+        save_clicked = st.button(btn_label, type="primary", use_container_width=True)
+
+    # 1. Cargar datos de la BD (búsqueda y categoría se filtran en SQL)
+    category = None if category_filter == "Todas" else category_filter
+    df_db = None
+    if search_term.strip():
+        df_db = search_products(conn, search_term, category)
+    if df_db is None:
+        df_db = cache.cached_frame(conn, CATALOG, (category, category),
+                                   tables=("products", "shopping_list_items"))
+    with span("pandas"):
+        df_db = df_db.set_index('id')
+        df_db['Solicitado'] = pd.to_numeric(df_db['Solicitado'], errors='coerce').fillna(0.0)
+    if search_term.strip() and len(df_db) >= SEARCH_LIMIT:
+        st.caption(f"Mostrando los {SEARCH_LIMIT} resultados más relevantes. Afina la búsqueda para ver otros.")
+
+    # 2. Aplicar cambios de la Memoria sobre la vista
+    with span("pandas"):
+        filtered = apply_cart(df_db, cart)
+
+    # -- TABLA --
+    with span("render"):
+        edited_df = st.data_editor(
+            filtered,
+            column_config={
+                "Producto": st.column_config.TextColumn("Producto", disabled=True),
+                "Categoría": None, # Oculto para ahorrar espacio en móvil
+                "Unidad": st.column_config.TextColumn("Unidad", disabled=True, width="small"),
+                "Solicitado": st.column_config.NumberColumn(
+                    "Cantidad",
+                    min_value=0.0,
+                    step=0.5,
+                    format="%.1f"
+                )
+            },
+            use_container_width=True,
+            hide_index=True,
+            disabled=["Producto", "Categoría", "Unidad"],
+            key="requester_editor"
+        )
+
+    # -- DETECTAR CAMBIOS --
+    # Si la tabla editada es diferente a lo que mostramos, actualizamos la memoria
+    if not edited_df.equals(filtered):
+        cart = diff_cart(df_db, edited_df, cart)
+        st.session_state['cart_updates'] = cart
+        # Nota: Necesitas interactuar otra vez para que se actualice el contador visual,
+        # (Limitación de Streamlit), pero los datos SÍ se están guardando en memoria.
+
+    # -- GUARDAR EN BD --
+    if save_clicked:
+        if cart.empty:
+            st.info("No hay cambios para guardar.")
+        else:
+            try:
+                changes_count = submit_write(save_cart, cart, user['id'])
+                st.success(f"✅ Se guardaron {changes_count} actualizaciones correctamente.")
+                
+                # Vaciar carrito
+                st.session_state['cart_updates'] = empty_cart()
+                st.rerun()
+                
+            except Exception as e:
+                st.error(f"Error al guardar: {e}")
+
+    conn.close()
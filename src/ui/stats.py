@@ -1,80 +1,112 @@
-import streamlit as st
-import pandas as pd
-import plotly.express as px
-from db import get_connection
-
-def render_stats_view(user):
-    st.header("📊 Historial y Estadísticas")
-    
-    conn = get_connection()
-    
-    # 1. Total Gastado por Mes
-    # 2. Top Productos más comprados
-    # 3. Listado histórico detalle
-    
-    # Fetch Data
-    df = pd.read_sql('''
-        SELECT 
-            s.id, 
-            p.name as "Producto", 
-            p.category as "Categoría",
-            s.shopping_date as "Fecha", 
-            s.price_real as "Precio",
-            s.quantity_approved as "Cantidad"
-        FROM shopping_list_items s
-        JOIN products p ON s.product_id = p.id
-        WHERE s.status = 'Comprado'
-        ORDER BY s.shopping_date DESC
-    ''', conn)
-    
-    if df.empty:
-        st.info("Aún no hay compras registradas para mostrar estadísticas.")
-        conn.close()
-        return
-
-    # Convert Date
-    df['Fecha'] = pd.to_datetime(df['Fecha'])
-    df['Mes'] = df['Fecha'].dt.strftime('%Y-%m')
-    df['Total'] = df['Precio'] * df['Cantidad'] # Assuming price is unit price? 
-    # Usually real_price inputs total or unit? Buyer UI asks "Precio Real", implies Unit or Total?
-    # In buyer.py: "update product last price". Usually implies Unit Price.
-    # Let's assume Unit Price for calculation.
-    
-    # KPI Cards
-    total_spent = (df['Precio']).sum() # If price stored is total per line?
-    # Rereading buyer.py: `price_real` input. Usually people input the total they see on receipt for that item line? 
-    # Or unit price? 
-    # Let's assume `price_real` is the TOTAL paid for that line item (since qty is fixed approved).
-    # Wait, if I buy 3 milks and put 30 soles, implies 30 total.
-    # Let's verify logic in buyer.py if I have access... 
-    # Assuming `price_real` is TOTAL AMOUNT PAID for the item line.
-    
-    st.markdown("### Resumen Global")
-    c1, c2, c3 = st.columns(3)
-    c1.metric("Gasto Total Histórico", f"S/ {df['Precio'].sum():.2f}")
-    c2.metric("Items Comprados", len(df))
-    c3.metric("Ticket Promedio", f"S/ {df['Precio'].mean():.2f}")
-    
-    st.divider()
-    
-    col_chart1, col_chart2 = st.columns(2)
-    
-    # Chart 1: Gasto por Categoría
-    with col_chart1:
-        st.subheader("Gasto por Categoría")
-        fig_cat = px.pie(df, values='Precio', names='Categoría', hole=0.4)
-        st.plotly_chart(fig_cat, use_container_width=True)
-        
-    # Chart 2: Gasto por Mes
-    with col_chart2:
-        st.subheader("Evolución de Gasto")
-        monthly_spend = df.groupby('Mes')['Precio'].sum().reset_index()
-        fig_line = px.bar(monthly_spend, x='Mes', y='Precio', title="Gasto Mensual")
-        st.plotly_chart(fig_line, use_container_width=True)
-        
-    st.divider()
-    st.subheader("Detalle de Compras")
-    st.dataframe(df[['Fecha', 'Producto', 'Categoría', 'Cantidad', 'Precio']], use_container_width=True)
-    
-    conn.close()
-
+import streamlit as st
+import pandas as pd
+from profiler import span
+from datetime import timedelta
+from db import get_connection
+from cache import cached_frame
+from history import fetch_page, PAGE_SIZE
+from rollups import SPEND_MONTHLY
+
+def _history_browser(conn, categories):
+    # Una página a la vez; los filtros y el orden se resuelven en SQL (history.py)
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        dates = st.date_input("Rango de fechas", value=(), key="history_dates")
+    with col2:
+        category = st.selectbox("Categoría", ["Todas"] + categories, key="history_category")
+    with col3:
+        product = st.text_input("Producto", key="history_product")
+
+    start = dates[0].isoformat() if len(dates) >= 1 else None
+    end = (dates[1] + timedelta(days=1)).isoformat() if len(dates) == 2 else None
+    filters = (start, end, None if category == "Todas" else category, product.strip() or None)
+
+    # Pila con el cursor de inicio de cada página visitada; se reinicia al cambiar filtros
+    if st.session_state.get('history_filters') != filters:
+        st.session_state['history_filters'] = filters
+        st.session_state['history_cursors'] = [None]
+    cursors = st.session_state['history_cursors']
+
+    page, next_cursor = fetch_page(conn, cursors[-1], *filters)
+    if page.empty:
+        st.info("No hay compras con esos filtros.")
+        return
+    page['Fecha'] = pd.to_datetime(page['Fecha'], format='mixed')
+    with span("render"):
+        st.dataframe(page[['Fecha', 'Producto', 'Categoría', 'Cantidad', 'Precio']],
+                     use_container_width=True, hide_index=True)
+
+    prev_col, info_col, next_col = st.columns([1, 2, 1])
+    with prev_col:
+        if st.button("⬅️ Anterior", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with info_col:
+        st.caption(f"Página {len(cursors)} ({PAGE_SIZE} compras por página)")
+    with next_col:
+        if st.button("Siguiente ➡️", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+
+def render_stats_view(user):
+    st.header("📊 Historial y Estadísticas")
+    
+    conn = get_connection()
+    
+    # 1. Total Gastado por Mes
+    # 2. Top Productos más comprados
+    # 3. Listado histórico detalle
+    
+    # KPIs y gráficos salen del resumen mes x categoría (rollups.py), no del historial
+    spend = cached_frame(conn, SPEND_MONTHLY, tables=("spend_monthly",))
+    
+    if spend.empty:
+        st.info("Aún no hay compras registradas para mostrar estadísticas.")
+        conn.close()
+        return
+
+    spend['Categoría'] = spend['Categoría'].replace('', 'Sin categoría')
+    # KPI Cards
+    total_spent = spend['Total'].sum()
+    
+    st.markdown("### Resumen Global")
+    c1, c2, c3 = st.columns(3)
+    total_items = int(spend['Items'].sum())
+    # Promedio sobre los items con precio (los que no tienen precio no cuentan como 0)
+    priced_items = int(spend['Con precio'].sum())
+    c1.metric("Gasto Total Histórico", f"S/ {total_spent:.2f}")
+    c2.metric("Items Comprados", total_items)
+    c3.metric("Ticket Promedio", f"S/ {total_spent / priced_items if priced_items else 0:.2f}")
+    
+    st.divider()
+    
+    # plotly es pesado: se importa solo cuando hay gráficos que dibujar
+    import plotly.express as px
+
+    col_chart1, col_chart2 = st.columns(2)
+    
+    # Chart 1: Gasto por Categoría
+    with col_chart1:
+        st.subheader("Gasto por Categoría")
+        with span("pandas"):
+            by_category = spend.groupby('Categoría')['Total'].sum().reset_index()
+        with span("render"):
+            fig_cat = px.pie(by_category, values='Total', names='Categoría', hole=0.4)
+            st.plotly_chart(fig_cat, use_container_width=True)
+        
+    # Chart 2: Gasto por Mes
+    with col_chart2:
+        st.subheader("Evolución de Gasto")
+        with span("pandas"):
+            monthly_spend = spend.groupby('Mes')['Total'].sum().reset_index()
+        with span("render"):
+            fig_line = px.bar(monthly_spend, x='Mes', y='Total', title="Gasto Mensual")
+            st.plotly_chart(fig_line, use_container_width=True)
+        
+    st.divider()
+    st.subheader("Detalle de Compras")
+    categories = sorted(c for c in spend['Categoría'].unique() if c != 'Sin categoría')
+    _history_browser(conn, categories)
+    
+    conn.close()
+
@@ -0,0 +1,78 @@
+import importlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+# Vistas por modo. El módulo de cada vista (y lo pesado que importa, p.ej. plotly)
+# se carga solo cuando algún usuario entra a ese modo.
+VIEWS = {
+    "Solicitar": ("ui.requester", "render_requester_view"),
+    "Aprobar": ("ui.admin", "render_admin_view"),
+    "Comprar": ("ui.buyer", "render_buyer_view"),
+    "Historial": ("ui.stats", "render_stats_view"),
+}
+
+# Presupuesto de arranque en frío por vista (segundos, import de la vista en un proceso nuevo)
+COLD_START_BUDGET = 2.5
+
+_lock = threading.Lock()
+_import_times = {}  # módulo -> segundos del primer import en este proceso
+
+def timed_import(module_name):
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    with _lock:
+        _import_times.setdefault(module_name, time.perf_counter() - start)
+    return module
+
+def get_view(mode):
+    module_name, func_name = VIEWS[mode]
+    return getattr(timed_import(module_name), func_name)
+
+def import_report():
+    # [(módulo, segundos)] de las vistas cargadas en este proceso, más lento primero
+    with _lock:
+        return sorted(_import_times.items(), key=lambda item: item[1], reverse=True)
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def measure_cold_import(module_name, top=10):
+    # Importa el módulo en un intérprete nuevo con -X importtime.
+    # Devuelve (segundos totales, [(módulo, segundos acumulados)] de sus dependencias más caras)
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                          cwd=src_dir, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    total = 0
+    top_level = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if indent <= 1:  # import directo desde el -c
+            total += cumulative
+            top_level.append((name, cumulative / 1e6))
+        elif indent <= 3:  # dependencias de primer nivel del módulo
+            top_level.append((name, cumulative / 1e6))
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    return total / 1e6, top_level[:top]
+
+if __name__ == "__main__":
+    # python src/views.py  -> tiempo de import en frío por vista y control del presupuesto
+    over_budget = False
+    for mode, (module_name, _) in VIEWS.items():
+        total, slowest = measure_cold_import(module_name)
+        flag = "OK" if total <= COLD_START_BUDGET else "EXCEDE PRESUPUESTO"
+        over_budget = over_budget or total > COLD_START_BUDGET
+        print(f"{mode:10} {module_name:15} {total:6.3f}s  [{flag}]")
+        for name, seconds in slowest:
+            print(f"    {seconds:6.3f}s  {name}")
+    sys.exit(1 if over_budget else 0)
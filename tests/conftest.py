@@ -0,0 +1,56 @@
+import os
+import sys
+import threading
+import pytest
+
+# Los módulos de la app se importan entre sí por nombre (from db import ...), como al
+# correr "streamlit run src/main.py"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import cache
+import db
+import outbox
+import profiler
+import querylog
+from migrations import migrate
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    # Base SQLite vacía en un directorio temporal (modo local, sin st.secrets)
+    monkeypatch.setattr(db, "is_cloud_db", lambda: False)
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "shopping_app.db"))
+    # Conexiones por hilo nuevas: también el hilo escritor abre la base temporal
+    monkeypatch.setattr(db, "_sqlite_local", threading.local())
+    # Cola local aparte y sin el hilo que la vacía: las pruebas llaman a flush()
+    monkeypatch.setattr(outbox, "OUTBOX_PATH", str(tmp_path / "outbox.db"))
+    monkeypatch.setattr(outbox, "start_flusher", lambda: None)
+    # Métricas y log de consultas lentas tampoco se escriben en data/
+    monkeypatch.setattr(profiler, "METRICS_PATH", str(tmp_path / "metrics.prom"))
+    monkeypatch.setattr(querylog, "SLOW_LOG_PATH", str(tmp_path / "slow_queries.jsonl"))
+    cache.clear()
+    conn = db.get_connection()
+    yield conn
+    conn.close()
+    cache.clear()
+
+@pytest.fixture
+def app_db(sqlite_db):
+    # Base con el esquema actual
+    migrate(sqlite_db, log=lambda msg: None)
+    return sqlite_db
+
+def add_product(conn, name, category=None, price=0.0):
+    cur = conn.execute("INSERT INTO products (name, category, last_price_estimate) VALUES (?, ?, ?)",
+                       (name, category, price))
+    conn.commit()
+    return cur.lastrowid
+
+def add_item(conn, product_id, status="Aprobado", price=None, shopping_date=None, quantity=1.0,
+             table="shopping_list_items", item_id=None):
+    cur = conn.execute(f'''
+        INSERT INTO {table} (id, product_id, requester_id, quantity_requested, quantity_approved,
+                             status, price_real, shopping_date)
+        VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+    ''', (item_id, product_id, quantity, quantity, status, price, shopping_date))
+    conn.commit()
+    return cur.lastrowid
@@ -0,0 +1,16 @@
+from conftest import add_item, add_product
+from db import submit_write
+from ui.admin import apply_review
+
+def test_review_counts_only_rows_still_pending(app_db):
+    conn = app_db
+    product = add_product(conn, "Leche", "Lácteos")
+    first, second, third, fourth = (add_item(conn, product, status="Pendiente") for _ in range(4))
+    # Otra sesión ya revisó dos de ellos
+    conn.execute("UPDATE shopping_list_items SET status = 'Aprobado' WHERE id IN (?, ?)", (second, fourth))
+    conn.commit()
+
+    assert submit_write(apply_review, [(first, 2.0), (second, 3.0)], [third, fourth]) == (1, 1)
+    rows = dict(conn.execute("SELECT id, quantity_approved FROM shopping_list_items WHERE status = 'Aprobado'").fetchall())
+    assert rows == {first: 2.0, second: 1.0, fourth: 1.0}
+    assert submit_write(apply_review, [], []) == (0, 0)
@@ -0,0 +1,26 @@
+import archive
+from conftest import add_item, add_product
+from statements import SQLITE
+
+def test_closed_items_query_uses_the_date_indexes(app_db):
+    sql = archive.CLOSED_ITEMS.compile(SQLITE)
+    plan = " | ".join(row[3] for row in app_db.execute("EXPLAIN QUERY PLAN " + sql, ("2024-01-01", "2024-01-01", 10)))
+    assert "ix_items_status_date" in plan
+    assert "ix_items_status_created" in plan
+    assert "SCAN shopping_list_items" not in plan
+
+def test_archive_moves_old_closed_items(app_db):
+    conn = app_db
+    product = add_product(conn, "Pan", "Panadería")
+    old_bought = add_item(conn, product, status="Comprado", price=1.0, shopping_date="2020-01-01 10:00:00")
+    recent_bought = add_item(conn, product, status="Comprado", price=1.0, shopping_date="2999-01-01 10:00:00")
+    old_rejected = add_item(conn, product, status="Rechazado")
+    conn.execute("UPDATE shopping_list_items SET created_at = '2020-01-01 10:00:00' WHERE id = ?", (old_rejected,))
+    conn.commit()
+    open_item = add_item(conn, product, status="Pendiente")
+
+    assert archive.archive_closed_items(days=30, batch_size=1, log=lambda msg: None) == 2
+    live = [row[0] for row in conn.execute("SELECT id FROM shopping_list_items ORDER BY id")]
+    archived = [row[0] for row in conn.execute("SELECT id FROM shopping_list_history ORDER BY id")]
+    assert live == [recent_bought, open_item]
+    assert archived == [old_bought, old_rejected]
@@ -0,0 +1,31 @@
+import history
+from conftest import add_item, add_product
+
+def test_keyset_pages_do_not_overlap(app_db):
+    conn = app_db
+    milk = add_product(conn, "Leche", "Lácteos")
+    bread = add_product(conn, "Pan", "Panadería")
+    expected = []
+    # Varias compras con la misma fecha (el id desempata) y algunas ya archivadas
+    for i in range(23):
+        date = f"2024-0{1 + i % 3}-1{i % 2} 09:00:00"
+        table = "shopping_list_history" if i < 6 else "shopping_list_items"
+        item = add_item(conn, milk if i % 2 else bread, status="Comprado", price=1.0 + i,
+                        shopping_date=date, table=table, item_id=1000 + i)
+        expected.append((date, item))
+    add_item(conn, milk)    # sin comprar: no sale en el historial
+    expected.sort(reverse=True)
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = history.fetch_page(conn, cursor, page_size=5)
+        assert len(page) <= 5
+        seen += list(zip(page['Fecha'], page['id']))
+        if cursor is None:
+            break
+    assert seen == expected
+
+    page, cursor = history.fetch_page(conn, category="Lácteos", start="2024-02-01")
+    assert cursor is None
+    assert list(page['id']) == [item for date, item in expected if date >= "2024-02-01" and item % 2]
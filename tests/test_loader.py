@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+import jobs
+import loader
+import startup
+
+@pytest.fixture
+def local_sheet(app_db, tmp_path, monkeypatch):
+    # Importación desde un Excel local (sin Google Sheets); la base ya está migrada
+    monkeypatch.setattr(startup, "ensure_initialized", lambda force=False: False)
+    monkeypatch.setattr(loader, "SHEET_URL", "")
+    path = tmp_path / "catalogo.xlsx"
+    monkeypatch.setattr(loader, "EXCEL_PATH", str(path))
+    return path
+
+def test_sheet_without_name_column_fails_the_job(local_sheet):
+    pd.DataFrame({"Código": ["A1", "A2"], "Precio": [1.0, 2.0]}).to_excel(local_sheet, index=False)
+    job = jobs.Job("catalogo-prueba", lambda job: loader.load_products_from_excel(log=job.log))
+    job._run()
+    info = job.snapshot()
+    assert info["status"] == jobs.FAILED
+    assert info["error"] == "falta la columna 'name'"
+
+def _sheet(rows):
+    return loader.normalize_columns(pd.DataFrame(rows, columns=["Producto", "Categoría", "Unidad"]))
+
+def _products(conn):
+    rows = conn.execute("SELECT name, category, active FROM products ORDER BY name").fetchall()
+    return {name: (category, active) for name, category, active in rows}
+
+def test_incremental_sync(app_db):
+    conn = app_db
+    first = loader.sync_products([_sheet([("Leche", "Lácteos", "Litro"), ("Pan", "Panadería", "Unidad")]),
+                                  _sheet([("Arroz", "Abarrotes", "Kg")])])
+    assert first == {'rows': 3, 'inserted': 3, 'updated': 0, 'unchanged': 0, 'deactivated': 0}
+
+    # Si la huella (row_hash) no cambia, la fila no se reescribe: este cambio hecho a mano sigue ahí
+    conn.execute("UPDATE products SET category = 'Editada a mano' WHERE name = 'Leche'")
+    conn.commit()
+
+    second = loader.sync_products([_sheet([("Leche", "Lácteos", "Litro"), ("Pan", "Panes", "Unidad")]),
+                                   _sheet([("Azúcar", "Abarrotes", "Kg")])])
+    assert second == {'rows': 3, 'inserted': 1, 'updated': 1, 'unchanged': 1, 'deactivated': 1}
+    assert _products(conn) == {
+        "Arroz": ("Abarrotes", 0),
+        "Azúcar": ("Abarrotes", 1),
+        "Leche": ("Editada a mano", 1),
+        "Pan": ("Panes", 1),
+    }
+
+    # Vuelve a la hoja sin cambios: se reactiva (cuenta como actualizado)
+    third = loader.sync_products([_sheet([("Leche", "Lácteos", "Litro"), ("Pan", "Panes", "Unidad"),
+                                          ("Azúcar", "Abarrotes", "Kg"), ("Arroz", "Abarrotes", "Kg")])])
+    assert third == {'rows': 4, 'inserted': 0, 'updated': 1, 'unchanged': 3, 'deactivated': 0}
+    assert all(active == 1 for category, active in _products(conn).values())
@@ -0,0 +1,36 @@
+import sqlite3
+import pytest
+from conftest import add_item
+from migrations import (CREATE_PRODUCTS, CREATE_SHOPPING_LIST_ITEMS, CREATE_USERS, SCHEMA_VERSION,
+                        current_version, migrate)
+from statements import execute
+
+def test_upgrade_baseline_with_duplicate_products(sqlite_db):
+    # Base como la creaba init_db antes de las migraciones: sin schema_version ni clave
+    # única en products(name), con el mismo producto cargado dos veces
+    conn = sqlite_db
+    for stmt in (CREATE_USERS, CREATE_PRODUCTS, CREATE_SHOPPING_LIST_ITEMS):
+        execute(conn, stmt)
+    conn.executemany("INSERT INTO products (id, name, category, last_price_estimate) VALUES (?, ?, ?, ?)",
+                     [(1, "Leche", "Lácteos", 6.5), (2, "Pan", "Panadería", 0.5), (3, "Leche", "Lácteos", 7.0)])
+    conn.commit()
+    old = add_item(conn, 3, status="Comprado", price=7.0, shopping_date="2024-05-02 10:00:00")
+    kept = add_item(conn, 1)
+
+    assert migrate(conn, log=lambda msg: None) == list(range(1, SCHEMA_VERSION + 1))
+    assert current_version(conn) == SCHEMA_VERSION
+
+    assert [tuple(row) for row in conn.execute("SELECT id, name FROM products ORDER BY id")] == [(1, "Leche"), (2, "Pan")]
+    items = dict(conn.execute("SELECT id, product_id FROM shopping_list_items").fetchall())
+    assert items == {old: 1, kept: 1}
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO products (name) VALUES ('Leche')")
+    conn.rollback()
+
+    # La compra anterior a las migraciones ya está en el resumen de gasto
+    spend = conn.execute("SELECT month, category, total, items, priced_items FROM spend_monthly").fetchall()
+    assert [tuple(row) for row in spend] == [("2024-05", "Lácteos", 7.0, 1, 1)]
+
+def test_migrate_is_idempotent(app_db):
+    assert migrate(app_db, log=lambda msg: None) == []
+    assert current_version(app_db) == SCHEMA_VERSION
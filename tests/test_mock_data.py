@@ -0,0 +1,31 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import mock_data
+
+NOW = datetime(2025, 6, 30, 12, 0, 0)
+
+def test_generate_zero_items(app_db):
+    info = mock_data.generate(products=10, items=0, seed=1, now=NOW, log=lambda msg: None)
+    assert info["items"] == 0
+    assert app_db.execute("SELECT COUNT(*) FROM shopping_list_items").fetchone()[0] == 0
+    assert app_db.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 10
+
+def test_generate_small_run(app_db):
+    mock_data.generate(products=20, items=300, seed=2, batch=100, now=NOW, log=lambda msg: None)
+    conn = app_db
+    assert conn.execute("SELECT COUNT(*) FROM shopping_list_items").fetchone()[0] == 300
+    bought = conn.execute("SELECT COUNT(*) FROM shopping_list_items WHERE status = 'Comprado' "
+                          "AND shopping_date <= '2025-06-30 12:00:00'").fetchone()[0]
+    assert conn.execute("SELECT SUM(items) FROM spend_monthly").fetchone()[0] == bought > 0
+
+def test_items_without_purchases():
+    # Un solo item que no salió comprado: no hay fechas de compra que formatear
+    products = pd.DataFrame({"id": [1], "category": ["Frutas"], "price": [5.0]})
+    for seed in range(50):
+        frame = mock_data.mock_items(1, products, [1], np.random.default_rng(seed), now=NOW)
+        if frame["status"][0] != "Comprado":
+            break
+    assert frame["status"][0] != "Comprado"
+    assert frame["shopping_date"].isna().all()
+    assert mock_data.mock_items(0, products, [1], np.random.default_rng(0), now=NOW).empty
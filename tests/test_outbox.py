@@ -0,0 +1,48 @@
+import outbox
+from conftest import add_item, add_product
+
+def _status(conn, item_id):
+    return conn.execute("SELECT status FROM shopping_list_items WHERE id = ?", (item_id,)).fetchone()[0]
+
+def test_same_key_is_applied_once(app_db):
+    conn = app_db
+    product = add_product(conn, "Leche", "Lácteos", 6.0)
+    item = add_item(conn, product)
+    checkout = ([[item, 6.5, 1.0]], [[product, 6.5]], [])
+
+    # Encolar dos veces con la misma clave (p.ej. doble clic) deja una sola operación
+    outbox.enqueue("checkout", *checkout, key="compra-1")
+    outbox.enqueue("checkout", *checkout, key="compra-1")
+    assert len(outbox.pending()) == 1
+
+    before = dict(outbox._stats)
+    assert outbox.flush() == 1
+    assert outbox.pending() == []
+    assert _status(conn, item) == "Comprado"
+    assert outbox._stats["applied"] == before["applied"] + 1
+
+    # La misma operación otra vez (reintento tras perder la confirmación): no se repite
+    conn.execute("UPDATE shopping_list_items SET status = 'Aprobado' WHERE id = ?", (item,))
+    conn.commit()
+    outbox.enqueue("checkout", *checkout, key="compra-1")
+    assert outbox.flush() == 1
+    assert outbox._stats["duplicates"] == before["duplicates"] + 1
+    assert _status(conn, item) == "Aprobado"
+    assert conn.execute("SELECT COUNT(*) FROM applied_operations WHERE key = 'compra-1'").fetchone()[0] == 1
+    assert conn.execute("SELECT SUM(items) FROM spend_monthly").fetchone()[0] == 1
+
+def test_failed_operation_does_not_block_the_queue(app_db):
+    conn = app_db
+    product = add_product(conn, "Pan", "Panadería", 0.5)
+    item = add_item(conn, product)
+    # Payload inválido: error propio de la operación, no de la conexión
+    outbox.enqueue("checkout", [[item]], [], [], key="mala")
+    outbox.enqueue("checkout", [[item, 0.6, 2.0]], [[product, 0.6]], [], key="buena")
+
+    assert outbox.flush() == 1
+    assert _status(conn, item) == "Comprado"
+    assert [op['key'] for op in outbox.failed()] == ["mala"]
+    assert outbox.pending() == []
+
+    outbox.discard_failed(["mala"])
+    assert outbox.failed() == []
@@ -0,0 +1,25 @@
+import time
+import profiler
+from conftest import add_product
+from db import submit_write
+from statements import define, execute
+
+SLOW_UPDATE = define("test.slow_update", '''
+    UPDATE products SET last_price_estimate = (
+        SELECT COUNT(*) FROM (WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 200000)
+                              SELECT i FROM n)
+    ) WHERE id = ?
+''')
+
+def _slow_write(conn, product_id):
+    execute(conn, SLOW_UPDATE, (product_id,)).close()
+
+def test_writer_sql_counts_in_the_rerun(app_db):
+    product = add_product(app_db, "Leche", "Lácteos", 6.0)
+    profiler.start_run()
+    start = time.perf_counter()
+    submit_write(_slow_write, product)
+    elapsed = time.perf_counter() - start
+    total, phases = profiler.finish_run("Solicitar", "Prueba")
+    # La escritura corrió en el hilo escritor, pero su SQL es parte de esta recarga
+    assert phases["sql"] > 0.5 * elapsed
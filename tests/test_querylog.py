@@ -0,0 +1,18 @@
+import querylog
+from conftest import add_product
+from db import submit_write
+from statements import define, execute
+
+SET_PRICE = define("test.set_price", "UPDATE products SET last_price_estimate = ? WHERE id = ?")
+
+def _set_price(conn, product_id, price):
+    execute(conn, SET_PRICE, (price, product_id)).close()
+
+def test_writer_statements_are_attributed_to_the_calling_view(app_db):
+    product = add_product(app_db, "Leche", "Lácteos", 6.0)
+    querylog.reset()
+    with querylog.view_context("Comprar"):
+        submit_write(_set_price, product, 6.5)
+    stats = {row["sql"]: row for row in querylog.query_stats()}
+    assert stats[querylog.normalize(SET_PRICE.sql)]["views"] == "Comprar (1)"
+    assert querylog.view_stats()["Comprar"]["count"] == 1
@@ -0,0 +1,37 @@
+import pytest
+import rollups
+from conftest import add_item, add_product
+from db import submit_write
+from ui.buyer import commit_purchase
+
+def _spend(conn):
+    rows = conn.execute("SELECT month, category, total, items, priced_items FROM spend_monthly "
+                        "ORDER BY month, category").fetchall()
+    return [tuple(row) for row in rows]
+
+def test_incremental_spend_matches_rebuild(app_db):
+    conn = app_db
+    milk = add_product(conn, "Leche", "Lácteos", 6.0)
+    bread = add_product(conn, "Pan", "Panadería", 0.5)
+    loose = add_product(conn, "Bolsas")     # sin categoría
+    add_item(conn, milk, status="Comprado", price=6.0, shopping_date="2024-01-05 10:00:00")
+    add_item(conn, bread, status="Comprado", price=None, shopping_date="2024-02-05 10:00:00")
+    add_item(conn, loose, status="Comprado", price=1.5, shopping_date="2024-02-06 10:00:00",
+             table="shopping_list_history", item_id=500)
+    rollups.rebuild(conn)
+
+    items = [add_item(conn, product) for product in (milk, milk, bread, loose, bread)]
+    assert submit_write(commit_purchase, [(items[0], 6.5, 1.0), (items[2], 0.6, 2.0)],
+                        [(milk, 6.5), (bread, 0.6)], [items[1]]) == 3
+    # El primero ya está comprado: no se vuelve a sumar
+    assert submit_write(commit_purchase, [(items[0], 7.0, 1.0), (items[3], 0.0, 1.0), (items[4], 0.7, 1.0)],
+                        [(milk, 7.0), (loose, 0.0), (bread, 0.7)], []) == 2
+    assert conn.execute("SELECT last_price_estimate FROM products WHERE id = ?", (milk,)).fetchone()[0] == 6.5
+
+    incremental = _spend(conn)
+    rollups.rebuild(conn)
+    rebuilt = _spend(conn)
+    assert [row[:2] + row[3:] for row in incremental] == [row[:2] + row[3:] for row in rebuilt]
+    assert [row[2] for row in incremental] == pytest.approx([row[2] for row in rebuilt])
+    assert sum(row[3] for row in rebuilt) == 7
+    assert sum(row[4] for row in rebuilt) == 6
@@ -0,0 +1,32 @@
+from statements import POSTGRES, SQLITE, define
+
+def test_sqlite_sql_is_unchanged():
+    stmt = define("test.sqlite_plain", "SELECT * FROM products WHERE name LIKE '%' || ? || '%'")
+    assert stmt.compile(SQLITE) == "SELECT * FROM products WHERE name LIKE '%' || ? || '%'"
+
+def test_placeholders_become_pyformat():
+    stmt = define("test.placeholders", "UPDATE products SET last_price_estimate = ? WHERE id = ?")
+    assert stmt.compile(POSTGRES) == "UPDATE products SET last_price_estimate = %s WHERE id = %s"
+
+def test_percent_is_doubled_everywhere():
+    # psycopg2 interpreta '%' también dentro de los literales
+    stmt = define("test.percent", "SELECT strftime('%Y-%m', d), 100 % 7 FROM t WHERE n LIKE '%' || ? || '%'")
+    assert stmt.compile(POSTGRES) == "SELECT strftime('%%Y-%%m', d), 100 %% 7 FROM t WHERE n LIKE '%%' || %s || '%%'"
+
+def test_question_marks_inside_literals_and_identifiers_are_kept():
+    stmt = define("test.literals", '''SELECT '¿algo?' as "¿Qué?", 'it''s ?' FROM t WHERE id = ?''')
+    assert stmt.compile(POSTGRES) == '''SELECT '¿algo?' as "¿Qué?", 'it''s ?' FROM t WHERE id = %s'''
+
+def test_postgres_rewrites_and_overrides():
+    stmt = define("test.rewrites", "UPDATE t SET d = datetime('now') WHERE id = ?")
+    assert stmt.compile(POSTGRES) == "UPDATE t SET d = NOW() WHERE id = %s"
+    stmt = define("test.override", "SELECT 1 WHERE ? IN (SELECT value FROM json_each(?))",
+                  postgres="SELECT 1 WHERE ? = ANY(?)")
+    assert stmt.compile(POSTGRES) == "SELECT 1 WHERE %s = ANY(%s)"
+    assert stmt.compile(SQLITE) == "SELECT 1 WHERE ? IN (SELECT value FROM json_each(?))"
+
+def test_batch_values_group():
+    stmt = define("test.batch", "INSERT INTO t (a, b, c) VALUES (?, ?, COALESCE(?, 0)) ON CONFLICT (a) DO NOTHING")
+    assert stmt.compile_batch(POSTGRES) == ("INSERT INTO t (a, b, c) VALUES %s ON CONFLICT (a) DO NOTHING",
+                                            "(%s, %s, COALESCE(%s, 0))")
+    assert stmt.compile_batch(SQLITE) == (stmt.compile(SQLITE), None)